@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models.functions import Lower
 
 # Create your models here.
 
@@ -25,5 +26,15 @@ class User(AbstractUser):
     )
     address = models.CharField(max_length=255, blank=False)
 
+    class Meta(AbstractUser.Meta):
+        # Case-insensitive prefix search of the admin client picker
+        # (appointments.lookups); phone_number already has its unique index.
+        indexes = [
+            models.Index(Lower("username"), name="user_username_lower_idx"),
+            models.Index(Lower("first_name"), name="user_first_name_lower_idx"),
+            models.Index(Lower("last_name"), name="user_last_name_lower_idx"),
+            models.Index(Lower("email"), name="user_email_lower_idx"),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
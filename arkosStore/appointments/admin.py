@@ -1,9 +1,12 @@
 from django.contrib import admin
 
-from .models import Appointment, Availability, Service
+from .models import Appointment, AppointmentSeries, Availability, NotificationOutbox, Service, WorkerDayOccupancy
 
 # Register your models here.
 
 admin.site.register(Appointment)
+admin.site.register(AppointmentSeries)
 admin.site.register(Availability)
+admin.site.register(NotificationOutbox)
 admin.site.register(Service)
+admin.site.register(WorkerDayOccupancy)
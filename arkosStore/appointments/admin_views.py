@@ -1,10 +1,12 @@
 from django import forms
 from django.contrib.auth.decorators import user_passes_test
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
 
 from accounts.models import User
 from workers.models import Worker
+from .lookups import LOOKUPS, MAX_QUERY_LENGTH
 from .models import Availability
 
 
@@ -70,3 +72,23 @@ def admin_manage_availability(request):
         "form": form,
     }
     return render(request, "appointments/admin_manage_availability.html", context)
+
+
+@user_passes_test(is_admin)
+def admin_lookup(request, kind):
+    """
+    Búsqueda por prefijo para los selectores del panel (clientes, servicios y
+    especialistas). Devuelve una página de resultados y el cursor "next" para
+    pedir la siguiente con ?after=.
+    """
+    search = LOOKUPS.get(kind)
+    if search is None:
+        raise Http404
+    q = request.GET.get("q", "").strip()[:MAX_QUERY_LENGTH]
+    try:
+        after = int(request.GET.get("after") or 0)
+    except ValueError:
+        return JsonResponse({"error": "Cursor no válido"}, status=400)
+
+    results, next_after = search(q, after)
+    return JsonResponse({"results": results, "next": next_after})
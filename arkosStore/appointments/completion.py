@@ -0,0 +1,48 @@
+"""
+Completion of past appointments.
+
+complete_past_appointments moves every active (PENDIENTE or CONFIRMADA)
+appointment that has ended to COMPLETADA with set-based UPDATEs of at most
+batch_size rows, each in its own short transaction, so rows are never locked
+for long. QuerySet.update sends no signals, so the slot cache and occupancy
+of the touched worker-days are refreshed by hand (appointments_changed).
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ACTIVE_STATUSES, Appointment, StatusChoices
+from .signals import appointments_changed
+
+BATCH_SIZE = 500
+
+
+def past_active(now):
+    """
+    Active appointments already over at now, through appt_active_end_idx.
+    """
+    return Appointment.objects.filter(status__in=ACTIVE_STATUSES, end_datetime__lt=now)
+
+
+def complete_past_appointments(batch_size=BATCH_SIZE, now=None):
+    """
+    Marks the ended active appointments as completed. Returns how many.
+    """
+    now = now or timezone.now()
+    completed = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                past_active(now).order_by("end_datetime").only("id", "worker_id", "datetime", "end_datetime")[:batch_size]
+            )
+            if not batch:
+                return completed
+
+            # The status is checked again: a row cancelled meanwhile is left alone.
+            updated = past_active(now).filter(pk__in=[appointment.pk for appointment in batch]).update(
+                status=StatusChoices.COMPLETED, updated_at=timezone.now()
+            )
+            appointments_changed(batch)
+        completed += updated
+        if len(batch) < batch_size:
+            return completed
@@ -0,0 +1,205 @@
+"""
+Live appointment events for open admin dashboards (Server-Sent Events).
+
+Model signals describe each committed change as a small event (type, id,
+worker and the local dates it touches) and hand it to the configured
+backend (settings.DASHBOARD_EVENTS_BACKEND, a dotted path like SMS_BACKEND).
+The backend feeds the in-process Hub, which fans the events out to every
+connected stream (home.views.admin_events_stream).
+
+- LocalBackend publishes straight to the hub: enough with a single process.
+- DatabasePollingBackend is for several processes: each one polls
+  Appointment.updated_at and AppointmentTombstone (the same change log as
+  the dashboard delta sync) while it has subscribers, so a change made in
+  any process reaches the dashboards connected to all of them.
+
+Every subscriber has a bounded queue. A subscriber that falls behind loses
+its queued events and gets a single "resync" event instead, so a slow
+client costs at most queue_size events of memory; the dashboard answers a
+resync with a delta sync.
+"""
+
+import asyncio
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Appointment, AppointmentTombstone, StatusChoices
+
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """
+    One connected stream. Lives on the event loop it was created on.
+    """
+
+    def __init__(self, maxsize):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        # Runs on self.loop.
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Hub:
+    """
+    In-process broadcast of events to subscriptions. publish may be called
+    from any thread (sync views run in worker threads under ASGI).
+    """
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, maxsize=None):
+        subscription = Subscription(maxsize or getattr(settings, "DASHBOARD_EVENTS_QUEUE_SIZE", 100))
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Its loop is closed: the stream is gone.
+                self.unsubscribe(subscription)
+
+
+hub = Hub()
+
+
+class BaseEventBackend:
+    def publish(self, event):
+        """
+        Called after commit with every local event.
+        """
+        raise NotImplementedError
+
+    def start(self):
+        """
+        Called from each stream, on the running event loop, before it subscribes.
+        """
+
+
+class LocalBackend(BaseEventBackend):
+    def publish(self, event):
+        hub.publish(event)
+
+
+class DatabasePollingBackend(BaseEventBackend):
+    """
+    Turns the database change log into events, once per process and only
+    while the process has subscribers.
+    """
+
+    def __init__(self):
+        self.task = None
+
+    def publish(self, event):
+        # Every process, this one included, picks the change up from the database.
+        pass
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.poll())
+
+    async def poll(self):
+        interval = getattr(settings, "DASHBOARD_EVENTS_POLL_SECONDS", 2)
+        since = timezone.now()
+        while len(hub):
+            await asyncio.sleep(interval)
+            now = timezone.now()
+            async for appointment in Appointment.objects.filter(updated_at__gte=since).only(
+                "id", "worker_id", "datetime", "status"
+            ):
+                hub.publish(appointment_event(appointment, "updated"))
+            async for tombstone in AppointmentTombstone.objects.filter(deleted_at__gte=since):
+                hub.publish(
+                    {
+                        "type": "deleted",
+                        "id": tombstone.appointment_id,
+                        "worker_id": tombstone.worker_id,
+                        "dates": [timezone.localtime(tombstone.datetime).date().isoformat()],
+                    }
+                )
+            # The overlap catches rows committed late; repeats are harmless.
+            since = now - timedelta(seconds=interval)
+
+
+_backends = {}
+
+
+def get_backend():
+    path = getattr(settings, "DASHBOARD_EVENTS_BACKEND", "appointments.events.LocalBackend")
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def appointment_event(appointment, event_type):
+    dates = {timezone.localtime(appointment.datetime).date().isoformat()}
+    loaded = getattr(appointment, "_loaded_values", None)
+    if loaded and loaded.get("datetime"):
+        dates.add(timezone.localtime(loaded["datetime"]).date().isoformat())
+    return {
+        "type": event_type,
+        "id": appointment.pk,
+        "worker_id": appointment.worker_id,
+        "status": appointment.status,
+        "dates": sorted(dates),
+    }
+
+
+def publish(event):
+    """
+    Publishes the event once the current transaction commits.
+    """
+    backend = get_backend()
+    transaction.on_commit(lambda: backend.publish(event))
+
+
+def publish_saved(appointment, created):
+    if created:
+        event_type = "created"
+    elif appointment.status == StatusChoices.CANCELLED:
+        event_type = "cancelled"
+    else:
+        event_type = "updated"
+    publish(appointment_event(appointment, event_type))
+
+
+def publish_deleted(appointment):
+    publish(appointment_event(appointment, "deleted"))
+
+
+def publish_days_changed(days):
+    """
+    One event per worker-day for changes written in bulk.
+    """
+    for worker_id, day in days:
+        publish({"type": "changed", "worker_id": worker_id, "dates": [day.isoformat()]})
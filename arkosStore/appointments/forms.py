@@ -3,13 +3,41 @@ from datetime import datetime, timedelta
 from django import forms
 
 from accounts.models import User
-from .models import Appointment, Service, StatusChoices
+from .models import ACTIVE_STATUSES, BOOKING_WINDOW_DAYS, Appointment, AppointmentSeries, Service, StatusChoices
 from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
 from django.utils import timezone
 
 from workers.models import Worker
 
-from .models import Appointment, StatusChoices
+from .scheduling import SLOT_TAKEN_MESSAGE, find_conflicts, has_conflict, series_conflict_message
+from .slots import unavailable_starts
+
+
+class LookupSelect(forms.Select):
+    """
+    Select for a ModelChoiceField that renders only the selected option. The
+    others are fetched on demand from the admin lookup endpoint given in
+    data-lookup-url, so rendering does not load the whole queryset.
+    """
+
+    def __init__(self, kind, attrs=None):
+        attrs = {**(attrs or {}), "data-lookup-url": reverse_lazy("admin_lookup", args=[kind])}
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        iterator = self.choices
+        selected = [v for v in value if v]
+        choices = []
+        if iterator.field.empty_label is not None:
+            choices.append(("", iterator.field.empty_label))
+        if selected:
+            choices += [iterator.choice(obj) for obj in iterator.queryset.filter(pk__in=selected)]
+        self.choices = choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = iterator
 
 
 class AppointmentForm(forms.ModelForm):
@@ -38,6 +66,7 @@ class AppointmentForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop("user", None)
+        self.hold = kwargs.pop("hold", None)
         super().__init__(*args, **kwargs)
 
     def clean(self):
@@ -67,10 +96,10 @@ class AppointmentForm(forms.ModelForm):
             if combined_datetime < timezone.now():
                 raise ValidationError("No puedes reservar en el pasado.")
 
-            max_future_datetime = timezone.now() + timedelta(days=30)
+            max_future_datetime = timezone.now() + timedelta(days=BOOKING_WINDOW_DAYS)
             if combined_datetime > max_future_datetime:
                 raise ValidationError(
-                    "Las reservas solo están permitidas con un máximo de 30 días de antelación."
+                    f"Las reservas solo están permitidas con un máximo de {BOOKING_WINDOW_DAYS} días de antelación."
                 )
 
             cleaned_data["datetime_actual"] = combined_datetime
@@ -80,23 +109,11 @@ class AppointmentForm(forms.ModelForm):
 
             end_time = combined_datetime + timedelta(minutes=service.duration)
 
-            overlapping_candidates = Appointment.objects.filter(
-                datetime__lt=end_time,
-                datetime__date=combined_datetime.date(),
-                status__in=[StatusChoices.PENDING, StatusChoices.CONFIRMED],
-                worker_id=worker_id,
-            ).select_related("service")
+            # A hold taken from the slot list already went through the conflict check.
+            is_held = self.hold is not None and self.hold.covers(worker_id, service.id, combined_datetime)
 
-            is_overlapping = False
-            for existing_app in overlapping_candidates:
-                if existing_app.calculated_end_time > combined_datetime:
-                    is_overlapping = True
-                    break
-
-            if is_overlapping:
-                raise ValidationError(
-                    "Esta franja horaria ya está reservada o se solapa con otra cita existente."
-                )
+            if not is_held and has_conflict(worker_id, combined_datetime, end_time):
+                raise ValidationError(SLOT_TAKEN_MESSAGE)
 
         return cleaned_data
     
@@ -110,19 +127,19 @@ class AdminAppointmentForm(forms.ModelForm):
         queryset=User.objects.filter(role='REG'),
         label="Cliente",
         required=False,
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=LookupSelect('clients', attrs={'class': 'form-control'})
     )
     
     service = forms.ModelChoiceField(
         queryset=Service.objects.all(),
         label="Servicio",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=LookupSelect('services', attrs={'class': 'form-control'})
     )
     
     worker = forms.ModelChoiceField(
         queryset=Worker.objects.all(),
         label="Especialista",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=LookupSelect('workers', attrs={'class': 'form-control'})
     )
     
     date = forms.DateField(
@@ -151,9 +168,100 @@ class AdminAppointmentForm(forms.ModelForm):
                 cleaned_data['datetime_actual'] = combined_datetime
             except Exception as e:
                 self.add_error('time', "Hora inválida")
-        
+            else:
+                self._check_conflicts(cleaned_data, combined_datetime)
+
+        return cleaned_data
+
+    def _check_conflicts(self, cleaned_data, start):
+        """
+        Same overlap rule as the public booking form. The appointment being
+        modified does not conflict with itself.
+        """
+        service = cleaned_data.get('service')
+        worker = cleaned_data.get('worker')
+        if not service or not worker or self.instance.status not in ACTIVE_STATUSES:
+            return
+
+        end = start + timedelta(minutes=service.duration)
+        if has_conflict(worker.id, start, end, exclude_id=self.instance.pk):
+            raise ValidationError(SLOT_TAKEN_MESSAGE)
+
+class AppointmentSeriesForm(forms.ModelForm):
+    date = forms.DateField(
+        label="Fecha de la primera cita",
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    time = forms.TimeField(
+        label="Hora",
+        widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'})
+    )
+
+    class Meta:
+        model = AppointmentSeries
+        fields = ['service', 'worker', 'occurrences', 'interval_weeks', 'booking_window_days']
+        widgets = {
+            'service': forms.Select(attrs={'class': 'form-control'}),
+            'worker': forms.Select(attrs={'class': 'form-control'}),
+            'occurrences': forms.NumberInput(attrs={'class': 'form-control'}),
+            'interval_weeks': forms.NumberInput(attrs={'class': 'form-control'}),
+            'booking_window_days': forms.NumberInput(attrs={'class': 'form-control'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        # Only admins can widen the booking window of a series.
+        if not self.user or getattr(self.user, 'role', None) != User.Role.ADMIN:
+            del self.fields['booking_window_days']
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        date = cleaned_data.get('date')
+        time_data = cleaned_data.get('time')
+        service = cleaned_data.get('service')
+        worker = cleaned_data.get('worker')
+        occurrences = cleaned_data.get('occurrences')
+        interval_weeks = cleaned_data.get('interval_weeks')
+
+        if not (date and time_data and service and worker and occurrences and interval_weeks):
+            return cleaned_data
+
+        first = timezone.make_aware(datetime.combine(date, time_data))
+        if first < timezone.now():
+            raise ValidationError("No puedes reservar en el pasado.")
+
+        self.instance.first_datetime = first
+        self.instance.occurrences = occurrences
+        self.instance.interval_weeks = interval_weeks
+        starts = self.instance.datetimes()
+
+        window = cleaned_data.get('booking_window_days') or self.instance.booking_window_days
+        if starts[-1] > timezone.now() + timedelta(days=window):
+            raise ValidationError(
+                f"La última cita de la serie supera el máximo de {window} días de antelación."
+            )
+
+        if not worker.specialties.filter(name=service.name).exists():
+            raise ValidationError("El especialista seleccionado no ofrece este servicio.")
+
+        duration = timedelta(minutes=service.duration)
+        conflicts = find_conflicts(worker.id, [(start, start + duration) for start in starts])
+        if conflicts:
+            raise ValidationError(series_conflict_message(conflicts))
+
+        # Every occurrence must be a slot the calendar would offer on its own.
+        unavailable = unavailable_starts(service, worker.id, starts)
+        if unavailable:
+            dates = ", ".join(timezone.localtime(start).strftime("%d/%m/%Y %H:%M") for start in unavailable)
+            raise ValidationError(
+                f"Las siguientes citas de la serie quedan fuera del horario disponible del especialista: {dates}."
+            )
+
         return cleaned_data
 
+
 class ServiceForm(forms.ModelForm):
     class Meta:
         model = Service
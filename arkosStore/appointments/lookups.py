@@ -0,0 +1,122 @@
+"""
+Typeahead lookups for the admin dashboard pickers (client, service, worker).
+
+Searches are case-insensitive prefix matches written as a range on the
+lowercased column, lower(col) >= q AND lower(col) < successor(q), so they
+use the Lower() expression indexes on every backend (a LIKE would not).
+Results are ordered by primary key and paginated by keyset: the client
+sends back the last id it received (after) instead of an offset.
+"""
+
+import sys
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from accounts.models import User
+from workers.models import TypeChoices, Worker
+
+from .models import Service
+
+PAGE_SIZE = 20
+MAX_QUERY_LENGTH = 100
+
+
+def prefix_range(q):
+    """
+    Returns (low, high) such that a string starts with q exactly when
+    low <= string < high. high is None when there is no upper bound (q made
+    only of the last code point, U+10FFFF).
+    """
+    stem = q.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return q, None
+    return q, stem[:-1] + chr(ord(stem[-1]) + 1)
+
+
+def prefix_filter(fields, q, lowercase=True):
+    """
+    Q matching rows where any of fields (annotations, see search) starts with q.
+    """
+    low, high = prefix_range(q.lower() if lowercase else q)
+    condition = Q()
+    for field in fields:
+        bounds = {f"{field}__gte": low}
+        if high is not None:
+            bounds[f"{field}__lt"] = high
+        condition |= Q(**bounds)
+    return condition
+
+
+def page_after_id(queryset, after=None, size=PAGE_SIZE):
+    """
+    Returns (rows, next_after) for the page following the id after.
+    next_after is None on the last page. A simpler cursor than
+    appointments.pagination.keyset_page, enough for lists ordered by id.
+    """
+    if after:
+        queryset = queryset.filter(pk__gt=after)
+    rows = list(queryset.order_by("pk")[: size + 1])
+    if len(rows) > size:
+        return rows[:size], rows[size - 1].pk
+    return rows, None
+
+
+def search_clients(q="", after=None, size=PAGE_SIZE):
+    queryset = User.objects.filter(role=User.Role.REGISTRADO).only(
+        "id", "first_name", "last_name", "username", "email", "phone_number"
+    )
+    if q:
+        queryset = queryset.annotate(
+            username_lower=Lower("username"),
+            first_name_lower=Lower("first_name"),
+            last_name_lower=Lower("last_name"),
+            email_lower=Lower("email"),
+        ).filter(
+            prefix_filter(["username_lower", "first_name_lower", "last_name_lower", "email_lower"], q)
+            | prefix_filter(["phone_number"], q, lowercase=False)
+        )
+    rows, next_after = page_after_id(queryset, after, size)
+    results = [
+        {
+            "id": user.id,
+            "label": f"{user.first_name} {user.last_name}".strip() or user.username,
+            "detail": " · ".join(value for value in (user.email, user.phone_number) if value),
+        }
+        for user in rows
+    ]
+    return results, next_after
+
+
+def search_services(q="", after=None, size=PAGE_SIZE):
+    queryset = Service.objects.all()
+    if q:
+        # Services are searched by the label of their type (a handful of
+        # choices), matched here rather than in the database.
+        q = q.lower()
+        names = [
+            value
+            for value, label in TypeChoices.choices
+            if any(word.startswith(q) for word in [label.lower(), *label.lower().split()])
+        ]
+        queryset = queryset.filter(name__in=names)
+    rows, next_after = page_after_id(queryset, after, size)
+    results = [
+        {"id": service.id, "label": f"{service.get_name_display()} ({service.duration} minutos)"} for service in rows
+    ]
+    return results, next_after
+
+
+def search_workers(q="", after=None, size=PAGE_SIZE):
+    queryset = Worker.objects.only("id", "name")
+    if q:
+        queryset = queryset.annotate(name_lower=Lower("name")).filter(prefix_filter(["name_lower"], q))
+    rows, next_after = page_after_id(queryset, after, size)
+    return [{"id": worker.id, "label": worker.name} for worker in rows], next_after
+
+
+LOOKUPS = {
+    "clients": search_clients,
+    "services": search_services,
+    "workers": search_workers,
+}
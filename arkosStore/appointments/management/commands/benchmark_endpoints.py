@@ -0,0 +1,70 @@
+import asyncio
+from datetime import timedelta
+from timeit import default_timer
+
+import aiohttp
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments.models import Service
+
+ENDPOINTS = {
+    "sync": "/appointments/api/get-available-slots/",
+    "async": "/appointments/api/async/get-available-slots/",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures requests/sec of the sync and async slot endpoints against a "
+        "running server, firing the concurrent requests the booking calendar "
+        "makes. Start the server first, e.g. under ASGI with "
+        "'uvicorn arkosStore.asgi:application --workers 2'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="URL base del servidor")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--service", type=int, help="Servicio a consultar (por defecto, el primero)")
+        parser.add_argument("--days", type=int, default=7, help="Días consultados en rotación, desde mañana")
+
+    def handle(self, *args, **options):
+        service_id = options["service"]
+        if service_id is None:
+            service_id = Service.objects.order_by("id").values_list("id", flat=True).first()
+        if service_id is None:
+            raise CommandError("No hay servicios en la base de datos.")
+
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        dates = [(tomorrow + timedelta(days=offset)).isoformat() for offset in range(options["days"])]
+
+        for name, path in ENDPOINTS.items():
+            urls = [
+                f"{options['url'].rstrip('/')}{path}?service_id={service_id}&date={dates[i % len(dates)]}"
+                for i in range(options["requests"])
+            ]
+            elapsed, errors = asyncio.run(self._run(urls, options["concurrency"]))
+            self.stdout.write(
+                f"{name:<6} {len(urls) / elapsed:8.1f} req/s  ({elapsed:.2f} s, {errors} errores)"
+            )
+
+    async def _run(self, urls, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        errors = 0
+
+        async def fetch(session, url):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    async with session.get(url) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+
+        async with aiohttp.ClientSession() as session:
+            started = default_timer()
+            await asyncio.gather(*(fetch(session, url) for url in urls))
+            return default_timer() - started, errors
@@ -0,0 +1,115 @@
+import random
+from datetime import datetime, time, timedelta
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from appointments.schedule_bitmap import DaySchedule, time_to_minute
+from appointments.slots import day_bounds, is_free, merge_intervals
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares, on synthetic in-memory data, the original nested-loop overlap "
+        "check against the bisect sweep and the DaySchedule bitmap."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=40)
+        parser.add_argument("--appointments", type=int, default=400, help="Citas en el día (todas las personas)")
+        parser.add_argument("--duration", type=int, default=30, help="Duración del servicio en minutos")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        day = timezone.localdate() + timedelta(days=1)
+        duration = options["duration"]
+        day_start, _ = day_bounds(day)
+
+        workers = [(worker_id, f"Worker {worker_id}") for worker_id in range(1, options["workers"] + 1)]
+        rules = {worker_id: [(time(9, 0), time(14, 0)), (time(15, 0), time(21, 0))] for worker_id, _ in workers}
+
+        # (worker_id, start, end) rows, on a 15 minute grid like real bookings.
+        rows = []
+        for _ in range(options["appointments"]):
+            worker_id = rng.choice(workers)[0]
+            start = day_start + timedelta(hours=9, minutes=15 * rng.randrange(44))
+            rows.append((worker_id, start, start + timedelta(minutes=rng.choice((30, 60)))))
+
+        now = timezone.localtime()
+        results = {}
+        for name, func in (
+            ("nested loops", self._nested_loops),
+            ("bisect sweep", self._bisect_sweep),
+            ("bitmap", self._bitmap),
+        ):
+            timings = []
+            for _ in range(options["repeat"]):
+                started = default_timer()
+                slots = func(day, duration, workers, rules, rows, now)
+                timings.append(default_timer() - started)
+            results[name] = slots
+            self.stdout.write(f"{name:<14} {min(timings) * 1000:9.2f} ms  ({len(slots)} huecos)")
+
+        schedule = DaySchedule.build(day, rules=rules[1], appointments=[(s, e) for w, s, e in rows if w == 1])
+        self.stdout.write(f"Agenda serializada por trabajador y día: {len(schedule.to_bytes())} bytes")
+
+        if len({len(slots) for slots in results.values()}) != 1:
+            self.stdout.write(self.style.WARNING("Los métodos no devuelven el mismo número de huecos."))
+
+    def _candidates(self, day, duration, rules):
+        delta = timedelta(minutes=duration)
+        for start_time, end_time in rules:
+            current = timezone.make_aware(datetime.combine(day, start_time))
+            end = timezone.make_aware(datetime.combine(day, end_time))
+            while current + delta <= end:
+                yield current, current + delta
+                current += delta
+
+    def _nested_loops(self, day, duration, workers, rules, rows, now):
+        """
+        What get_available_slots used to do: every slot against every appointment.
+        """
+        slots = []
+        for worker_id, _ in workers:
+            for start, end in self._candidates(day, duration, rules[worker_id]):
+                overlapping = False
+                for app_worker_id, app_start, app_end in rows:
+                    if app_worker_id == worker_id and start < app_end and app_start < end:
+                        overlapping = True
+                        break
+                if not overlapping:
+                    slots.append((worker_id, start))
+        return slots
+
+    def _bisect_sweep(self, day, duration, workers, rules, rows, now):
+        intervals = {}
+        for worker_id, start, end in rows:
+            intervals.setdefault(worker_id, []).append((start, end))
+        busy = {worker_id: merge_intervals(items) for worker_id, items in intervals.items()}
+
+        slots = []
+        for worker_id, _ in workers:
+            worker_busy = busy.get(worker_id, ([], []))
+            for start, end in self._candidates(day, duration, rules[worker_id]):
+                if is_free(worker_busy, start, end):
+                    slots.append((worker_id, start))
+        return slots
+
+    def _bitmap(self, day, duration, workers, rules, rows, now):
+        intervals = {}
+        for worker_id, start, end in rows:
+            intervals.setdefault(worker_id, []).append((start, end))
+
+        day_start, _ = day_bounds(day)
+        slots = []
+        for worker_id, _ in workers:
+            schedule = DaySchedule.build(day, rules=rules[worker_id], appointments=intervals.get(worker_id, ()))
+            for start_time, end_time in rules[worker_id]:
+                for minute in schedule.free_starts(
+                    duration, step=duration, start=time_to_minute(start_time), end=time_to_minute(end_time)
+                ):
+                    slots.append((worker_id, day_start + timedelta(minutes=minute)))
+        return slots
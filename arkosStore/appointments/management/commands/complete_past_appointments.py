@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.completion import BATCH_SIZE, complete_past_appointments
+from appointments.scheduling import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Marks as completed every pending or confirmed appointment that has "
+        "already ended, in small batches, and purges old appointment tombstones. "
+        "Meant to run periodically (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Citas actualizadas por transacción")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] <= 0:
+            raise CommandError("--batch-size debe ser mayor que 0.")
+
+        completed = complete_past_appointments(options["batch_size"])
+        purged = purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Citas completadas: {completed}. Registros de borrado purgados: {purged}."))
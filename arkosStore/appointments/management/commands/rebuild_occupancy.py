@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the WorkerDayOccupancy table from the appointments, e.g. after "
+        "loading data without signals or bulk changes made outside the ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="from_date", help="Reconstruir solo desde esta fecha (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        from_date = None
+        if options["from_date"]:
+            try:
+                from_date = datetime.strptime(options["from_date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError(f"Fecha no válida: {options['from_date']}")
+
+        written = rebuild_occupancy(from_date)
+        self.stdout.write(self.style.SUCCESS(f"Ocupación reconstruida: {written} días de trabajador."))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointments.outbox import Dispatcher, run_once
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers the queued booking emails and SMS (NotificationOutbox). "
+        "Several workers can run at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Mensajes reclamados por lote")
+        parser.add_argument("--concurrency", type=int, help="Envíos simultáneos como máximo")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Segundos de espera cuando no hay pendientes")
+        parser.add_argument("--once", action="store_true", help="Procesar todo lo pendiente (sin esperar a llenar lotes de email) y salir")
+
+    def handle(self, *args, **options):
+        total = 0
+        # One dispatcher for the whole run: its HTTP connections are reused.
+        with Dispatcher(options["concurrency"]) as dispatcher:
+            try:
+                while True:
+                    claimed = run_once(options["batch_size"], dispatcher, flush=options["once"])
+                    total += claimed
+                    if not claimed:
+                        if options["once"]:
+                            break
+                        time.sleep(options["sleep"])
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(f"Notificaciones procesadas: {total}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.reminders import CHUNK_SIZE, send_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Queues a reminder (email and SMS) for every active appointment starting "
+        "within the reminder window that has not been reminded yet. Safe to run "
+        "periodically (e.g. every 15 minutes from cron), even if runs overlap."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, help="Avisar de las citas que empiezan en las próximas N horas (por defecto REMINDER_HOURS_BEFORE)"
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Citas leídas por bloque")
+
+    def handle(self, *args, **options):
+        if options["hours"] is not None and options["hours"] <= 0:
+            raise CommandError("--hours debe ser mayor que 0.")
+
+        reminded = send_reminders(options["hours"], options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Recordatorios encolados: {reminded} citas."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:04
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_end_datetime(apps, schema_editor):
+    Appointment = apps.get_model("appointments", "Appointment")
+    Service = apps.get_model("appointments", "Service")
+
+    for service_id, duration in Service.objects.values_list("id", "duration"):
+        Appointment.objects.filter(service_id=service_id).update(
+            end_datetime=F("datetime") + timedelta(minutes=duration)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_alter_appointment_guest_phone'),
+        ('workers', '0002_worker_bio_worker_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='end_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_end_datetime, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['worker', 'datetime'], name='appt_worker_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['worker', 'status', 'datetime'], name='appt_worker_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['PENDIENTE', 'CONFIRMADA'])), fields=['worker', 'datetime', 'end_datetime'], name='appt_active_worker_range_idx'),
+        ),
+    ]
@@ -0,0 +1,134 @@
+from django.core.management.base import CommandError
+from django.db import DatabaseError, migrations, transaction
+
+# Same name as appointments.scheduling.OVERLAP_CONSTRAINT: it is how
+# book_appointment recognises the error raised by the database.
+CONSTRAINT = "appointments_appointment_no_overlap"
+ACTIVE = "('PENDIENTE', 'CONFIRMADA')"
+
+# Pairs of active appointments of the same worker that already overlap (the
+# old admin form allowed them); the constraint cannot be added over them.
+OVERLAPS = f"""
+    SELECT a.worker_id, a.id, a.datetime, b.id, b.datetime
+    FROM appointments_appointment a
+    JOIN appointments_appointment b ON b.worker_id = a.worker_id AND b.id > a.id
+    WHERE a.status IN {ACTIVE} AND b.status IN {ACTIVE}
+      AND a.datetime < b.end_datetime AND b.datetime < a.end_datetime
+    ORDER BY a.worker_id, a.datetime
+"""
+
+POSTGRES_EXTENSION = "CREATE EXTENSION IF NOT EXISTS btree_gist;"
+
+POSTGRES_FORWARD = [
+    f"""
+    ALTER TABLE appointments_appointment ADD CONSTRAINT {CONSTRAINT}
+    EXCLUDE USING gist (
+        worker_id WITH =,
+        tstzrange(datetime, end_datetime, '[)') WITH &&
+    ) WHERE (status IN {ACTIVE} AND end_datetime IS NOT NULL);
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    f"ALTER TABLE appointments_appointment DROP CONSTRAINT IF EXISTS {CONSTRAINT};",
+]
+
+_SQLITE_OVERLAP_CHECK = f"""
+    SELECT RAISE(ABORT, '{CONSTRAINT}')
+    WHERE EXISTS (
+        SELECT 1 FROM appointments_appointment
+        WHERE worker_id = NEW.worker_id
+          AND id IS NOT NEW.id
+          AND status IN {ACTIVE}
+          AND datetime < NEW.end_datetime
+          AND end_datetime > NEW.datetime
+    );
+"""
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE TRIGGER {CONSTRAINT}_insert
+    BEFORE INSERT ON appointments_appointment
+    WHEN NEW.status IN {ACTIVE} AND NEW.end_datetime IS NOT NULL
+    BEGIN {_SQLITE_OVERLAP_CHECK} END;
+    """,
+    f"""
+    CREATE TRIGGER {CONSTRAINT}_update
+    BEFORE UPDATE OF worker_id, datetime, end_datetime, status ON appointments_appointment
+    WHEN NEW.status IN {ACTIVE} AND NEW.end_datetime IS NOT NULL
+    BEGIN {_SQLITE_OVERLAP_CHECK} END;
+    """,
+]
+
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {CONSTRAINT}_insert;",
+    f"DROP TRIGGER IF EXISTS {CONSTRAINT}_update;",
+]
+
+
+def check_overlaps(connection):
+    """
+    Raises CommandError listing the overlapping active appointments, which
+    have to be moved or cancelled before the constraint can be added.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(OVERLAPS)
+        rows = cursor.fetchall()
+    if rows:
+        pairs = "\n".join(
+            f"  trabajador {worker_id}: cita {first_id} ({first_start}) y cita {second_id} ({second_start})"
+            for worker_id, first_id, first_start, second_id, second_start in rows
+        )
+        raise CommandError(
+            "Hay citas activas que se solapan; reprograma o cancela una de cada par "
+            f"y vuelve a ejecutar migrate:\n{pairs}"
+        )
+
+
+def create_btree_gist(schema_editor):
+    try:
+        # Savepoint, so that the error does not abort the migration's transaction.
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(POSTGRES_EXTENSION)
+    except DatabaseError as error:
+        raise CommandError(
+            "No se pudo crear la extensión btree_gist, necesaria para impedir citas "
+            "solapadas. Pide al administrador de la base de datos que ejecute "
+            f"'CREATE EXTENSION btree_gist;' y vuelve a ejecutar migrate. ({error})"
+        ) from error
+
+
+def forward(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ("postgresql", "sqlite"):
+        return
+    check_overlaps(connection)
+    if connection.vendor == "postgresql":
+        create_btree_gist(schema_editor)
+        statements = POSTGRES_FORWARD
+    else:
+        statements = SQLITE_FORWARD
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def backward(apps, schema_editor):
+    statements = {"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    Database-enforced non-overlap of active appointments per worker.
+    Other backends (MySQL) rely on the row lock taken by book_appointment.
+    Stops with the list of clashing appointments if some already overlap.
+    """
+
+    dependencies = [
+        ("appointments", "0005_appointment_end_datetime"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_no_overlap'),
+        ('workers', '0002_worker_bio_worker_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datetime', models.DateTimeField()),
+                ('end_datetime', models.DateTimeField()),
+                ('session_key', models.CharField(db_index=True, max_length=40)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='appointments.service')),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='workers.worker')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['worker', 'datetime'], name='hold_worker_start_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_slothold'),
+        ('workers', '0002_worker_bio_worker_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerDayOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked_minutes', models.PositiveIntegerField(default=0)),
+                ('open_minutes', models.PositiveIntegerField(default=0)),
+                ('longest_free', models.PositiveIntegerField(default=0)),
+                ('free_intervals', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='workers.worker')),
+            ],
+            options={
+                'verbose_name': 'Ocupación diaria',
+                'verbose_name_plural': 'Ocupación diaria',
+                'indexes': [models.Index(fields=['date', 'longest_free'], name='occupancy_date_free_idx')],
+                'constraints': [models.UniqueConstraint(fields=('worker', 'date'), name='occupancy_worker_date_uniq')],
+            },
+        ),
+    ]
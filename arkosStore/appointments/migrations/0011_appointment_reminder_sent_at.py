@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_notificationoutbox'),
+        ('workers', '0002_worker_bio_worker_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_sent_at__isnull', True), ('status__in', ['PENDIENTE', 'CONFIRMADA'])), fields=['datetime'], name='appt_reminder_due_idx'),
+        ),
+    ]
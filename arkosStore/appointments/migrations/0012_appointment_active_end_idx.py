@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_appointment_reminder_sent_at'),
+        ('workers', '0002_worker_bio_worker_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['PENDIENTE', 'CONFIRMADA'])), fields=['end_datetime'], name='appt_active_end_idx'),
+        ),
+    ]
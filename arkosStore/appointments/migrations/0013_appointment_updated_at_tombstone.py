@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:37
+
+import importlib
+
+from django.db import migrations, models
+
+# Adding a NOT NULL column makes SQLite rebuild appointments_appointment,
+# which drops the overlap triggers of 0006: they are created again.
+no_overlap = importlib.import_module("appointments.migrations.0006_appointment_no_overlap")
+
+
+def reinstall_sqlite_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in no_overlap.SQLITE_BACKWARD + no_overlap.SQLITE_FORWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_appointment_active_end_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.PositiveIntegerField()),
+                ('worker_id', models.PositiveIntegerField()),
+                ('datetime', models.DateTimeField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(reinstall_sqlite_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_appointment_updated_at_tombstone'),
+        ('workers', '0005_worker_card_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', 'status', 'datetime'], name='appt_user_status_start_idx'),
+        ),
+    ]
@@ -1,12 +1,18 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef
 from django.utils import timezone
 
 from accounts.models import User
 from workers.models import TypeChoices, Worker
 
+BOOKING_WINDOW_DAYS = 30
+# Default for recurring series: treatment plans run past the single-booking window.
+SERIES_BOOKING_WINDOW_DAYS = 90
+
 
 class StatusChoices(models.TextChoices):
     PENDING = "PENDIENTE", "Pendiente"
@@ -15,6 +21,16 @@ class StatusChoices(models.TextChoices):
     CANCELLED = "CANCELADA", "Cancelada"
 
 
+# Statuses that occupy the worker's agenda.
+ACTIVE_STATUSES = [StatusChoices.PENDING, StatusChoices.CONFIRMED]
+
+# Statuses counted as used time in the occupancy table.
+OCCUPYING_STATUSES = [*ACTIVE_STATUSES, StatusChoices.COMPLETED]
+
+# Clients may cancel online up to this many hours before the appointment.
+CANCELLATION_NOTICE_HOURS = 12
+
+
 class Service(models.Model):
     name = models.CharField(
         max_length=100, choices=TypeChoices.choices, verbose_name="Tipo de Servicio"
@@ -29,6 +45,60 @@ class Service(models.Model):
     def __str__(self):
         return f"{self.get_name_display()} ({self.duration} min)"
 
+    def overlapping_appointments(self):
+        """
+        Active appointments of this service that, lasting self.duration, would
+        run into the next active appointment of their worker.
+        """
+        if self.pk is None:
+            return Appointment.objects.none()
+        next_starts = Appointment.objects.filter(
+            worker=OuterRef("worker"),
+            status__in=ACTIVE_STATUSES,
+            datetime__gte=OuterRef("datetime"),
+            datetime__lt=OuterRef("datetime") + timedelta(minutes=self.duration),
+        ).exclude(pk=OuterRef("pk"))
+        return (
+            self.service_appointments.filter(status__in=ACTIVE_STATUSES)
+            .filter(Exists(next_starts))
+            .select_related("worker")
+            .order_by("datetime")
+        )
+
+    def check_duration(self):
+        """
+        Raises ValidationError if the new duration would make appointments of
+        this service overlap (rejected anyway by the no-overlap constraint).
+        """
+        overlapping = list(self.overlapping_appointments()[:6])
+        if overlapping:
+            dates = ", ".join(
+                f"{timezone.localtime(app.datetime).strftime('%d/%m/%Y %H:%M')} ({app.worker.name})"
+                for app in overlapping[:5]
+            )
+            more = " y otras" if len(overlapping) > 5 else ""
+            raise ValidationError(
+                {"duration": f"Con esta duración se solaparían estas citas con la siguiente del trabajador: {dates}{more}."}
+            )
+
+    def clean(self):
+        super().clean()
+        self.check_duration()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            # Keep the stored end of every appointment of this service in sync.
+            # Done first so post_save receivers already see the new ends.
+            if self.pk is not None:
+                self.check_duration()
+                self.service_appointments.exclude(
+                    end_datetime=F("datetime") + timedelta(minutes=self.duration)
+                ).update(
+                    end_datetime=F("datetime") + timedelta(minutes=self.duration),
+                    updated_at=timezone.now(),
+                )
+            super().save(*args, **kwargs)
+
 
 class Availability(models.Model):
     DAY_CHOICES = [
@@ -57,6 +127,61 @@ class Availability(models.Model):
         return f"{self.worker.name} - {self.get_day_of_week_display()}: {self.start_time} - {self.end_time}"
 
 
+class AppointmentSeries(models.Model):
+    """
+    Recurring booking: the same weekday and time every interval_weeks weeks.
+    Its appointments are created together by scheduling.book_series.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="appointment_series",
+        null=True,
+        blank=True,
+    )
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE, related_name="appointment_series")
+    service = models.ForeignKey(Service, on_delete=models.PROTECT, related_name="appointment_series")
+    first_datetime = models.DateTimeField(verbose_name="Primera cita")
+    occurrences = models.PositiveSmallIntegerField(
+        default=4,
+        validators=[MinValueValidator(2), MaxValueValidator(52)],
+        verbose_name="Número de citas",
+    )
+    interval_weeks = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(4)],
+        verbose_name="Cada (semanas)",
+    )
+    booking_window_days = models.PositiveIntegerField(
+        default=SERIES_BOOKING_WINDOW_DAYS,
+        validators=[MinValueValidator(1), MaxValueValidator(365)],
+        verbose_name="Antelación máxima (días)",
+        help_text="Máximo de días de antelación permitido para la última cita de la serie",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Serie de citas"
+        verbose_name_plural = "Series de citas"
+
+    def __str__(self):
+        return f"Serie de {self.occurrences} citas con {self.worker} desde {self.first_datetime.strftime('%Y-%m-%d %H:%M')}"
+
+    def datetimes(self):
+        """
+        Start of every occurrence. The local wall-clock time is kept across
+        daylight saving changes.
+        """
+        first = timezone.localtime(self.first_datetime)
+        return [
+            timezone.make_aware(
+                datetime.combine(first.date() + timedelta(weeks=self.interval_weeks * index), first.time())
+            )
+            for index in range(self.occurrences)
+        ]
+
+
 class Appointment(models.Model):
     user = models.ForeignKey(
         User,
@@ -76,10 +201,24 @@ class Appointment(models.Model):
         default=None,
     )
 
+    series = models.ForeignKey(
+        AppointmentSeries,
+        on_delete=models.SET_NULL,
+        related_name="appointments",
+        null=True,
+        blank=True,
+    )
+
     datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField(null=True, blank=True, editable=False)
     status = models.CharField(
         max_length=10, choices=StatusChoices.choices, default=StatusChoices.PENDING
     )
+    # Set by manage.py send_reminders when the reminder is queued.
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Read by the dashboard delta sync (home.dashboard). QuerySet.update()
+    # does not apply auto_now: bulk updates must set it themselves.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     phone_regex = RegexValidator(
         regex=r"^\+\d{1,5} \d{1,15}$",
@@ -100,6 +239,41 @@ class Appointment(models.Model):
         validators=[phone_regex],
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["worker", "datetime"], name="appt_worker_start_idx"),
+            models.Index(
+                fields=["worker", "status", "datetime"], name="appt_worker_status_start_idx"
+            ),
+            # A client's history and upcoming pages (keyset pagination on datetime).
+            models.Index(fields=["user", "status", "datetime"], name="appt_user_status_start_idx"),
+            # Partial index for the overlap checks (ignored where unsupported, e.g. MySQL).
+            models.Index(
+                fields=["worker", "datetime", "end_datetime"],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name="appt_active_worker_range_idx",
+            ),
+            # Ended active appointments, for manage.py complete_past_appointments.
+            models.Index(
+                fields=["end_datetime"],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name="appt_active_end_idx",
+            ),
+            # Upcoming active appointments still waiting for their reminder.
+            models.Index(
+                fields=["datetime"],
+                condition=models.Q(status__in=ACTIVE_STATUSES, reminder_sent_at__isnull=True),
+                name="appt_reminder_due_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so signal handlers can tell where a rescheduled appointment was.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         client_name = (
             self.user.username
@@ -108,20 +282,178 @@ class Appointment(models.Model):
         )
         return f"Cita de {client_name} con {self.worker} el {self.datetime.strftime('%Y-%m-%d %H:%M')}"
 
+    def save(self, *args, **kwargs):
+        self.end_datetime = self.datetime + timedelta(minutes=self.service.duration)
+
+        # A rescheduled appointment gets a new reminder.
+        previous = getattr(self, "_loaded_values", {}).get("datetime")
+        rescheduled = previous is not None and previous != self.datetime
+        if rescheduled:
+            self.reminder_sent_at = None
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"datetime", "service"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "end_datetime"}
+            if rescheduled:
+                kwargs["update_fields"].add("reminder_sent_at")
+
+        super().save(*args, **kwargs)
+
     @property
     def calculated_end_time(self):
         """
-        If the appointment has a service, returns the end time calculated by adding the service duration to the start time.
-        If no service is associated, returns None.
+        Returns the stored end time, or the start time plus the service duration
+        if it has not been stored yet.
         """
+        if self.end_datetime:
+            return self.end_datetime
         return self.datetime + timedelta(minutes=self.service.duration)
 
     @property
     def can_be_cancelled(self):
         """
-        Returns True if the appointment can be cancelled (i.e., if it's more than 12 hours away).
+        Returns True if the appointment can be cancelled (i.e., if it's more than
+        CANCELLATION_NOTICE_HOURS hours away).
         Returns False otherwise.
         """
-        limit = timezone.now() + timedelta(hours=12)
+        limit = timezone.now() + timedelta(hours=CANCELLATION_NOTICE_HOURS)
 
         return self.datetime > limit
+
+
+class AppointmentTombstone(models.Model):
+    """
+    Record of an appointment that left a day of the calendar (deleted, or
+    moved to another day; datetime is where it was), so the dashboard delta
+    sync can tell clients showing that day to drop it. Purged after
+    SCHEDULE_TOMBSTONE_DAYS.
+    """
+
+    appointment_id = models.PositiveIntegerField()
+    worker_id = models.PositiveIntegerField()
+    datetime = models.DateTimeField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Cita {self.appointment_id} eliminada el {self.deleted_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class SlotHold(models.Model):
+    """
+    Short-lived reservation of a slot while the client fills in the booking form.
+    """
+
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE, related_name="slot_holds")
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="slot_holds")
+    datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField()
+    session_key = models.CharField(max_length=40, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["worker", "datetime"], name="hold_worker_start_idx")]
+
+    def __str__(self):
+        return f"Reserva temporal de {self.worker} el {self.datetime.strftime('%Y-%m-%d %H:%M')}"
+
+    def covers(self, worker_id, service_id, start):
+        """
+        Returns True if the hold is still valid for this exact booking.
+        """
+        return (
+            self.expires_at > timezone.now()
+            and self.worker_id == worker_id
+            and self.service_id == service_id
+            and self.datetime == start
+        )
+
+
+class WorkerDayOccupancy(models.Model):
+    """
+    Materialized occupancy of one worker on one local day, maintained by
+    appointments.signals (see appointments.occupancy). Only worker-days with
+    appointments have a row; rebuild with manage.py rebuild_occupancy.
+    """
+
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE, related_name="occupancy")
+    date = models.DateField()
+    booked_minutes = models.PositiveIntegerField(default=0)
+    open_minutes = models.PositiveIntegerField(default=0)
+    # Longest run of free minutes inside the availability rules: no service
+    # longer than this fits, so the slot engine can skip the day.
+    longest_free = models.PositiveIntegerField(default=0)
+    # [[start_minute, end_minute], ...] free runs, minutes since local midnight.
+    free_intervals = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Ocupación diaria"
+        verbose_name_plural = "Ocupación diaria"
+        constraints = [
+            models.UniqueConstraint(fields=["worker", "date"], name="occupancy_worker_date_uniq"),
+        ]
+        indexes = [models.Index(fields=["date", "longest_free"], name="occupancy_date_free_idx")]
+
+    def __str__(self):
+        return f"{self.worker} el {self.date}: {self.booked_minutes}/{self.open_minutes} min"
+
+    @property
+    def utilisation(self):
+        """
+        Booked share of the available time, as a percentage (0 without availability).
+        """
+        if not self.open_minutes:
+            return 0
+        return min(100, round(self.booked_minutes * 100 / self.open_minutes))
+
+
+class NotificationOutbox(models.Model):
+    """
+    Email or SMS waiting to be delivered by manage.py run_notifications.
+    Rows are written in the same transaction as the booking that causes them,
+    so no message is lost or sent for a booking that was rolled back.
+    """
+
+    class Channel(models.TextChoices):
+        EMAIL = "EMAIL", "Email"
+        SMS = "SMS", "SMS"
+
+    class Status(models.TextChoices):
+        PENDING = "PENDIENTE", "Pendiente"
+        SENDING = "ENVIANDO", "Enviando"
+        SENT = "ENVIADO", "Enviado"
+        FAILED = "FALLIDO", "Fallido"
+
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.SET_NULL,
+        related_name="notifications",
+        null=True,
+        blank=True,
+    )
+    channel = models.CharField(max_length=5, choices=Channel.choices)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the row; an expired claim is picked up again.
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Notificación pendiente"
+        verbose_name_plural = "Notificaciones pendientes"
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_due_idx"),
+            models.Index(fields=["claimed_by"], name="outbox_claimed_by_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} a {self.recipient} ({self.get_status_display()})"
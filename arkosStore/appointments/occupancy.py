@@ -0,0 +1,146 @@
+"""
+Materialized per worker and day occupancy (WorkerDayOccupancy).
+
+Rows are recomputed from the database for the worker-days a change touches,
+never patched in place, so a refresh is always safe to repeat. Every refresh
+loads the availability rules and appointments of all the requested
+worker-days with one query each and writes the rows with a single upsert.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OCCUPYING_STATUSES, Appointment, WorkerDayOccupancy
+from .schedule_bitmap import DaySchedule
+from .slots import availability_rules, day_bounds
+
+# Days covered by one refresh batch, to bound the appointments held in memory.
+BATCH_DAYS = 31
+
+
+def _appointments_by_day(worker_ids, from_date, to_date):
+    """
+    Returns {(worker_id, date): [(start, end), ...]} with the occupying
+    appointments of the workers between from_date and to_date, inclusive.
+    """
+    start, _ = day_bounds(from_date)
+    _, end = day_bounds(to_date)
+    rows = Appointment.objects.filter(
+        worker_id__in=worker_ids,
+        status__in=OCCUPYING_STATUSES,
+        datetime__lt=end,
+        end_datetime__gt=start,
+    ).values_list("worker_id", "datetime", "end_datetime")
+
+    intervals = defaultdict(list)
+    for worker_id, app_start, app_end in rows:
+        day = timezone.localtime(app_start).date()
+        last_day = timezone.localtime(app_end).date()
+        while day <= last_day:
+            intervals[worker_id, day].append((app_start, app_end))
+            day += timedelta(days=1)
+    return intervals
+
+
+def _refresh_batch(pairs):
+    worker_ids = {worker_id for worker_id, _ in pairs}
+    days = sorted({day for _, day in pairs})
+    rules = availability_rules(worker_ids, {day.weekday() for day in days})
+    intervals = _appointments_by_day(worker_ids, days[0], days[-1])
+
+    rows = []
+    empty = []
+    for worker_id, day in pairs:
+        appointments = intervals.get((worker_id, day))
+        if not appointments:
+            empty.append((worker_id, day))
+            continue
+
+        schedule = DaySchedule.build(
+            day, rules=rules.get(day.weekday(), {}).get(worker_id, ()), appointments=appointments
+        )
+        free_runs = schedule.free_runs()
+        rows.append(
+            WorkerDayOccupancy(
+                worker_id=worker_id,
+                date=day,
+                booked_minutes=bin(schedule.busy).count("1"),
+                open_minutes=bin(schedule.open).count("1"),
+                longest_free=max((end - start for start, end in free_runs), default=0),
+                free_intervals=[list(run) for run in free_runs],
+            )
+        )
+
+    if rows:
+        WorkerDayOccupancy.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["worker", "date"],
+            update_fields=["booked_minutes", "open_minutes", "longest_free", "free_intervals", "updated_at"],
+        )
+    for worker_id, day in empty:
+        WorkerDayOccupancy.objects.filter(worker_id=worker_id, date=day).delete()
+    return len(rows)
+
+
+def refresh_occupancy(pairs):
+    """
+    Recomputes the rows of the given (worker_id, date) pairs. Worker-days left
+    without appointments lose their row. Returns the number of rows written.
+    """
+    by_date = sorted(set(pairs), key=lambda pair: pair[1])
+    written = 0
+    while by_date:
+        first_day = by_date[0][1]
+        batch = [pair for pair in by_date if (pair[1] - first_day).days < BATCH_DAYS]
+        by_date = by_date[len(batch):]
+        written += _refresh_batch(batch)
+    return written
+
+
+def refresh_worker(worker_id, from_date=None):
+    """
+    Recomputes the existing rows of a worker from from_date on (default today),
+    e.g. after a change of its availability rules.
+    """
+    from_date = from_date or timezone.localdate()
+    days = WorkerDayOccupancy.objects.filter(worker_id=worker_id, date__gte=from_date).values_list(
+        "date", flat=True
+    )
+    return refresh_occupancy((worker_id, day) for day in days)
+
+
+def occupied_worker_days(appointments):
+    """
+    Returns the distinct (worker_id, local date) pairs the appointments of a
+    queryset occupy (the start day and, past midnight, the end day).
+    """
+    rows = (
+        appointments.annotate(start_day=TruncDate("datetime"), end_day=TruncDate("end_datetime"))
+        .values_list("worker_id", "start_day", "end_day")
+        .distinct()
+    )
+    pairs = set()
+    for worker_id, start_day, end_day in rows:
+        pairs.add((worker_id, start_day))
+        if end_day is not None:
+            pairs.add((worker_id, end_day))
+    return pairs
+
+
+def rebuild_occupancy(from_date=None):
+    """
+    Rebuilds the table from scratch (from from_date on, if given).
+    Returns the number of rows written.
+    """
+    rows = WorkerDayOccupancy.objects.all()
+    appointments = Appointment.objects.filter(status__in=OCCUPYING_STATUSES)
+    if from_date is not None:
+        rows = rows.filter(date__gte=from_date)
+        appointments = appointments.filter(datetime__gte=day_bounds(from_date)[0])
+
+    rows.delete()
+    return refresh_occupancy(occupied_worker_days(appointments))
@@ -0,0 +1,271 @@
+"""
+Delivery of NotificationOutbox rows, run by manage.py run_notifications.
+
+Several workers can run at once. Each one claims a batch of due rows:
+
+- with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it
+  (PostgreSQL, MySQL 8): rows locked by another worker are skipped;
+- elsewhere (SQLite) with a conditional UPDATE that stamps the still-due rows
+  with a fresh token; the worker then reads back the rows it won.
+
+A claim is a lease: the rows of a worker that died become due again when it
+expires, so delivery is at-least-once. Messages are sent concurrently on an
+asyncio loop (Dispatcher, no database access there), SMS over one pooled
+aiohttp session and emails over one reused SMTP connection (EmailSender),
+and failures are retried with exponential backoff until
+NOTIFICATION_MAX_ATTEMPTS.
+"""
+
+import asyncio
+import logging
+import uuid
+from smtplib import SMTPServerDisconnected
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import NotificationOutbox
+from .sms import get_sms_backend
+
+logger = logging.getLogger(__name__)
+
+Status = NotificationOutbox.Status
+
+CLAIM_SECONDS = 5 * 60
+MAX_RETRY_DELAY = 60 * 60
+
+
+def _due(now):
+    return NotificationOutbox.objects.filter(
+        Q(status=Status.PENDING, next_attempt_at__lte=now)
+        | Q(status=Status.SENDING, claimed_until__lt=now)
+    )
+
+
+def _emails_ready(now):
+    """
+    Due emails are held back until EMAIL_BATCH_SIZE of them are waiting or the
+    oldest has waited EMAIL_FLUSH_INTERVAL seconds, so bursts (reminders,
+    series) go out together over one SMTP connection.
+    """
+    emails = _due(now).filter(channel=NotificationOutbox.Channel.EMAIL)
+    batch_size = getattr(settings, "EMAIL_BATCH_SIZE", 100)
+    flush_interval = getattr(settings, "EMAIL_FLUSH_INTERVAL", 10)
+    return (
+        emails.filter(next_attempt_at__lte=now - timedelta(seconds=flush_interval)).exists()
+        or emails[:batch_size].count() >= batch_size
+    )
+
+
+def claim_batch(size, flush=False):
+    """
+    Claims up to size due messages for this worker and returns them. With
+    flush, emails are claimed without waiting for a full batch.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    due = _due(now)
+    if not flush and not _emails_ready(now):
+        due = due.exclude(channel=NotificationOutbox.Channel.EMAIL)
+    claim = {
+        "status": Status.SENDING,
+        "claimed_by": token,
+        "claimed_until": now + timedelta(seconds=CLAIM_SECONDS),
+    }
+    oldest_first = ("next_attempt_at", "id")
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                due.select_for_update(skip_locked=True)
+                .order_by(*oldest_first)
+                .values_list("id", flat=True)[:size]
+            )
+            NotificationOutbox.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = list(due.order_by(*oldest_first).values_list("id", flat=True)[:size])
+        # Only rows that are still due get the token: when two workers race for
+        # a row, the first UPDATE wins and the second one matches nothing.
+        _due(now).filter(id__in=ids).update(**claim)
+
+    return list(NotificationOutbox.objects.filter(claimed_by=token, status=Status.SENDING).order_by("id"))
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait after the given number of failed attempts: base, 2 * base,
+    4 * base... capped at one hour.
+    """
+    base = getattr(settings, "NOTIFICATION_RETRY_BASE_SECONDS", 60)
+    return min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def _error_text(error):
+    return str(error) or error.__class__.__name__
+
+
+class EmailSender:
+    """
+    Sends emails over one connection of the configured email backend, opened on
+    first use and kept open across batches: a whole run costs one SMTP login
+    and TLS handshake. A connection dropped by the server is reopened and the
+    message retried once.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.opened = 0
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def send(self, messages):
+        """
+        Sends the messages in order and returns None or the error text of each.
+        """
+        return [self._send_one(message) for message in messages]
+
+    def _send_one(self, message):
+        for retry in (False, True):
+            try:
+                if self.connection is None:
+                    self.connection = get_connection(fail_silently=False)
+                    self.connection.open()
+                    self.opened += 1
+                self.connection.send_messages(
+                    [EmailMessage(message.subject, message.body, settings.EMAIL_HOST_USER, [message.recipient])]
+                )
+                return None
+            except SMTPServerDisconnected as error:
+                self.close()
+                if retry:
+                    return _error_text(error)
+            except Exception as error:
+                return _error_text(error)
+
+
+class Dispatcher:
+    """
+    Sends messages concurrently on one asyncio event loop, with at most
+    concurrency in flight. The SMS backend (and so its pooled HTTP session)
+    is opened on first use and kept for the life of the dispatcher, which is
+    the life of the worker process for run_notifications.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or getattr(settings, "NOTIFICATION_CONCURRENCY", 4)
+        self.loop = asyncio.new_event_loop()
+        self.sms_backend = None
+        self.email_sender = EmailSender()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.sms_backend is not None:
+            self.loop.run_until_complete(self.sms_backend.close())
+            self.sms_backend = None
+        self.email_sender.close()
+        self.loop.close()
+
+    def send(self, messages):
+        """
+        Sends the messages and returns, in order, None or the error text of each.
+        """
+        return self.loop.run_until_complete(self._send(messages))
+
+    async def _send(self, messages):
+        if self.sms_backend is None and any(m.channel == NotificationOutbox.Channel.SMS for m in messages):
+            self.sms_backend = get_sms_backend(concurrency=self.concurrency)
+            await self.sms_backend.open()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = [None] * len(messages)
+
+        async def send_sms(index, message):
+            async with semaphore:
+                try:
+                    await self.sms_backend.send(message.recipient, message.body)
+                except Exception as error:
+                    errors[index] = _error_text(error)
+
+        async def send_emails(indexed):
+            # Django's mail API is blocking: it runs off the loop, one chunk at
+            # a time over the same connection, while the SMS go out.
+            batch_size = getattr(settings, "EMAIL_BATCH_SIZE", 100)
+            for offset in range(0, len(indexed), batch_size):
+                chunk = indexed[offset : offset + batch_size]
+                results = await asyncio.to_thread(self.email_sender.send, [message for _, message in chunk])
+                for (index, _), error in zip(chunk, results):
+                    errors[index] = error
+
+        emails = [(i, m) for i, m in enumerate(messages) if m.channel == NotificationOutbox.Channel.EMAIL]
+        await asyncio.gather(
+            send_emails(emails),
+            *(send_sms(i, m) for i, m in enumerate(messages) if m.channel == NotificationOutbox.Channel.SMS),
+        )
+        return errors
+
+
+def send_batch(messages, dispatcher):
+    """
+    Sends claimed messages and records the outcome. Returns the number sent.
+    """
+    if not messages:
+        return 0
+    return _record(messages, dispatcher.send(messages))
+
+
+def _record(messages, errors):
+    now = timezone.now()
+    max_attempts = getattr(settings, "NOTIFICATION_MAX_ATTEMPTS", 5)
+    released = {"claimed_by": "", "claimed_until": None}
+
+    # Rows are only updated while the claim is still ours (one token per batch).
+    sent = [message for message, error in zip(messages, errors) if error is None]
+    if sent:
+        NotificationOutbox.objects.filter(
+            pk__in=[message.pk for message in sent], claimed_by=messages[0].claimed_by
+        ).update(status=Status.SENT, sent_at=now, attempts=F("attempts") + 1, last_error="", **released)
+
+    for message, error in zip(messages, errors):
+        if error is None:
+            continue
+        attempts = message.attempts + 1
+        if attempts >= max_attempts:
+            status, next_attempt_at = Status.FAILED, message.next_attempt_at
+            logger.error("Notificación %s descartada tras %s intentos: %s", message.pk, attempts, error)
+        else:
+            status, next_attempt_at = Status.PENDING, now + timedelta(seconds=retry_delay(attempts))
+            logger.warning("Notificación %s falló (intento %s): %s", message.pk, attempts, error)
+        NotificationOutbox.objects.filter(pk=message.pk, claimed_by=message.claimed_by).update(
+            status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=error, **released
+        )
+
+    return len(sent)
+
+
+def run_once(batch_size=None, dispatcher=None, flush=False):
+    """
+    Claims and sends one batch. Returns the number of messages claimed.
+    """
+    messages = claim_batch(batch_size or getattr(settings, "NOTIFICATION_BATCH_SIZE", 50), flush=flush)
+    if messages:
+        if dispatcher is None:
+            with Dispatcher() as dispatcher:
+                send_batch(messages, dispatcher)
+        else:
+            send_batch(messages, dispatcher)
+    return len(messages)
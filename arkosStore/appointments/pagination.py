@@ -0,0 +1,85 @@
+"""
+Keyset (cursor) pagination for long lists shown to clients: reviews of a
+worker, appointment history, etc.
+
+A page is read with ORDER BY on a fixed set of fields ending in a unique one
+(usually "-id") and LIMIT size + 1. The next page starts after the last row
+shown: its values are sent to the client as an opaque cursor and turned back
+into a WHERE clause, so any page costs the same as the first one (an OFFSET
+would read and skip every earlier row). Pair each ordering with an index on
+the same fields.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+
+PAGE_SIZE = 10
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _fields(model, ordering):
+    return [(key.lstrip("-"), key.startswith("-"), model._meta.get_field(key.lstrip("-"))) for key in ordering]
+
+
+def after_filter(fields, values):
+    """
+    Q for the rows that come after values in the ordering: for (a, b) in
+    descending order, a < va OR (a = va AND b < vb).
+    """
+    condition = Q()
+    equal = {}
+    for (name, descending, _), value in zip(fields, values):
+        lookup = "lt" if descending else "gt"
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+    return condition
+
+
+def encode_cursor(fields, row):
+    values = [field.value_to_string(row) for _, _, field in fields]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(fields, cursor):
+    """
+    Returns the field values of a cursor. Raises InvalidCursor if it was not
+    made by encode_cursor for the same ordering.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [field.to_python(value) for (_, _, field), value in zip(fields, values)]
+    except Exception as error:
+        raise InvalidCursor(cursor) from error
+
+
+def keyset_page(queryset, ordering, cursor=None, size=PAGE_SIZE):
+    """
+    Returns (rows, next_cursor) for the page of queryset, sorted by ordering
+    (field names of its model, "-" for descending), that follows cursor.
+    next_cursor is None on the last page.
+    """
+    fields = _fields(queryset.model, ordering)
+    if cursor:
+        queryset = queryset.filter(after_filter(fields, decode_cursor(fields, cursor)))
+    rows = list(queryset.order_by(*ordering)[: size + 1])
+    if len(rows) > size:
+        return rows[:size], encode_cursor(fields, rows[size - 1])
+    return rows, None
+
+
+def page_or_first(queryset, ordering, cursor=None, size=PAGE_SIZE):
+    """
+    keyset_page for pages opened from a link: an invalid cursor (edited or
+    from an older ordering) shows the first page.
+    """
+    try:
+        return keyset_page(queryset, ordering, cursor, size)
+    except InvalidCursor:
+        return keyset_page(queryset, ordering, None, size)
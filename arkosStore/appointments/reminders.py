@@ -0,0 +1,82 @@
+"""
+Appointment reminders.
+
+send_reminders reads the ids of the active appointments starting within the
+reminder window and not yet reminded (through the appt_reminder_due_idx
+partial index), then works through them a chunk at a time: one UPDATE by
+primary key stamps reminder_sent_at with the time of the run, the stamped
+rows are read back by primary key and their messages are queued in
+NotificationOutbox. Only the ids are held in memory, and no query scans the
+table: once stamped, rows leave the partial index.
+
+Everything runs in one transaction: a failed run leaves nothing marked, and
+an overlapping run cannot mark (or remind) the same appointment twice, since
+each UPDATE only takes rows whose reminder_sent_at is still empty.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ACTIVE_STATUSES, Appointment, NotificationOutbox
+from .services import reminder_messages
+
+CHUNK_SIZE = 500
+
+# What a reminder needs, so that the stream does not load whole rows.
+REMINDER_FIELDS = [
+    "datetime",
+    "guest_first_name",
+    "guest_email",
+    "guest_phone",
+    "user__first_name",
+    "user__email",
+    "user__phone_number",
+    "worker__name",
+    "service__name",
+]
+
+
+def due_for_reminder(now, hours):
+    """
+    Active appointments starting in (now, now + hours] without a reminder,
+    read through the appt_reminder_due_idx partial index.
+    """
+    return Appointment.objects.filter(
+        status__in=ACTIVE_STATUSES,
+        reminder_sent_at__isnull=True,
+        datetime__gt=now,
+        datetime__lte=now + timedelta(hours=hours),
+    )
+
+
+def send_reminders(hours=None, chunk_size=CHUNK_SIZE):
+    """
+    Queues the reminders of the appointments due in the next hours
+    (settings.REMINDER_HOURS_BEFORE by default). Returns the number of
+    appointments reminded.
+    """
+    if hours is None:
+        hours = getattr(settings, "REMINDER_HOURS_BEFORE", 24)
+    now = timezone.now()
+
+    reminded = 0
+    with transaction.atomic():
+        due_ids = list(due_for_reminder(now, hours).order_by("datetime").values_list("pk", flat=True))
+        for offset in range(0, len(due_ids), chunk_size):
+            chunk = due_ids[offset : offset + chunk_size]
+            reminded += Appointment.objects.filter(pk__in=chunk, reminder_sent_at__isnull=True).update(
+                reminder_sent_at=now, updated_at=now
+            )
+            stamped = (
+                Appointment.objects.filter(pk__in=chunk, reminder_sent_at=now)
+                .select_related("user", "worker", "service")
+                .only(*REMINDER_FIELDS)
+                .order_by("datetime")
+            )
+            NotificationOutbox.objects.bulk_create(
+                [message for appointment in stamped for message in reminder_messages(appointment)]
+            )
+    return reminded
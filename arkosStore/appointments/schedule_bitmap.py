@@ -0,0 +1,151 @@
+"""
+Minute-resolution occupancy bitmaps for one worker on one day.
+
+Bit i of a bitmap stands for minute i of the local day. Two bitmaps are kept:
+``open`` (covered by an availability rule) and ``busy`` (taken by an active
+appointment). "Is [start, end) free?" is a single AND against a mask and
+"every start with D free minutes in a row" is a handful of shifts, whatever
+the number of appointments that built the bitmap.
+"""
+
+from datetime import datetime, time
+
+from django.utils import timezone
+
+MINUTES_PER_DAY = 24 * 60
+FORMAT_VERSION = 1
+_BYTES = MINUTES_PER_DAY // 8
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def minute_of_day(value, midnight, ceil=False):
+    """
+    Converts an aware datetime to minutes since midnight (the aware start of
+    the day), clamped to [0, MINUTES_PER_DAY]. Seconds are rounded down, or up
+    if ceil.
+    """
+    delta = value - midnight
+    if delta.days < 0:
+        return 0
+    minutes, remainder = divmod(delta.days * 86400 + delta.seconds, 60)
+    if ceil and (remainder or delta.microseconds):
+        minutes += 1
+    return min(minutes, MINUTES_PER_DAY)
+
+
+def time_to_minute(value):
+    return value.hour * 60 + value.minute
+
+
+def minute_to_time(minute):
+    return time(minute // 60, minute % 60)
+
+
+def mask(start, end):
+    """
+    Bits set for minutes [start, end).
+    """
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+class DaySchedule:
+    """
+    Occupancy of one worker on one day.
+    """
+
+    __slots__ = ("open", "busy")
+
+    def __init__(self, open=0, busy=0):
+        self.open = open
+        self.busy = busy
+
+    @classmethod
+    def build(cls, day, rules=(), appointments=()):
+        """
+        rules is an iterable of (start_time, end_time) availability pairs and
+        appointments an iterable of aware (start, end) datetimes.
+        Busy time is rounded outwards to whole minutes.
+        """
+        schedule = cls()
+        midnight = local_midnight(day)
+        for start_time, end_time in rules:
+            schedule.open |= mask(time_to_minute(start_time), time_to_minute(end_time))
+        for start, end in appointments:
+            schedule.busy |= mask(minute_of_day(start, midnight), minute_of_day(end, midnight, ceil=True))
+        return schedule
+
+    @property
+    def free(self):
+        return self.open & ~self.busy
+
+    def is_free(self, start, end, require_open=True):
+        """
+        Returns True if minutes [start, end) are not busy (and, if require_open,
+        all covered by an availability rule).
+        """
+        wanted = mask(start, end)
+        if self.busy & wanted:
+            return False
+        return not require_open or self.open & wanted == wanted
+
+    def free_starts(self, duration, step=1, start=0, end=MINUTES_PER_DAY):
+        """
+        Returns every minute of the grid start, start + step, ... at which
+        duration consecutive free minutes begin and end no later than end.
+        """
+        runs = self.free & mask(start, end)
+        length = 1
+        while length < duration and runs:
+            shift = min(length, duration - length)
+            runs &= runs >> shift
+            length += shift
+
+        return [
+            minute
+            for minute in range(start, end - duration + 1, step)
+            if runs >> minute & 1
+        ]
+
+    def free_runs(self):
+        """
+        Returns the maximal runs of free open minutes as [(start, end), ...].
+        """
+        runs = []
+        bits = self.free
+        while bits:
+            start = (bits & -bits).bit_length() - 1
+            shifted = bits >> start
+            end = start + (shifted ^ (shifted + 1)).bit_length() - 1
+            runs.append((start, end))
+            bits &= ~((1 << end) - 1)
+        return runs
+
+    def to_bytes(self):
+        """
+        Serialises to 2 + 2 * 180 bytes: version, unused, open bitmap, busy bitmap.
+        """
+        return (
+            bytes((FORMAT_VERSION, 0))
+            + self.open.to_bytes(_BYTES, "little")
+            + self.busy.to_bytes(_BYTES, "little")
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) != 2 + 2 * _BYTES or data[0] != FORMAT_VERSION:
+            raise ValueError("Formato de agenda no reconocido.")
+        return cls(
+            open=int.from_bytes(data[2 : 2 + _BYTES], "little"),
+            busy=int.from_bytes(data[2 + _BYTES :], "little"),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, DaySchedule) and (self.open, self.busy) == (other.open, other.busy)
+
+    def __repr__(self):
+        return f"<DaySchedule open={bin(self.open).count('1')}m busy={bin(self.busy).count('1')}m>"
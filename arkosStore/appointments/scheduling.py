@@ -0,0 +1,222 @@
+"""
+Booking writes.
+
+Every path that stores an active appointment goes through book_appointment,
+which serialises bookings per worker: the Worker row is locked with
+SELECT ... FOR UPDATE, the overlap check runs inside the same transaction and
+the database itself rejects overlaps (exclusion constraint on PostgreSQL,
+triggers on SQLite, see migration 0006) in case anything slips through.
+
+Overlap checks go through find_conflicts, which reads the same "busy"
+definition as the slot engine (slots.busy_intervals) and answers any number of
+candidate intervals with one range query.
+
+Recurring series (book_series) are checked with one query and inserted with
+one bulk_create; the signal side effects are applied by hand.
+
+Slot holds (SlotHold) let a session keep a slot for a few minutes while the
+booking form is filled in; they are taken under the same per-worker lock.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from workers.models import Worker
+
+from .models import ACTIVE_STATUSES, Appointment, AppointmentTombstone, SlotHold
+from .signals import appointments_changed
+from .slots import busy_intervals, is_free
+
+OVERLAP_CONSTRAINT = "appointments_appointment_no_overlap"
+
+SLOT_TAKEN_MESSAGE = (
+    "Esta franja horaria ya está reservada o se solapa con otra cita existente. "
+    "Por favor, selecciona otro horario."
+)
+
+
+class SlotTakenError(Exception):
+    """
+    The requested interval overlaps an active appointment of the same worker.
+    """
+
+    def __init__(self, message=SLOT_TAKEN_MESSAGE):
+        super().__init__(message)
+        self.message = message
+
+
+def find_conflicts(worker_id, intervals, exclude_id=None):
+    """
+    Returns, in order, the (start, end) intervals that overlap an active
+    appointment of the worker. All intervals are answered with one range query
+    over the span they cover; exclude_id leaves out the appointment being moved.
+    """
+    intervals = list(intervals)
+    if not intervals:
+        return []
+
+    span_start = min(start for start, _ in intervals)
+    span_end = max(end for _, end in intervals)
+    busy = busy_intervals([worker_id], span_start, span_end, exclude_id=exclude_id).get(worker_id)
+    if busy is None:
+        return []
+    return [(start, end) for start, end in intervals if not is_free(busy, start, end)]
+
+
+def has_conflict(worker_id, start, end, exclude_id=None):
+    """
+    Returns True if [start, end) overlaps an active appointment of the worker.
+    """
+    return bool(find_conflicts(worker_id, [(start, end)], exclude_id=exclude_id))
+
+
+def series_conflict_message(conflicts):
+    dates = ", ".join(timezone.localtime(start).strftime("%d/%m/%Y %H:%M") for start, _ in conflicts)
+    return f"Las siguientes citas de la serie se solapan con otras ya reservadas: {dates}."
+
+
+def is_overlap_error(error):
+    return OVERLAP_CONSTRAINT in str(error)
+
+
+def held_by_others(worker_id, start, end, session_key):
+    """
+    Returns True if another session holds an interval overlapping [start, end).
+    """
+    return (
+        SlotHold.objects.filter(
+            worker_id=worker_id,
+            datetime__lt=end,
+            end_datetime__gt=start,
+            expires_at__gt=timezone.now(),
+        )
+        .exclude(session_key=session_key)
+        .exists()
+    )
+
+
+def purge_expired_holds():
+    """
+    Deletes expired holds in bulk through the expires_at index.
+    """
+    return SlotHold.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def purge_tombstones():
+    """
+    Deletes the appointment tombstones older than SCHEDULE_TOMBSTONE_DAYS.
+    """
+    days = getattr(settings, "SCHEDULE_TOMBSTONE_DAYS", 7)
+    return AppointmentTombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=days)).delete()[0]
+
+
+def hold_slot(session_key, worker_id, service, start):
+    """
+    Holds [start, start + service duration) for session_key, replacing any
+    previous hold of that session. Raises SlotTakenError if the slot is booked
+    or held by another session.
+    """
+    end = start + timedelta(minutes=service.duration)
+    ttl = getattr(settings, "SLOT_HOLD_SECONDS", 300)
+
+    with transaction.atomic():
+        Worker.objects.select_for_update().only("id").get(pk=worker_id)
+
+        purge_expired_holds()
+        SlotHold.objects.filter(session_key=session_key).delete()
+
+        if has_conflict(worker_id, start, end) or held_by_others(worker_id, start, end, session_key):
+            raise SlotTakenError()
+
+        return SlotHold.objects.create(
+            worker_id=worker_id,
+            service=service,
+            datetime=start,
+            end_datetime=end,
+            session_key=session_key,
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        )
+
+
+def book_appointment(appointment, hold=None, session_key=None):
+    """
+    Saves a new or modified appointment unless it overlaps another active
+    appointment of its worker. Raises SlotTakenError instead of saving.
+
+    With a hold covering the appointment the overlap scan is skipped (the hold
+    was checked when it was taken) and the hold is consumed. Otherwise, unless
+    session_key is None, slots held by other sessions count as taken ("" for
+    a client without session).
+    """
+    try:
+        with transaction.atomic():
+            Worker.objects.select_for_update().only("id").get(pk=appointment.worker_id)
+
+            covered = (
+                hold is not None
+                and hold.covers(appointment.worker_id, appointment.service_id, appointment.datetime)
+                and SlotHold.objects.filter(pk=hold.pk, expires_at__gt=timezone.now()).exists()
+            )
+
+            if appointment.status in ACTIVE_STATUSES and not covered:
+                end = appointment.datetime + timedelta(minutes=appointment.service.duration)
+                if has_conflict(appointment.worker_id, appointment.datetime, end, exclude_id=appointment.pk):
+                    raise SlotTakenError()
+                if session_key is not None and held_by_others(appointment.worker_id, appointment.datetime, end, session_key):
+                    raise SlotTakenError()
+
+            appointment.save()
+
+            if hold is not None:
+                SlotHold.objects.filter(pk=hold.pk).delete()
+    except IntegrityError as error:
+        if is_overlap_error(error):
+            raise SlotTakenError() from error
+        raise
+    return appointment
+
+
+def book_series(series, **appointment_fields):
+    """
+    Saves series and creates all its appointments, or none of them. The whole
+    series is checked with one query and inserted with one bulk_create, under
+    the same per-worker lock as book_appointment. appointment_fields (contact
+    data, status) are copied to every appointment. Raises SlotTakenError,
+    listing the clashing dates, if any occurrence overlaps.
+    """
+    duration = timedelta(minutes=series.service.duration)
+    intervals = [(start, start + duration) for start in series.datetimes()]
+
+    try:
+        with transaction.atomic():
+            Worker.objects.select_for_update().only("id").get(pk=series.worker_id)
+
+            conflicts = find_conflicts(series.worker_id, intervals)
+            if conflicts:
+                raise SlotTakenError(series_conflict_message(conflicts))
+
+            series.save()
+            appointments = Appointment.objects.bulk_create(
+                [
+                    # bulk_create skips Appointment.save, so the end is set here.
+                    Appointment(
+                        series=series,
+                        user=series.user,
+                        worker_id=series.worker_id,
+                        service=series.service,
+                        datetime=start,
+                        end_datetime=end,
+                        **appointment_fields,
+                    )
+                    for start, end in intervals
+                ]
+            )
+            appointments_changed(appointments)
+    except IntegrityError as error:
+        if is_overlap_error(error):
+            raise SlotTakenError() from error
+        raise
+    return appointments
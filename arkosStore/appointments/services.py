@@ -1,28 +1,34 @@
-from django.core.mail import send_mail
-from django.conf import settings
-from twilio.rest import Client
-import threading
-
-def send_appointment_notifications(appointment):
-    email_thread = threading.Thread(target=_send_email, args=(appointment,))
-    sms_thread = threading.Thread(target=_send_sms, args=(appointment,))
-    
-    email_thread.start()
-    sms_thread.start()
+"""
+Booking notifications.
 
-def _get_contact_info(appointment):
-    if appointment.user:
-        return appointment.user.email, appointment.user.phone_number, appointment.user.first_name
-    else:
-        return appointment.guest_email, appointment.guest_phone, appointment.guest_first_name
+Messages are not sent from the request: they are queued in NotificationOutbox
+inside the booking transaction and delivered by manage.py run_notifications
+(see appointments.outbox).
+"""
+
+from datetime import timedelta
+
+from django.utils import timezone
 
-def _send_email(appointment):
-    email, _, name = _get_contact_info(appointment)
-    
-    if not email: return
+from .models import CANCELLATION_NOTICE_HOURS, NotificationOutbox
 
-    subject = 'Confirmación de Cita - NATURSUR'
-    message = f"""
+
+def queue_appointment_notifications(appointment):
+    """
+    Queues the confirmation email and SMS of an appointment.
+    """
+    email, phone, name = _get_contact_info(appointment)
+    start = timezone.localtime(appointment.datetime)
+
+    messages = []
+    if email:
+        messages.append(
+            NotificationOutbox(
+                appointment=appointment,
+                channel=NotificationOutbox.Channel.EMAIL,
+                recipient=email,
+                subject='Confirmación de Cita - NATURSUR',
+                body=f"""
     Hola {name},
 
     Tu cita ha sido confirmada con éxito.
@@ -30,38 +36,135 @@ def _send_email(appointment):
     Detalles:
     - Servicio: {appointment.service.get_name_display()}
     - Especialista: {appointment.worker.name}
-    - Fecha: {appointment.datetime.strftime('%d/%m/%Y')}
-    - Hora: {appointment.datetime.strftime('%H:%M')}
+    - Fecha: {start.strftime('%d/%m/%Y')}
+    - Hora: {start.strftime('%H:%M')}
+
+    Si necesitas cancelar, recuerda hacerlo con al menos {CANCELLATION_NOTICE_HOURS} horas de antelación.
+
+    ¡Te esperamos!
+    Equipo NATURSUR
+    """,
+            )
+        )
+    if phone:
+        messages.append(
+            NotificationOutbox(
+                appointment=appointment,
+                channel=NotificationOutbox.Channel.SMS,
+                recipient=phone,
+                body=f"NATURSUR: Hola {name}, cita confirmada para el {start.strftime('%d/%m a las %H:%M')} con {appointment.worker.name}.",
+            )
+        )
+    return NotificationOutbox.objects.bulk_create(messages)
+
+
+def queue_series_notifications(series, appointments):
+    """
+    Queues one email and one SMS for a whole recurring series.
+    """
+    email, phone, name = _get_contact_info(appointments[0])
+    first = timezone.localtime(appointments[0].datetime)
+
+    messages = []
+    if email:
+        dates = "\n".join(
+            f"    - {timezone.localtime(appointment.datetime).strftime('%d/%m/%Y %H:%M')}"
+            for appointment in appointments
+        )
+        messages.append(
+            NotificationOutbox(
+                appointment=appointments[0],
+                channel=NotificationOutbox.Channel.EMAIL,
+                recipient=email,
+                subject='Confirmación de Serie de Citas - NATURSUR',
+                body=f"""
+    Hola {name},
+
+    Tu serie de {len(appointments)} citas ha sido confirmada con éxito.
+
+    Detalles:
+    - Servicio: {series.service.get_name_display()}
+    - Especialista: {series.worker.name}
+    - Fechas:
+{dates}
 
-    Si necesitas cancelar, recuerda hacerlo con al menos 12 horas de antelación.
+    Si necesitas cancelar alguna, recuerda hacerlo con al menos {CANCELLATION_NOTICE_HOURS} horas de antelación.
 
     ¡Te esperamos!
     Equipo NATURSUR
+    """,
+            )
+        )
+    if phone:
+        messages.append(
+            NotificationOutbox(
+                appointment=appointments[0],
+                channel=NotificationOutbox.Channel.SMS,
+                recipient=phone,
+                body=(
+                    f"NATURSUR: Hola {name}, {len(appointments)} citas confirmadas con {series.worker.name}, "
+                    f"cada {series.interval_weeks} semana(s) desde el {first.strftime('%d/%m a las %H:%M')}."
+                ),
+            )
+        )
+    return NotificationOutbox.objects.bulk_create(messages)
+
+
+def reminder_messages(appointment):
+    """
+    Builds (unsaved) the reminder email and SMS of an appointment.
     """
-    
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=False,
+    email, phone, name = _get_contact_info(appointment)
+    start = timezone.localtime(appointment.datetime)
+    cancel_by = start - timedelta(hours=CANCELLATION_NOTICE_HOURS)
+    if cancel_by > timezone.now():
+        policy = (
+            f"Si no puedes venir, puedes cancelarla hasta el {cancel_by.strftime('%d/%m a las %H:%M')} "
+            f"({CANCELLATION_NOTICE_HOURS} horas antes)."
+        )
+    else:
+        policy = f"Ya no es posible cancelarla online (menos de {CANCELLATION_NOTICE_HOURS} horas de antelación)."
+
+    messages = []
+    if email:
+        messages.append(
+            NotificationOutbox(
+                appointment=appointment,
+                channel=NotificationOutbox.Channel.EMAIL,
+                recipient=email,
+                subject='Recordatorio de Cita - NATURSUR',
+                body=f"""
+    Hola {name},
+
+    Te recordamos tu próxima cita.
+
+    Detalles:
+    - Servicio: {appointment.service.get_name_display()}
+    - Especialista: {appointment.worker.name}
+    - Fecha: {start.strftime('%d/%m/%Y')}
+    - Hora: {start.strftime('%H:%M')}
+
+    {policy}
+
+    ¡Te esperamos!
+    Equipo NATURSUR
+    """,
+            )
         )
-    except Exception as e:
-        print(f"❌ Error enviando email: {e}")
-
-def _send_sms(appointment):
-    _, phone, name = _get_contact_info(appointment)
-    
-    if not phone: return
-    body = f"NATURSUR: Hola {name}, cita confirmada para el {appointment.datetime.strftime('%d/%m a las %H:%M')} con {appointment.worker.name}."
-
-    try:
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        message = client.messages.create(
-            body=body,
-            from_=settings.TWILIO_PHONE_NUMBER,
-            to=phone
+    if phone:
+        messages.append(
+            NotificationOutbox(
+                appointment=appointment,
+                channel=NotificationOutbox.Channel.SMS,
+                recipient=phone,
+                body=f"NATURSUR: Hola {name}, te recordamos tu cita del {start.strftime('%d/%m a las %H:%M')} con {appointment.worker.name}. {policy}",
+            )
         )
-    except Exception as e:
-        print(f"❌ Error enviando SMS: {e}")
\ No newline at end of file
+    return messages
+
+
+def _get_contact_info(appointment):
+    if appointment.user:
+        return appointment.user.email, appointment.user.phone_number, appointment.user.first_name
+    else:
+        return appointment.guest_email, appointment.guest_phone, appointment.guest_first_name
@@ -0,0 +1,142 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from workers.models import Worker
+
+from . import events, occupancy, slot_cache
+from .models import ACTIVE_STATUSES, OCCUPYING_STATUSES, Appointment, AppointmentTombstone, Availability, Service
+
+
+def _worker_days(worker_id, start, end):
+    days = {(worker_id, timezone.localtime(start).date())}
+    if end:
+        days.add((worker_id, timezone.localtime(end).date()))
+    return days
+
+
+def _appointment_days(instance):
+    """
+    Returns the (worker_id, date) pairs an appointment occupies now and, if it
+    was loaded from the database, the pairs it occupied before being changed.
+    """
+    days = _worker_days(instance.worker_id, instance.datetime, instance.end_datetime)
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded and "worker_id" in loaded and "datetime" in loaded:
+        days |= _worker_days(loaded["worker_id"], loaded["datetime"], loaded.get("end_datetime"))
+    return days
+
+
+def _deleting_worker(origin):
+    """
+    True when the deletion cascades from a worker, whose occupancy rows are
+    being deleted too.
+    """
+    return isinstance(origin, Worker) or getattr(origin, "model", None) is Worker
+
+
+def appointments_changed(appointments):
+    """
+    Does the post_save work for appointments written in bulk (bulk_create and
+    QuerySet.update do not send signals): slot cache and occupancy of every
+    worker-day they touch.
+    """
+    days = set()
+    for appointment in appointments:
+        days |= _appointment_days(appointment)
+    for worker_id, day in days:
+        slot_cache.invalidate_worker_day(worker_id, day)
+    occupancy.refresh_occupancy(days)
+    events.publish_days_changed(days)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_slots(sender, instance, **kwargs):
+    for worker_id, day in _appointment_days(instance):
+        slot_cache.invalidate_worker_day(worker_id, day)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_appointment_occupancy(sender, instance, origin=None, **kwargs):
+    if not _deleting_worker(origin):
+        occupancy.refresh_occupancy(_appointment_days(instance))
+
+
+@receiver(post_save, sender=Appointment)
+def publish_appointment_saved(sender, instance, created, **kwargs):
+    events.publish_saved(instance, created)
+
+
+@receiver(post_delete, sender=Appointment)
+def publish_appointment_deleted(sender, instance, **kwargs):
+    events.publish_deleted(instance)
+
+
+@receiver(post_delete, sender=Appointment)
+def record_appointment_tombstone(sender, instance, **kwargs):
+    # Lets the dashboard delta sync tell open calendars to drop it.
+    AppointmentTombstone.objects.create(
+        appointment_id=instance.pk, worker_id=instance.worker_id, datetime=instance.datetime
+    )
+
+
+@receiver(post_save, sender=Appointment)
+def record_appointment_move(sender, instance, created, **kwargs):
+    # The delta sync only reads the day it shows, so a block moved to another
+    # day is dropped from its old day through a tombstone.
+    loaded = getattr(instance, "_loaded_values", None)
+    if created or not loaded or not loaded.get("datetime"):
+        return
+    if timezone.localtime(loaded["datetime"]).date() != timezone.localtime(instance.datetime).date():
+        AppointmentTombstone.objects.create(
+            appointment_id=instance.pk, worker_id=loaded.get("worker_id", instance.worker_id), datetime=loaded["datetime"]
+        )
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+def invalidate_availability_slots(sender, instance, **kwargs):
+    slot_cache.invalidate_worker_rules(instance.worker_id)
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+def refresh_availability_occupancy(sender, instance, origin=None, **kwargs):
+    if not _deleting_worker(origin):
+        occupancy.refresh_worker(instance.worker_id)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_slots(sender, instance, **kwargs):
+    slot_cache.invalidate_service(instance.id)
+    # A new duration also moves the busy time every other service sees on the
+    # days its upcoming appointments are booked.
+    upcoming = instance.service_appointments.filter(status__in=ACTIVE_STATUSES, end_datetime__gte=timezone.now())
+    for worker_id, day in occupancy.occupied_worker_days(upcoming):
+        slot_cache.invalidate_worker_day(worker_id, day)
+
+
+@receiver(post_save, sender=Service)
+def refresh_service_occupancy(sender, instance, created, **kwargs):
+    # Service.save may have moved the end of its appointments.
+    if not created:
+        occupancy.refresh_occupancy(
+            occupancy.occupied_worker_days(
+                instance.service_appointments.filter(status__in=OCCUPYING_STATUSES)
+            )
+        )
+
+
+@receiver(post_save, sender=Worker)
+@receiver(post_delete, sender=Worker)
+def invalidate_worker_slots(sender, instance, **kwargs):
+    slot_cache.invalidate_roster()
+
+
+@receiver(m2m_changed, sender=Worker.specialties.through)
+def invalidate_specialty_slots(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        slot_cache.invalidate_roster()
@@ -0,0 +1,174 @@
+"""
+Cache of computed slots keyed by (service, date).
+
+Entries are never deleted on writes. Instead every entry is stamped with the
+generation counters it was computed from, and model signals bump only the
+counters a change affects:
+
+- one counter per worker and date (appointments),
+- one counter per worker (availability rules),
+- one counter per service (duration or type changes),
+- one roster counter (which workers offer what, and their names).
+
+A booking therefore only invalidates the entries that contain that worker on
+that date. Counters are bumped once the writing transaction commits: bumped
+earlier, a request could read the old rows under the new counters and cache
+them as current. The counters live in the default cache, so any backend works
+(local memory for a single process, file based for several processes).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .slots import aavailable_slots, available_slots, qualified_workers
+
+ROSTER_KEY = "slots:gen:roster"
+
+
+def _service_key(service_id):
+    return f"slots:gen:service:{service_id}"
+
+
+def _rules_key(worker_id):
+    return f"slots:gen:rules:{worker_id}"
+
+
+def _worker_day_key(worker_id, day):
+    return f"slots:gen:worker:{worker_id}:{day.isoformat()}"
+
+
+def _entry_key(service_id, target_date, now):
+    key = f"slots:{service_id}:{target_date.isoformat()}"
+    if target_date == now.date():
+        # Today's slots depend on the current time, so they are keyed per minute.
+        key = f"{key}:{now.strftime('%H%M')}"
+    return key
+
+
+def _read_generations(keys):
+    """
+    Returns {key: generation}. Missing counters are created with a value that
+    cannot collide with one a previous (evicted) counter had.
+    """
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        generations.update(cache.get_many(missing))
+    return generations
+
+
+async def _aread_generations(keys):
+    generations = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, time.time_ns(), None)
+        generations.update(await cache.aget_many(missing))
+    return generations
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def bump_on_commit(key):
+    """
+    Bumps the counter after the current transaction commits (right away
+    outside a transaction).
+    """
+    transaction.on_commit(lambda: bump(key))
+
+
+def invalidate_worker_day(worker_id, day):
+    bump_on_commit(_worker_day_key(worker_id, day))
+
+
+def invalidate_worker_rules(worker_id):
+    bump_on_commit(_rules_key(worker_id))
+
+
+def invalidate_service(service_id):
+    bump_on_commit(_service_key(service_id))
+
+
+def invalidate_roster():
+    bump_on_commit(ROSTER_KEY)
+
+
+def _worker_keys(worker_ids, target_date):
+    keys = []
+    for worker_id in worker_ids:
+        keys.append(_rules_key(worker_id))
+        keys.append(_worker_day_key(worker_id, target_date))
+    return keys
+
+
+def _timeout(target_date, now):
+    timeout = getattr(settings, "SLOT_CACHE_TIMEOUT", 60 * 60 * 6)
+    if target_date == now.date():
+        timeout = min(timeout, 60)
+    return timeout
+
+
+def cached_available_slots(service, target_date):
+    """
+    Same result as slots.available_slots, served from the cache when none of
+    the counters it depends on changed since it was computed.
+    """
+    now = timezone.localtime()
+    entry_key = _entry_key(service.id, target_date, now)
+    global_keys = [ROSTER_KEY, _service_key(service.id)]
+
+    entry = cache.get(entry_key)
+    if entry is not None:
+        keys = global_keys + _worker_keys(entry["worker_ids"], target_date)
+        if _read_generations(keys) == entry["stamp"]:
+            return entry["slots"]
+
+    # Counters are read before the data they protect, so a write that lands
+    # while we compute leaves a stale stamp behind instead of stale slots.
+    stamp = _read_generations(global_keys)
+    workers = list(qualified_workers(service))
+    worker_ids = [worker.id for worker in workers]
+    stamp.update(_read_generations(_worker_keys(worker_ids, target_date)))
+
+    slots = available_slots(service, target_date, now=now, workers=workers)
+
+    cache.set(entry_key, {"worker_ids": worker_ids, "stamp": stamp, "slots": slots}, _timeout(target_date, now))
+    return slots
+
+
+async def acached_available_slots(service, target_date):
+    """
+    Async version of cached_available_slots, sharing its entries and counters.
+    """
+    now = timezone.localtime()
+    entry_key = _entry_key(service.id, target_date, now)
+    global_keys = [ROSTER_KEY, _service_key(service.id)]
+
+    entry = await cache.aget(entry_key)
+    if entry is not None:
+        keys = global_keys + _worker_keys(entry["worker_ids"], target_date)
+        if await _aread_generations(keys) == entry["stamp"]:
+            return entry["slots"]
+
+    stamp = await _aread_generations(global_keys)
+    workers = [worker async for worker in qualified_workers(service)]
+    worker_ids = [worker.id for worker in workers]
+    stamp.update(await _aread_generations(_worker_keys(worker_ids, target_date)))
+
+    slots = await aavailable_slots(service, target_date, now=now, workers=workers)
+
+    await cache.aset(
+        entry_key, {"worker_ids": worker_ids, "stamp": stamp, "slots": slots}, _timeout(target_date, now)
+    )
+    return slots
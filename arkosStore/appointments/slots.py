@@ -0,0 +1,404 @@
+"""
+Slot engine used by the booking calendar.
+
+Busy time is loaded with a single query and kept per worker as two parallel,
+sorted lists (starts and ends of disjoint intervals). The intervals of each
+day are located with a bisect and folded into a DaySchedule bitmap, from which
+the free starts of every availability rule are read with bitwise operations.
+
+Worker-days the occupancy table reports as full for the requested duration
+are dropped before any rule or appointment is loaded.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from workers.models import Worker
+
+from .models import ACTIVE_STATUSES, Appointment, Availability, SlotHold, WorkerDayOccupancy
+from .schedule_bitmap import DaySchedule, minute_of_day, time_to_minute
+
+
+def day_bounds(target_date):
+    """
+    Returns the aware datetimes delimiting target_date: [start, end).
+    """
+    start = timezone.make_aware(datetime.combine(target_date, time.min))
+    end = timezone.make_aware(datetime.combine(target_date + timedelta(days=1), time.min))
+    return start, end
+
+
+def merge_intervals(intervals):
+    """
+    Sorts and merges (start, end) pairs.
+    Returns two parallel lists (starts, ends) of disjoint intervals.
+    """
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+def is_free(busy, start, end):
+    """
+    Returns True if [start, end) does not overlap any interval in busy.
+    """
+    starts, ends = busy
+    index = bisect_right(ends, start)
+    return index == len(starts) or starts[index] >= end
+
+
+def first_slot_start(rule_start, service_duration, now):
+    """
+    Slots that already started today are skipped: the grid restarts at the next
+    multiple of the service duration (counted from the start of the hour).
+    """
+    if rule_start >= now:
+        return rule_start
+
+    minutes_to_add = (service_duration - (now.minute % service_duration)) % service_duration
+    return (now + timedelta(minutes=minutes_to_add)).replace(second=0, microsecond=0)
+
+
+def qualified_workers(service):
+    return Worker.objects.filter(specialties__name=service.name).only("id", "name").order_by("id")
+
+
+def _full_queryset(worker_ids, from_date, to_date, service_duration):
+    return WorkerDayOccupancy.objects.filter(
+        worker_id__in=worker_ids,
+        date__range=(from_date, to_date),
+        longest_free__lt=service_duration,
+    ).values_list("worker_id", "date")
+
+
+def full_worker_days(worker_ids, from_date, to_date, service_duration):
+    """
+    Returns the (worker_id, date) pairs between from_date and to_date with no
+    free run of service_duration minutes left, read from the occupancy table.
+    """
+    return set(_full_queryset(worker_ids, from_date, to_date, service_duration))
+
+
+async def afull_worker_days(worker_ids, from_date, to_date, service_duration):
+    return {pair async for pair in _full_queryset(worker_ids, from_date, to_date, service_duration)}
+
+
+def _rules_queryset(worker_ids, days_of_week):
+    return (
+        Availability.objects.filter(worker_id__in=worker_ids, day_of_week__in=days_of_week)
+        .order_by("id")
+        .values_list("day_of_week", "worker_id", "start_time", "end_time")
+    )
+
+
+def _group_rules(rows):
+    rules = defaultdict(lambda: defaultdict(list))
+    for day_of_week, worker_id, start_time, end_time in rows:
+        rules[day_of_week][worker_id].append((start_time, end_time))
+    return rules
+
+
+def availability_rules(worker_ids, days_of_week):
+    """
+    Returns {day_of_week: {worker_id: [(start_time, end_time), ...]}} for the
+    given weekdays, loaded with a single query.
+    """
+    return _group_rules(_rules_queryset(worker_ids, days_of_week))
+
+
+async def aavailability_rules(worker_ids, days_of_week):
+    return _group_rules([row async for row in _rules_queryset(worker_ids, days_of_week)])
+
+
+def _group_intervals(rows):
+    intervals = defaultdict(list)
+    for worker_id, start, end in rows:
+        intervals[worker_id].append((start, end))
+    return {worker_id: merge_intervals(items) for worker_id, items in intervals.items()}
+
+
+def _busy_queryset(worker_ids, start, end, exclude_id=None):
+    busy = Appointment.objects.filter(
+        worker_id__in=worker_ids,
+        status__in=ACTIVE_STATUSES,
+        datetime__lt=end,
+        end_datetime__gt=start,
+    )
+    if exclude_id is not None:
+        busy = busy.exclude(pk=exclude_id)
+    return busy.values_list("worker_id", "datetime", "end_datetime")
+
+
+def busy_intervals(worker_ids, start, end, exclude_id=None):
+    """
+    Returns {worker_id: (starts, ends)} with the active appointments of every
+    worker that overlap [start, end), loaded with a single indexed range query.
+    This is the only definition of "busy" used by the slot engine and by the
+    booking checks in appointments.scheduling.
+    """
+    return _group_intervals(_busy_queryset(worker_ids, start, end, exclude_id))
+
+
+async def abusy_intervals(worker_ids, start, end):
+    return _group_intervals([row async for row in _busy_queryset(worker_ids, start, end)])
+
+
+def _held_queryset(worker_ids, start, end, exclude_session_key):
+    return (
+        SlotHold.objects.filter(
+            worker_id__in=worker_ids,
+            datetime__lt=end,
+            end_datetime__gt=start,
+            expires_at__gt=timezone.now(),
+        )
+        .exclude(session_key=exclude_session_key or "")
+        .values_list("worker_id", "datetime", "end_datetime")
+    )
+
+
+def held_intervals(worker_ids, start, end, exclude_session_key=None):
+    """
+    Returns {worker_id: (starts, ends)} with the unexpired slot holds of other
+    sessions that overlap [start, end).
+    """
+    return _group_intervals(_held_queryset(worker_ids, start, end, exclude_session_key))
+
+
+async def aheld_intervals(worker_ids, start, end, exclude_session_key=None):
+    return _group_intervals(
+        [row async for row in _held_queryset(worker_ids, start, end, exclude_session_key)]
+    )
+
+
+def _drop_held(slots, target_date, service_duration, held):
+    duration_delta = timedelta(minutes=service_duration)
+    free = []
+    for slot in slots:
+        worker_held = held.get(slot["worker_id"])
+        slot_start = timezone.make_aware(
+            datetime.combine(target_date, datetime.strptime(slot["time_value"], "%H:%M").time())
+        )
+        if worker_held is None or is_free(worker_held, slot_start, slot_start + duration_delta):
+            free.append(slot)
+    return free
+
+
+def without_held_slots(slots, target_date, service_duration, session_key=None):
+    """
+    Removes from a computed slot list the slots held by other sessions.
+    Holds are applied on top of cached results because they expire on their own.
+    """
+    if not slots:
+        return slots
+
+    start, end = day_bounds(target_date)
+    held = held_intervals({slot["worker_id"] for slot in slots}, start, end, session_key)
+    return _drop_held(slots, target_date, service_duration, held) if held else slots
+
+
+async def awithout_held_slots(slots, target_date, service_duration, session_key=None):
+    if not slots:
+        return slots
+
+    start, end = day_bounds(target_date)
+    held = await aheld_intervals({slot["worker_id"] for slot in slots}, start, end, session_key)
+    return _drop_held(slots, target_date, service_duration, held) if held else slots
+
+
+def day_intervals(busy, start, end):
+    """
+    Yields the intervals of busy (starts, ends) that overlap [start, end).
+    """
+    starts, ends = busy
+    index = bisect_right(ends, start)
+    while index < len(starts) and starts[index] < end:
+        yield starts[index], ends[index]
+        index += 1
+
+
+def compute_day_slots(target_date, service_duration, workers, rules, busy, now):
+    """
+    Builds the list of free slots for one day from preloaded data.
+    workers is a list of (id, name) pairs, rules and busy are keyed by worker id.
+    """
+    day_start, day_end = day_bounds(target_date)
+    empty = ([], [])
+    slots = []
+
+    for worker_id, worker_name in workers:
+        worker_rules = rules.get(worker_id)
+        if not worker_rules:
+            continue
+
+        schedule = DaySchedule.build(
+            target_date,
+            rules=worker_rules,
+            appointments=day_intervals(busy.get(worker_id, empty), day_start, day_end),
+        )
+
+        for rule_start_time, rule_end_time in worker_rules:
+            grid_start = time_to_minute(rule_start_time)
+
+            if target_date == now.date():
+                rule_start = timezone.make_aware(datetime.combine(target_date, rule_start_time))
+                grid_start = minute_of_day(first_slot_start(rule_start, service_duration, now), day_start)
+
+            free_starts = schedule.free_starts(
+                service_duration,
+                step=service_duration,
+                start=grid_start,
+                end=time_to_minute(rule_end_time),
+            )
+            for minute in free_starts:
+                slot_start = f"{minute // 60:02d}:{minute % 60:02d}"
+                slots.append(
+                    {
+                        "time_display": slot_start,
+                        "time_value": slot_start,
+                        "worker_id": worker_id,
+                        "worker_name": worker_name,
+                    }
+                )
+
+    slots.sort(key=lambda slot: slot["time_value"])
+    return slots
+
+
+def available_slots(service, target_date, now=None, workers=None):
+    """
+    Returns the free slots of every worker offering service on target_date.
+    workers can be passed when the qualified workers were already loaded.
+    """
+    now = now or timezone.localtime()
+    if workers is None:
+        workers = qualified_workers(service)
+    workers = [(worker.id, worker.name) for worker in workers]
+    if workers:
+        full = full_worker_days([worker_id for worker_id, _ in workers], target_date, target_date, service.duration)
+        workers = [worker for worker in workers if (worker[0], target_date) not in full]
+    if not workers:
+        return []
+
+    day_of_week = target_date.weekday()
+    rules = availability_rules([worker_id for worker_id, _ in workers], [day_of_week]).get(day_of_week)
+    if not rules:
+        return []
+
+    start, end = day_bounds(target_date)
+    busy = busy_intervals(list(rules), start, end)
+    return compute_day_slots(target_date, service.duration, workers, rules, busy, now)
+
+
+async def aavailable_slots(service, target_date, now=None, workers=None):
+    """
+    Async ORM version of available_slots.
+    """
+    now = now or timezone.localtime()
+    if workers is None:
+        workers = [worker async for worker in qualified_workers(service)]
+    workers = [(worker.id, worker.name) for worker in workers]
+    if workers:
+        full = await afull_worker_days(
+            [worker_id for worker_id, _ in workers], target_date, target_date, service.duration
+        )
+        workers = [worker for worker in workers if (worker[0], target_date) not in full]
+    if not workers:
+        return []
+
+    day_of_week = target_date.weekday()
+    rules = (
+        await aavailability_rules([worker_id for worker_id, _ in workers], [day_of_week])
+    ).get(day_of_week)
+    if not rules:
+        return []
+
+    start, end = day_bounds(target_date)
+    busy = await abusy_intervals(list(rules), start, end)
+    return compute_day_slots(target_date, service.duration, workers, rules, busy, now)
+
+
+def available_days(service, from_date, to_date, now=None):
+    """
+    Summarises availability for every day in [from_date, to_date].
+    Returns a list of {'date', 'free_slots', 'first_time'} dicts, one per day.
+
+    Workers, availability rules and appointments for the whole window are
+    loaded with one query each, whatever the length of the window.
+    """
+    now = now or timezone.localtime()
+    dates = [from_date + timedelta(days=offset) for offset in range((to_date - from_date).days + 1)]
+    if not dates:
+        return []
+
+    workers = [(worker.id, worker.name) for worker in qualified_workers(service)]
+    rules = {}
+    busy = {}
+    full = set()
+    if workers:
+        worker_ids = [worker_id for worker_id, _ in workers]
+        full = full_worker_days(worker_ids, from_date, to_date, service.duration)
+        rules = availability_rules(worker_ids, {day.weekday() for day in dates})
+        if rules:
+            start, _ = day_bounds(from_date)
+            _, end = day_bounds(to_date)
+            busy = busy_intervals(worker_ids, start, end)
+
+    days = []
+    for day in dates:
+        day_rules = rules.get(day.weekday())
+        day_workers = [worker for worker in workers if (worker[0], day) not in full]
+        slots = (
+            compute_day_slots(day, service.duration, day_workers, day_rules, busy, now)
+            if day_rules and day_workers
+            else []
+        )
+        days.append(
+            {
+                "date": day.isoformat(),
+                "free_slots": len(slots),
+                "first_time": slots[0]["time_value"] if slots else None,
+            }
+        )
+    return days
+
+
+def unavailable_starts(service, worker_id, starts, now=None):
+    """
+    Returns the starts (aware datetimes) that are not free slots of the worker
+    for service: outside their availability rules, off the slot grid, past, or
+    taken. Uses the same computation as the booking calendar, with one query
+    for the rules and one for the busy time of the whole span.
+    """
+    if not starts:
+        return []
+    now = now or timezone.localtime()
+    local_starts = [timezone.localtime(start) for start in starts]
+    days = sorted({start.date() for start in local_starts})
+
+    rules = availability_rules([worker_id], {day.weekday() for day in days})
+    span_start, _ = day_bounds(days[0])
+    _, span_end = day_bounds(days[-1])
+    busy = busy_intervals([worker_id], span_start, span_end) if rules else {}
+
+    offered = set()
+    for day in days:
+        day_rules = rules.get(day.weekday())
+        if not day_rules:
+            continue
+        for slot in compute_day_slots(day, service.duration, [(worker_id, "")], day_rules, busy, now):
+            offered.add((day, slot["time_value"]))
+
+    return [
+        start
+        for start, local_start in zip(starts, local_starts)
+        if (local_start.date(), local_start.strftime("%H:%M")) not in offered
+    ]
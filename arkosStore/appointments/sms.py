@@ -0,0 +1,90 @@
+"""
+SMS backends, chosen with settings.SMS_BACKEND (a dotted path) in the same way
+as Django's email backends.
+
+Backends are asynchronous: they are opened once per notification worker
+(async with backend) and their send(to, body) coroutine raises on failure, so
+many messages can share one pooled HTTP session.
+"""
+
+import aiohttp
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Messages "sent" by LocMemBackend, like django.core.mail.outbox.
+outbox = []
+
+
+class SMSError(Exception):
+    pass
+
+
+class BaseSMSBackend:
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or getattr(settings, "NOTIFICATION_CONCURRENCY", 4)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def send(self, to, body):
+        raise NotImplementedError
+
+
+class TwilioBackend(BaseSMSBackend):
+    """
+    Twilio REST API over a single aiohttp session: connections (and their TLS
+    handshakes) are reused across messages instead of one client per SMS.
+    """
+
+    def __init__(self, concurrency=None):
+        super().__init__(concurrency)
+        self.session = None
+
+    @property
+    def messages_url(self):
+        base_url = getattr(settings, "TWILIO_API_URL", "https://api.twilio.com").rstrip("/")
+        return f"{base_url}/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Messages.json"
+
+    async def open(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(settings.TWILIO_ACCOUNT_SID or "", settings.TWILIO_AUTH_TOKEN or ""),
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=getattr(settings, "SMS_TIMEOUT_SECONDS", 10)),
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def send(self, to, body):
+        data = {"To": to, "From": settings.TWILIO_PHONE_NUMBER or "", "Body": body}
+        async with self.session.post(self.messages_url, data=data) as response:
+            # Reading the whole body lets the connection go back to the pool.
+            payload = await response.read()
+            if response.status >= 400:
+                raise SMSError(f"Twilio respondió {response.status}: {payload[:200].decode(errors='replace')}")
+
+
+class LocMemBackend(BaseSMSBackend):
+    """
+    Keeps the messages in appointments.sms.outbox instead of sending them.
+    """
+
+    async def send(self, to, body):
+        outbox.append({"to": to, "body": body})
+
+
+def get_sms_backend(**kwargs):
+    return import_string(getattr(settings, "SMS_BACKEND", "appointments.sms.TwilioBackend"))(**kwargs)
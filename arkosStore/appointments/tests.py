@@ -1,12 +1,50 @@
+import asyncio
+import importlib
+import json
+import threading
+import time as time_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+from io import StringIO
+from urllib.parse import parse_qs
 from datetime import datetime, time, timedelta
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from appointments.models import Appointment, Availability, Service, StatusChoices
-from workers.models import TypeChoices, Worker
+from appointments.models import (
+    Appointment,
+    AppointmentSeries,
+    Availability,
+    NotificationOutbox,
+    Service,
+    SlotHold,
+    StatusChoices,
+    WorkerDayOccupancy,
+)
+from appointments import events, slot_cache, sms
+from appointments.outbox import Dispatcher, claim_batch, retry_delay, run_once
+from appointments.completion import complete_past_appointments
+from appointments.forms import AdminAppointmentForm, ServiceForm
+from appointments.lookups import prefix_range
+from appointments.reminders import send_reminders
+from appointments.schedule_bitmap import DaySchedule
+from appointments.slots import available_slots
+from appointments.scheduling import SLOT_TAKEN_MESSAGE, SlotTakenError, book_appointment, book_series, find_conflicts
+from workers.models import Specialty, TypeChoices, Worker
+from reviews.models import Review
 
 User = get_user_model()
 
@@ -53,16 +91,42 @@ class AppointmentLogicTest(TestCase):
         expected_end_1 = start_time + timedelta(minutes=60)
         self.assertEqual(appointment_1.calculated_end_time, expected_end_1)
 
+        # Later on the same day: overlapping active appointments are rejected by the database.
+        start_time_2 = start_time + timedelta(hours=2)
         appointment_2 = Appointment.objects.create(
             user=self.user,
             worker=self.worker,
             service=self.service_30,
-            datetime=start_time,
+            datetime=start_time_2,
         )
 
-        expected_end_2 = start_time + timedelta(minutes=30)
+        expected_end_2 = start_time_2 + timedelta(minutes=30)
         self.assertEqual(appointment_2.calculated_end_time, expected_end_2)
 
+    def test_end_datetime_is_stored(self):
+        """
+        end_datetime is written on save and follows service duration changes.
+        """
+        start_time = timezone.now()
+        appointment = Appointment.objects.create(
+            user=self.user,
+            worker=self.worker,
+            service=self.service_60,
+            datetime=start_time,
+        )
+        self.assertEqual(
+            Appointment.objects.get(pk=appointment.pk).end_datetime,
+            start_time + timedelta(minutes=60),
+        )
+
+        self.service_60.duration = 90
+        self.service_60.save()
+
+        self.assertEqual(
+            Appointment.objects.get(pk=appointment.pk).end_datetime,
+            start_time + timedelta(minutes=90),
+        )
+
     def test_can_be_cancelled_true(self):
         """
         Test that can_be_cancelled returns True if there are more than 12 hours left.
@@ -291,6 +355,21 @@ class AppointmentViewsTest(TestCase):
 
         self.assertTrue(Appointment.objects.filter(id=app.id).exists())
 
+    def test_cancel_follows_the_notice_setting(self):
+        app = Appointment.objects.create(
+            user=self.user, worker=self.worker, service=self.service,
+            datetime=timezone.now() + timedelta(hours=2),
+        )
+
+        with mock.patch("appointments.views.CANCELLATION_NOTICE_HOURS", 3), \
+                mock.patch("appointments.models.CANCELLATION_NOTICE_HOURS", 3):
+            response = self.client.get(reverse("cancel_appointment", args=[app.id]), follow=True)
+        self.assertContains(response, "menos de 3 horas de antelación")
+
+        with mock.patch("appointments.models.CANCELLATION_NOTICE_HOURS", 1):
+            self.client.get(reverse("cancel_appointment", args=[app.id]))
+        self.assertFalse(Appointment.objects.filter(id=app.id).exists())
+
     def test_cancel_other_user_appointment(self):
         """
         Trying to cancel another user's appointment returns 404.
@@ -329,3 +408,1584 @@ class AppointmentViewsTest(TestCase):
         data = response.json()
 
         self.assertIn("slots", data)
+
+
+class SlotEngineTest(TestCase):
+
+    def setUp(self):
+        """
+        Two workers sharing the same specialty and the same Monday schedule.
+        """
+        cache.clear()
+        specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker_a = Worker.objects.create(name="Worker A")
+        self.worker_b = Worker.objects.create(name="Worker B")
+
+        for worker in (self.worker_a, self.worker_b):
+            worker.specialties.add(specialty)
+            Availability.objects.create(
+                worker=worker, day_of_week=0, start_time=time(9, 0), end_time=time(12, 0)
+            )
+
+        today = timezone.now().date()
+        self.next_monday = today + timedelta(days=(7 - today.weekday()))
+
+    def _slots(self):
+        response = self.client.get(
+            reverse("get_available_slots"),
+            {"service_id": self.service.id, "date": self.next_monday},
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(s["time_value"], s["worker_id"]) for s in response.json()["slots"]]
+
+    def test_booking_only_hides_the_booked_worker(self):
+        """
+        An appointment of worker A must not remove the slots of worker B.
+        """
+        Appointment.objects.create(
+            worker=self.worker_a,
+            service=self.service,
+            datetime=timezone.make_aware(datetime.combine(self.next_monday, time(10, 0))),
+            status=StatusChoices.CONFIRMED,
+        )
+
+        slots = self._slots()
+
+        self.assertNotIn(("10:00", self.worker_a.id), slots)
+        self.assertIn(("10:00", self.worker_b.id), slots)
+        self.assertEqual(len(slots), 5)
+
+    def test_partial_overlap_blocks_slot(self):
+        """
+        A 30 minute appointment at 10:30 blocks the 10:00 slot but not 09:00 or 11:00.
+        """
+        short_service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=30
+        )
+        Appointment.objects.create(
+            worker=self.worker_a,
+            service=short_service,
+            datetime=timezone.make_aware(datetime.combine(self.next_monday, time(10, 30))),
+        )
+
+        slots = self._slots()
+
+        self.assertIn(("09:00", self.worker_a.id), slots)
+        self.assertNotIn(("10:00", self.worker_a.id), slots)
+        self.assertIn(("11:00", self.worker_a.id), slots)
+
+    def test_cancelled_appointments_do_not_block(self):
+        Appointment.objects.create(
+            worker=self.worker_a,
+            service=self.service,
+            datetime=timezone.make_aware(datetime.combine(self.next_monday, time(9, 0))),
+            status=StatusChoices.CANCELLED,
+        )
+
+        self.assertIn(("09:00", self.worker_a.id), self._slots())
+
+    def test_slots_are_sorted_by_time(self):
+        times = [value for value, _ in self._slots()]
+        self.assertEqual(times, sorted(times))
+
+
+class AvailableDaysTest(TestCase):
+
+    def setUp(self):
+        specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.worker.specialties.add(specialty)
+
+        for day in range(7):
+            Availability.objects.create(
+                worker=self.worker, day_of_week=day, start_time=time(9, 0), end_time=time(11, 0)
+            )
+
+        today = timezone.now().date()
+        self.next_monday = today + timedelta(days=(7 - today.weekday()))
+
+    def test_days_summary(self):
+        """
+        Returns one entry per day with the free slot count and the first free time.
+        """
+        Appointment.objects.create(
+            worker=self.worker,
+            service=self.service,
+            datetime=timezone.make_aware(datetime.combine(self.next_monday, time(9, 0))),
+        )
+
+        response = self.client.get(
+            reverse("get_available_days"),
+            {
+                "service_id": self.service.id,
+                "from": self.next_monday,
+                "to": self.next_monday + timedelta(days=1),
+            },
+        )
+        days = response.json()["days"]
+
+        self.assertEqual(len(days), 2)
+        self.assertEqual(days[0]["date"], self.next_monday.isoformat())
+        self.assertEqual(days[0]["free_slots"], 1)
+        self.assertEqual(days[0]["first_time"], "10:00")
+        self.assertEqual(days[1]["free_slots"], 2)
+        self.assertEqual(days[1]["first_time"], "09:00")
+
+    def test_window_is_clamped_to_booking_limit(self):
+        today = timezone.now().date()
+        response = self.client.get(
+            reverse("get_available_days"),
+            {
+                "service_id": self.service.id,
+                "from": today - timedelta(days=10),
+                "to": today + timedelta(days=90),
+            },
+        )
+        days = response.json()["days"]
+
+        self.assertEqual(days[0]["date"], today.isoformat())
+        self.assertEqual(len(days), 31)
+
+    def test_query_count_does_not_depend_on_window(self):
+        """
+        Service, workers, full days, rules and appointments: five queries for
+        the whole range.
+        """
+        with self.assertNumQueries(5):
+            self.client.get(
+                reverse("get_available_days"),
+                {"service_id": self.service.id},
+            )
+
+    def test_missing_service(self):
+        response = self.client.get(reverse("get_available_days"))
+        self.assertEqual(response.status_code, 400)
+
+
+class SlotCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.worker.specialties.add(self.specialty)
+
+        for day in range(7):
+            Availability.objects.create(
+                worker=self.worker, day_of_week=day, start_time=time(9, 0), end_time=time(11, 0)
+            )
+
+        today = timezone.now().date()
+        self.day = today + timedelta(days=2)
+        self.other_day = today + timedelta(days=3)
+
+    def _slots(self, day):
+        response = self.client.get(
+            reverse("get_available_slots"),
+            {"service_id": self.service.id, "date": day},
+        )
+        return [s["time_value"] for s in response.json()["slots"]]
+
+    def test_second_request_is_served_from_cache(self):
+        """
+        Once computed, only the Service lookup and the slot holds hit the database.
+        """
+        self.assertEqual(self._slots(self.day), ["09:00", "10:00"])
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self._slots(self.day), ["09:00", "10:00"])
+
+    def test_booking_invalidates_only_its_worker_and_date(self):
+        self._slots(self.day)
+        self._slots(self.other_day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                worker=self.worker,
+                service=self.service,
+                datetime=timezone.make_aware(datetime.combine(self.day, time(9, 0))),
+            )
+
+        self.assertEqual(self._slots(self.day), ["10:00"])
+        with self.assertNumQueries(2):
+            self.assertEqual(self._slots(self.other_day), ["09:00", "10:00"])
+
+    def test_rescheduling_invalidates_old_date(self):
+        appointment = Appointment.objects.create(
+            worker=self.worker,
+            service=self.service,
+            datetime=timezone.make_aware(datetime.combine(self.day, time(9, 0))),
+        )
+        self.assertEqual(self._slots(self.day), ["10:00"])
+
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.datetime = timezone.make_aware(datetime.combine(self.other_day, time(9, 0)))
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+
+        self.assertEqual(self._slots(self.day), ["09:00", "10:00"])
+
+    def test_availability_change_invalidates(self):
+        self._slots(self.day)
+        with self.captureOnCommitCallbacks(execute=True):
+            Availability.objects.filter(worker=self.worker).delete()
+            Availability.objects.create(
+                worker=self.worker, day_of_week=self.day.weekday(), start_time=time(12, 0), end_time=time(13, 0)
+            )
+
+        self.assertEqual(self._slots(self.day), ["12:00"])
+
+    def test_counters_are_bumped_after_commit(self):
+        key = slot_cache._worker_day_key(self.worker.id, self.day)
+        self._slots(self.day)
+        before = cache.get(key)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Appointment.objects.create(
+                worker=self.worker,
+                service=self.service,
+                datetime=timezone.make_aware(datetime.combine(self.day, time(9, 0))),
+            )
+            # Until the booking commits, other requests still see the old counter.
+            self.assertEqual(cache.get(key), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(key), before)
+
+    def test_service_duration_change_invalidates_other_services(self):
+        other = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=30)
+        Appointment.objects.create(
+            worker=self.worker,
+            service=other,
+            datetime=timezone.make_aware(datetime.combine(self.day, time(9, 0))),
+        )
+        self.assertEqual(self._slots(self.day), ["10:00"])
+
+        # The 30 minute booking now lasts until 10:30 and takes the 10:00 slot too.
+        other.duration = 90
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+
+        self.assertEqual(self._slots(self.day), [])
+
+    def test_specialty_change_invalidates(self):
+        self._slots(self.day)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.worker.specialties.remove(self.specialty)
+
+        self.assertEqual(self._slots(self.day), [])
+
+
+class DayScheduleTest(TestCase):
+
+    def setUp(self):
+        self.day = timezone.now().date() + timedelta(days=1)
+        midnight = timezone.make_aware(datetime.combine(self.day, time.min))
+        self.schedule = DaySchedule.build(
+            self.day,
+            rules=[(time(9, 0), time(12, 0))],
+            appointments=[(midnight + timedelta(hours=10), midnight + timedelta(hours=10, minutes=30))],
+        )
+
+    def test_is_free(self):
+        self.assertTrue(self.schedule.is_free(9 * 60, 10 * 60))
+        self.assertFalse(self.schedule.is_free(9 * 60 + 45, 10 * 60 + 15))
+        self.assertTrue(self.schedule.is_free(10 * 60 + 30, 11 * 60))
+        self.assertFalse(self.schedule.is_free(11 * 60 + 30, 12 * 60 + 30))
+        self.assertTrue(self.schedule.is_free(11 * 60 + 30, 12 * 60 + 30, require_open=False))
+
+    def test_free_starts(self):
+        """
+        30 minute grid from 09:00: only 10:00 is taken.
+        """
+        starts = self.schedule.free_starts(30, step=30, start=9 * 60, end=12 * 60)
+        self.assertEqual(starts, [540, 570, 630, 660, 690])
+
+    def test_free_runs(self):
+        self.assertEqual(self.schedule.free_runs(), [(540, 600), (630, 720)])
+        self.assertEqual(DaySchedule().free_runs(), [])
+
+    def test_serialization_roundtrip(self):
+        data = self.schedule.to_bytes()
+        self.assertEqual(len(data), 362)
+        self.assertEqual(DaySchedule.from_bytes(data), self.schedule)
+
+        with self.assertRaises(ValueError):
+            DaySchedule.from_bytes(data[:-1])
+
+
+class OverlapMigrationTest(TestCase):
+    """
+    The overlap constraint's migration refuses to run over appointments that
+    already overlap (booked before it existed), listing them.
+    """
+
+    def setUp(self):
+        self.migration = importlib.import_module("appointments.migrations.0006_appointment_no_overlap")
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        self.start = timezone.now().replace(second=0, microsecond=0) + timedelta(days=2)
+
+    def _book(self, minutes, status=StatusChoices.CONFIRMED):
+        return Appointment.objects.create(
+            service=self.service, worker=self.worker, status=status,
+            datetime=self.start + timedelta(minutes=minutes), guest_first_name="Ana",
+        )
+
+    def test_lists_existing_overlaps(self):
+        first = self._book(0)
+        self._book(60)
+        self._book(30, status=StatusChoices.CANCELLED)
+        self.migration.check_overlaps(connection)
+
+        # Dropped inside the test's transaction, so they come back on rollback.
+        with connection.cursor() as cursor:
+            for statement in self.migration.SQLITE_BACKWARD:
+                cursor.execute(statement)
+        clash = self._book(30)
+
+        with self.assertRaisesMessage(CommandError, f"trabajador {self.worker.id}: cita {first.id} ("):
+            self.migration.check_overlaps(connection)
+        with self.assertRaisesMessage(CommandError, f"cita {clash.id}"):
+            self.migration.check_overlaps(connection)
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+
+    def setUp(self):
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=2)
+
+    def test_database_rejects_overlap(self):
+        """
+        Bypassing book_appointment, the database itself refuses the overlap.
+        """
+        Appointment.objects.create(worker=self.worker, service=self.service, datetime=self.start)
+
+        with self.assertRaises(IntegrityError):
+            Appointment.objects.create(
+                worker=self.worker,
+                service=self.service,
+                datetime=self.start + timedelta(minutes=30),
+            )
+
+    def test_parallel_bookings_of_one_slot(self):
+        """
+        N threads book the same slot at once: exactly one succeeds, the rest get
+        SlotTakenError (never a 500-style database error).
+        """
+        attempts = 8
+        barrier = threading.Barrier(attempts)
+        outcomes = []
+
+        def book():
+            try:
+                barrier.wait()
+                book_appointment(
+                    Appointment(worker=self.worker, service=self.service, datetime=self.start)
+                )
+                outcomes.append("ok")
+            except SlotTakenError:
+                outcomes.append("taken")
+            except Exception as error:
+                outcomes.append(repr(error))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(attempts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count("ok"), 1, outcomes)
+        self.assertEqual(outcomes.count("taken"), attempts - 1, outcomes)
+        self.assertEqual(Appointment.objects.filter(worker=self.worker).count(), 1)
+
+
+class SlotHoldTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.worker.specialties.add(specialty)
+        self.day = timezone.now().date() + timedelta(days=2)
+        Availability.objects.create(
+            worker=self.worker, day_of_week=self.day.weekday(), start_time=time(9, 0), end_time=time(11, 0)
+        )
+        self.other_client = Client()
+
+    def _hold(self, client, slot_time="09:00"):
+        return client.post(
+            reverse("hold_slot"),
+            {"service_id": self.service.id, "date": self.day, "time": slot_time, "worker_id": self.worker.id},
+        )
+
+    def _slots(self, client):
+        response = client.get(
+            reverse("get_available_slots"), {"service_id": self.service.id, "date": self.day}
+        )
+        return [s["time_value"] for s in response.json()["slots"]]
+
+    def test_hold_hides_slot_from_other_sessions_only(self):
+        self.assertEqual(self._hold(self.client).status_code, 200)
+
+        self.assertEqual(self._slots(self.client), ["09:00", "10:00"])
+        self.assertEqual(self._slots(self.other_client), ["10:00"])
+
+    def test_only_offered_slots_can_be_held(self):
+        # Outside the worker's hours and off the slot grid.
+        self.assertEqual(self._hold(self.client, "15:00").status_code, 409)
+        self.assertEqual(self._hold(self.client, "09:30").status_code, 409)
+
+        # A worker who does not offer the service.
+        other = Worker.objects.create(name="Sin especialidad")
+        Availability.objects.create(
+            worker=other, day_of_week=self.day.weekday(), start_time=time(9, 0), end_time=time(11, 0)
+        )
+        response = self.client.post(
+            reverse("hold_slot"),
+            {"service_id": self.service.id, "date": self.day, "time": "09:00", "worker_id": other.id},
+        )
+        self.assertEqual(response.status_code, 409)
+
+        # Beyond the booking window.
+        far = self.day + timedelta(weeks=6)
+        response = self.client.post(
+            reverse("hold_slot"),
+            {"service_id": self.service.id, "date": far, "time": "09:00", "worker_id": self.worker.id},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_held_slot_cannot_be_held_again(self):
+        self._hold(self.client)
+        self.assertEqual(self._hold(self.other_client).status_code, 409)
+
+    def test_new_hold_replaces_previous_one(self):
+        self._hold(self.client, "09:00")
+        self._hold(self.client, "10:00")
+
+        self.assertEqual(SlotHold.objects.count(), 1)
+        self.assertEqual(self._slots(self.other_client), ["09:00"])
+
+    def test_expired_holds_are_ignored_and_purged(self):
+        self._hold(self.client)
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self._slots(self.other_client), ["09:00", "10:00"])
+        self.assertEqual(self._hold(self.other_client).status_code, 200)
+        self.assertEqual(SlotHold.objects.count(), 1)
+
+    def test_booking_consumes_hold(self):
+        self._hold(self.client)
+        response = self.client.post(
+            reverse("create_appointment"),
+            {
+                "service": self.service.id,
+                "date": self.day,
+                "time": "09:00",
+                "worker_id": self.worker.id,
+                "guest_first_name": "Ana",
+                "guest_email": "ana@example.com",
+                "guest_phone": "+34 600111222",
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Appointment.objects.filter(worker=self.worker).exists())
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_other_session_cannot_book_held_slot(self):
+        self._hold(self.client)
+        response = self.other_client.post(
+            reverse("create_appointment"),
+            {
+                "service": self.service.id,
+                "date": self.day,
+                "time": "09:00",
+                "worker_id": self.worker.id,
+                "guest_first_name": "Luis",
+                "guest_email": "luis@example.com",
+                "guest_phone": "+34 600333444",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Appointment.objects.exists())
+
+
+class AsyncSlotsEndpointTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker_a = Worker.objects.create(name="Worker A")
+        self.worker_b = Worker.objects.create(name="Worker B")
+
+        for worker in (self.worker_a, self.worker_b):
+            worker.specialties.add(specialty)
+            Availability.objects.create(
+                worker=worker, day_of_week=0, start_time=time(9, 0), end_time=time(12, 0)
+            )
+
+        today = timezone.now().date()
+        self.next_monday = today + timedelta(days=(7 - today.weekday()))
+        Appointment.objects.create(
+            service=self.service,
+            worker=self.worker_a,
+            datetime=timezone.make_aware(datetime.combine(self.next_monday, time(10, 30))),
+            guest_first_name="Ana",
+        )
+        SlotHold.objects.create(
+            worker=self.worker_b,
+            service=self.service,
+            datetime=timezone.make_aware(datetime.combine(self.next_monday, time(9, 0))),
+            end_datetime=timezone.make_aware(datetime.combine(self.next_monday, time(10, 0))),
+            session_key="other-session",
+            expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        self.params = {"service_id": self.service.id, "date": self.next_monday}
+
+    def _async_get(self, params):
+        return async_to_sync(self.async_client.get)(reverse("aget_available_slots"), params)
+
+    def test_async_matches_sync(self):
+        """
+        Both endpoints apply the same bookings and holds, whichever fills the cache.
+        """
+        response = self._async_get(self.params)
+        self.assertEqual(response.status_code, 200)
+        async_slots = response.json()["slots"]
+
+        cache.clear()
+        sync_slots = self.client.get(reverse("get_available_slots"), self.params).json()["slots"]
+
+        self.assertEqual(async_slots, sync_slots)
+        self.assertEqual(
+            [(s["time_value"], s["worker_id"]) for s in async_slots],
+            [
+                ("09:00", self.worker_a.id),
+                ("10:00", self.worker_b.id),
+                ("11:00", self.worker_b.id),
+            ],
+        )
+
+    def test_async_sees_sync_invalidations(self):
+        self.client.get(reverse("get_available_slots"), self.params)
+        with self.captureOnCommitCallbacks(execute=True):
+            Availability.objects.filter(worker=self.worker_a).delete()
+
+        response = self._async_get(self.params)
+
+        self.assertNotIn(self.worker_a.id, {s["worker_id"] for s in response.json()["slots"]})
+
+    async def test_bad_parameters(self):
+        response = await self.async_client.get(reverse("aget_available_slots"))
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.async_client.get(
+            reverse("aget_available_slots"), {"service_id": 999, "date": self.next_monday}
+        )
+        self.assertEqual(response.json(), {"slots": []})
+
+
+class OccupancyTest(TestCase):
+
+    def setUp(self):
+        """
+        Two workers available from 09:00 to 12:00 every day, one 60 minute service.
+        """
+        specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker_a = Worker.objects.create(name="Worker A")
+        self.worker_b = Worker.objects.create(name="Worker B")
+        for worker in (self.worker_a, self.worker_b):
+            worker.specialties.add(specialty)
+            for day in range(7):
+                Availability.objects.create(
+                    worker=worker, day_of_week=day, start_time=time(9, 0), end_time=time(12, 0)
+                )
+
+        today = timezone.now().date()
+        self.day = today + timedelta(days=2)
+        self.other_day = today + timedelta(days=3)
+
+    def _book(self, hour, day=None, worker=None):
+        return Appointment.objects.create(
+            service=self.service,
+            worker=worker or self.worker_a,
+            datetime=timezone.make_aware(datetime.combine(day or self.day, time(hour, 0))),
+            guest_first_name="Ana",
+        )
+
+    def _row(self, day=None, worker=None):
+        return WorkerDayOccupancy.objects.filter(worker=worker or self.worker_a, date=day or self.day).first()
+
+    def test_booking_updates_row(self):
+        self._book(10)
+
+        row = self._row()
+        self.assertEqual(row.booked_minutes, 60)
+        self.assertEqual(row.open_minutes, 180)
+        self.assertEqual(row.longest_free, 60)
+        self.assertEqual(row.free_intervals, [[540, 600], [660, 720]])
+        self.assertEqual(row.utilisation, 33)
+        self.assertIsNone(self._row(worker=self.worker_b))
+
+    def test_reschedule_and_cancel(self):
+        appointment = self._book(10)
+
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.datetime = timezone.make_aware(datetime.combine(self.other_day, time(9, 0)))
+        appointment.save()
+        self.assertIsNone(self._row())
+        self.assertEqual(self._row(day=self.other_day).booked_minutes, 60)
+
+        appointment.status = StatusChoices.CANCELLED
+        appointment.save()
+        self.assertFalse(WorkerDayOccupancy.objects.exists())
+
+    def test_availability_and_service_changes(self):
+        self._book(10)
+
+        Availability.objects.filter(worker=self.worker_a, day_of_week=self.day.weekday()).update(
+            end_time=time(13, 0)
+        )
+        Availability.objects.filter(worker=self.worker_a, day_of_week=self.day.weekday()).first().save()
+        self.assertEqual(self._row().open_minutes, 240)
+
+        self.service.duration = 90
+        self.service.save()
+        self.assertEqual(self._row().booked_minutes, 90)
+
+    def test_full_days_are_skipped(self):
+        for hour in (9, 10, 11):
+            self._book(hour)
+        self.assertEqual(self._row().longest_free, 0)
+
+        slots = available_slots(self.service, self.day)
+        self.assertEqual({slot["worker_id"] for slot in slots}, {self.worker_b.id})
+
+        # The engine trusts the table: a full row hides the worker's day.
+        WorkerDayOccupancy.objects.create(worker=self.worker_b, date=self.day, open_minutes=180)
+        with self.assertNumQueries(2):
+            self.assertEqual(available_slots(self.service, self.day), [])
+
+    def test_rebuild_command(self):
+        self._book(10)
+        self._book(9, day=self.other_day, worker=self.worker_b)
+        WorkerDayOccupancy.objects.all().delete()
+
+        call_command("rebuild_occupancy", stdout=StringIO())
+
+        self.assertEqual(self._row().booked_minutes, 60)
+        self.assertEqual(self._row(day=self.other_day, worker=self.worker_b).booked_minutes, 60)
+
+    def test_deleting_worker_with_appointments(self):
+        self._book(10)
+        self.worker_a.delete()
+
+        self.assertFalse(WorkerDayOccupancy.objects.exists())
+
+
+class ConflictDetectionTest(TestCase):
+
+    def setUp(self):
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.day = timezone.now().date() + timedelta(days=2)
+        self.first = self._book(10)
+        self.second = self._book(12)
+
+    def _at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def _book(self, hour):
+        return Appointment.objects.create(
+            service=self.service, worker=self.worker, datetime=self._at(hour), guest_first_name="Ana"
+        )
+
+    def _modify(self, appointment, hour, minute=0):
+        return self.client.post(
+            reverse("modify_appointment", args=[appointment.pk]),
+            {
+                "service": self.service.id,
+                "worker": self.worker.id,
+                "date": self.day,
+                "time": f"{hour:02d}:{minute:02d}",
+                "guest_first_name": "Ana",
+            },
+        )
+
+    def test_find_conflicts_answers_every_interval_with_one_query(self):
+        hour = timedelta(hours=1)
+        candidates = [(self._at(h), self._at(h) + hour) for h in (9, 10, 11, 12, 13)]
+
+        with self.assertNumQueries(1):
+            conflicts = find_conflicts(self.worker.id, candidates)
+
+        self.assertEqual(conflicts, [candidates[1], candidates[3]])
+        self.assertEqual(find_conflicts(self.worker.id, []), [])
+        self.assertEqual(
+            find_conflicts(self.worker.id, candidates, exclude_id=self.first.pk), [candidates[3]]
+        )
+
+    def test_admin_cannot_move_onto_another_appointment(self):
+        response = self._modify(self.first, 11, 30)
+
+        self.assertEqual(response.status_code, 302)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.datetime, self._at(10))
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertIn(SLOT_TAKEN_MESSAGE, messages)
+
+    def test_longer_service_cannot_make_appointments_overlap(self):
+        # 10:00 and 12:00 still fit back to back at two hours.
+        form = ServiceForm({"name": self.service.name, "duration": 120}, instance=self.service)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        form = ServiceForm({"name": self.service.name, "duration": 150}, instance=self.service)
+        self.assertFalse(form.is_valid())
+        self.assertIn(timezone.localtime(self._at(10)).strftime("%d/%m/%Y %H:%M"), form.errors["duration"][0])
+
+        self.service.duration = 150
+        with self.assertRaises(ValidationError):
+            self.service.save()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.end_datetime, self._at(11))
+
+        # Cancelled appointments do not block the change.
+        Appointment.objects.filter(pk=self.second.pk).update(status=StatusChoices.CANCELLED)
+        self.service.save()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.end_datetime, self._at(12, 30))
+
+    def test_admin_can_shift_within_its_own_slot(self):
+        self._modify(self.first, 10, 30)
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.datetime, self._at(10, 30))
+
+
+class AppointmentSeriesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            password="password",
+            email="test@example.com",
+            phone_number="+34 600111222",
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        specialty = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.worker.specialties.add(specialty)
+        # Tuesdays, the weekday of every occurrence.
+        Availability.objects.create(worker=self.worker, day_of_week=1, start_time=time(9, 0), end_time=time(13, 0))
+        self.client.login(username="testuser", password="password")
+
+        today = timezone.now().date()
+        self.first_day = today + timedelta(days=(1 - today.weekday()) % 7 or 7)
+
+    def _post(self, occurrences=8, **data):
+        return self.client.post(
+            reverse("create_series"),
+            {
+                "service": self.service.id,
+                "worker": self.worker.id,
+                "date": self.first_day,
+                "time": "10:00",
+                "occurrences": occurrences,
+                "interval_weeks": 1,
+                **data,
+            },
+        )
+
+    def _series(self, occurrences):
+        return AppointmentSeries(
+            user=self.user,
+            worker=self.worker,
+            service=self.service,
+            first_datetime=timezone.make_aware(datetime.combine(self.first_day, time(10, 0))),
+            occurrences=occurrences,
+        )
+
+    def test_weekly_series_is_created(self):
+        response = self._post()
+
+        self.assertRedirects(response, reverse("upcoming_appointments"))
+        series = AppointmentSeries.objects.get()
+        appointments = list(series.appointments.order_by("datetime"))
+        self.assertEqual(len(appointments), 8)
+        for week, appointment in enumerate(appointments):
+            local = timezone.localtime(appointment.datetime)
+            self.assertEqual(local.date(), self.first_day + timedelta(weeks=week))
+            self.assertEqual(local.time(), time(10, 0))
+            self.assertEqual(appointment.end_datetime, appointment.datetime + timedelta(minutes=60))
+            self.assertEqual(appointment.user, self.user)
+
+        # bulk_create skips signals: occupancy was refreshed by hand.
+        self.assertEqual(WorkerDayOccupancy.objects.filter(worker=self.worker).count(), 8)
+        # One email and one SMS for the whole series.
+        self.assertEqual(NotificationOutbox.objects.filter(appointment=appointments[0]).count(), 2)
+
+    def test_query_count_does_not_depend_on_length(self):
+        """
+        One conflict query and one insert for the whole series (both series fit
+        in one occupancy refresh batch).
+        """
+        with CaptureQueriesContext(connection) as short:
+            book_series(self._series(2))
+        Appointment.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as long:
+            book_series(self._series(5))
+
+        self.assertEqual(len(short), len(long))
+
+    def test_one_conflict_rejects_the_whole_series(self):
+        Appointment.objects.create(
+            service=self.service,
+            worker=self.worker,
+            datetime=timezone.make_aware(
+                datetime.combine(self.first_day + timedelta(weeks=3), time(10, 30))
+            ),
+            guest_first_name="Ana",
+        )
+
+        response = self._post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertContains(response, (self.first_day + timedelta(weeks=3)).strftime("%d/%m/%Y"))
+
+        with self.assertRaises(SlotTakenError):
+            book_series(self._series(8))
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+    def test_occurrences_must_be_offered_slots(self):
+        # Outside the worker's hours.
+        response = self._post(time="18:00")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "fuera del horario disponible")
+
+        # Off the slot grid (09:00, 10:00, ... for a 60 minute service).
+        response = self._post(time="10:30")
+        self.assertContains(response, "fuera del horario disponible")
+
+        # A worker who does not offer the service.
+        other = Worker.objects.create(name="Sin especialidad")
+        Availability.objects.create(worker=other, day_of_week=1, start_time=time(9, 0), end_time=time(13, 0))
+        response = self._post(worker=other.id)
+        self.assertContains(response, "no ofrece este servicio")
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+    def test_booking_window_is_per_series(self):
+        response = self._post(occurrences=20)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Appointment.objects.exists())
+
+        # Clients cannot widen it; admins can.
+        self._post(occurrences=20, booking_window_days=200)
+        self.assertFalse(Appointment.objects.exists())
+
+        self.user.role = User.Role.ADMIN
+        self.user.save()
+        self._post(occurrences=20, booking_window_days=200)
+        self.assertEqual(AppointmentSeries.objects.get().booking_window_days, 200)
+        self.assertEqual(Appointment.objects.count(), 20)
+
+
+class FailingSMSBackend(sms.BaseSMSBackend):
+    async def send(self, to, body):
+        raise ConnectionError("Twilio no responde")
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    """
+    locmem backend that counts the connections opened, like SMTP logins.
+    """
+
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+class DroppingEmailBackend(CountingEmailBackend):
+    """
+    Drops the connection on the first message it is given.
+    """
+
+    dropped = False
+
+    def send_messages(self, email_messages):
+        if not DroppingEmailBackend.dropped:
+            DroppingEmailBackend.dropped = True
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(email_messages)
+
+
+@override_settings(SMS_BACKEND="appointments.sms.LocMemBackend", NOTIFICATION_RETRY_BASE_SECONDS=60)
+class NotificationOutboxTest(TestCase):
+
+    def setUp(self):
+        sms.outbox.clear()
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.day = timezone.now().date() + timedelta(days=2)
+
+    def _book(self, hour=10):
+        return self.client.post(
+            reverse("create_appointment"),
+            {
+                "service": self.service.id,
+                "date": self.day,
+                "time": f"{hour:02d}:00",
+                "worker_id": self.worker.id,
+                "guest_first_name": "Luis",
+                "guest_email": "luis@example.com",
+                "guest_phone": "+34 600333444",
+            },
+        )
+
+    def _queue(self, count):
+        return NotificationOutbox.objects.bulk_create(
+            NotificationOutbox(channel=NotificationOutbox.Channel.SMS, recipient="+34 600333444", body=str(i))
+            for i in range(count)
+        )
+
+    def test_booking_queues_instead_of_sending(self):
+        self._book()
+
+        appointment = Appointment.objects.get()
+        queued = NotificationOutbox.objects.filter(appointment=appointment)
+        self.assertEqual(
+            sorted(queued.values_list("channel", flat=True)),
+            [NotificationOutbox.Channel.EMAIL, NotificationOutbox.Channel.SMS],
+        )
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(sms.outbox, [])
+
+    def test_rejected_booking_queues_nothing(self):
+        self._book()
+        with self.assertRaises(SlotTakenError), transaction.atomic():
+            book_appointment(
+                Appointment(
+                    service=self.service,
+                    worker=self.worker,
+                    datetime=timezone.make_aware(datetime.combine(self.day, time(10, 30))),
+                )
+            )
+
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+    def test_worker_delivers_queued_messages(self):
+        self._book()
+
+        call_command("run_notifications", "--once", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["luis@example.com"])
+        self.assertEqual(sms.outbox[0]["to"], "+34 600333444")
+        self.assertFalse(NotificationOutbox.objects.exclude(status=NotificationOutbox.Status.SENT).exists())
+
+    @override_settings(SMS_BACKEND="appointments.tests.FailingSMSBackend", NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failures_are_retried_with_backoff(self):
+        message = self._queue(1)[0]
+
+        before = timezone.now()
+        self.assertEqual(run_once(), 1)
+        message.refresh_from_db()
+        self.assertEqual(message.status, NotificationOutbox.Status.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn("Twilio no responde", message.last_error)
+        self.assertGreaterEqual(message.next_attempt_at, before + timedelta(seconds=60))
+
+        # Not due yet.
+        self.assertEqual(run_once(), 0)
+
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        run_once()
+        message.refresh_from_db()
+        self.assertEqual(message.status, NotificationOutbox.Status.FAILED)
+        self.assertEqual(message.attempts, 2)
+
+    def test_retry_delay_doubles(self):
+        self.assertEqual([retry_delay(n) for n in (1, 2, 3)], [60, 120, 240])
+        self.assertEqual(retry_delay(20), 60 * 60)
+
+    def test_claims_do_not_overlap(self):
+        self._queue(5)
+
+        first = claim_batch(3)
+        second = claim_batch(3)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({m.pk for m in first} & {m.pk for m in second})
+        self.assertEqual(claim_batch(3), [])
+
+    def test_expired_claims_are_taken_again(self):
+        self._queue(1)
+        claim_batch(1)
+        NotificationOutbox.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(len(claim_batch(1)), 1)
+
+    def _queue_emails(self, count):
+        return NotificationOutbox.objects.bulk_create(
+            NotificationOutbox(
+                channel=NotificationOutbox.Channel.EMAIL, recipient=f"c{i}@example.com", subject="Cita", body=str(i)
+            )
+            for i in range(count)
+        )
+
+    @override_settings(EMAIL_BACKEND="appointments.tests.CountingEmailBackend", EMAIL_BATCH_SIZE=10)
+    def test_emails_share_one_connection(self):
+        CountingEmailBackend.opened = 0
+        self._queue_emails(25)
+
+        with Dispatcher() as dispatcher:
+            while run_once(batch_size=10, dispatcher=dispatcher, flush=True):
+                pass
+
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    @override_settings(EMAIL_BACKEND="appointments.tests.DroppingEmailBackend")
+    def test_dropped_connection_is_reopened(self):
+        CountingEmailBackend.opened = 0
+        DroppingEmailBackend.dropped = False
+        self._queue_emails(3)
+
+        with Dispatcher() as dispatcher:
+            run_once(dispatcher=dispatcher, flush=True)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(CountingEmailBackend.opened, 2)
+        self.assertFalse(NotificationOutbox.objects.exclude(status=NotificationOutbox.Status.SENT).exists())
+
+    @override_settings(EMAIL_BATCH_SIZE=3, EMAIL_FLUSH_INTERVAL=60)
+    def test_emails_wait_for_a_full_batch(self):
+        self._queue_emails(2)
+        self._queue(1)
+
+        # SMS go out at once; two fresh emails wait for a third or for the interval.
+        self.assertEqual([m.channel for m in claim_batch(10)], [NotificationOutbox.Channel.SMS])
+
+        self._queue_emails(1)
+        self.assertEqual(len(claim_batch(10)), 3)
+
+    @override_settings(EMAIL_BATCH_SIZE=3, EMAIL_FLUSH_INTERVAL=60)
+    def test_old_emails_are_flushed(self):
+        self._queue_emails(1)
+        self.assertEqual(claim_batch(10), [])
+        self.assertEqual(len(claim_batch(10, flush=True)), 1)
+
+        self._queue_emails(1)
+        NotificationOutbox.objects.filter(claimed_by="").update(next_attempt_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(len(claim_batch(10)), 1)
+
+
+class StubTwilioHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for the Twilio Messages endpoint. Bodies containing "fallo" get a 500.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.client_ports.add(self.client_address[1])
+
+        length = int(self.headers["Content-Length"])
+        form = parse_qs(self.rfile.read(length).decode())
+        time_module.sleep(0.05)
+
+        with server.lock:
+            server.in_flight -= 1
+            server.received.append((self.path, self.headers["Authorization"], form))
+
+        status = 500 if "fallo" in form["Body"][0] else 201
+        payload = json.dumps({"sid": "SM123"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TwilioBackendTest(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubTwilioHandler)
+        self.server.lock = threading.Lock()
+        self.server.in_flight = self.server.max_in_flight = 0
+        self.server.client_ports = set()
+        self.server.received = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings_override = override_settings(
+            SMS_BACKEND="appointments.sms.TwilioBackend",
+            TWILIO_API_URL=f"http://127.0.0.1:{self.server.server_address[1]}",
+            TWILIO_ACCOUNT_SID="AC123",
+            TWILIO_AUTH_TOKEN="secreto",
+            TWILIO_PHONE_NUMBER="+34 900000000",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _messages(self, bodies):
+        return [
+            NotificationOutbox(pk=index, channel=NotificationOutbox.Channel.SMS, recipient="+34 600333444", body=body)
+            for index, body in enumerate(bodies, start=1)
+        ]
+
+    def test_concurrent_sends_share_a_bounded_pool(self):
+        with Dispatcher(concurrency=3) as dispatcher:
+            errors = dispatcher.send(self._messages([f"Cita {i}" for i in range(12)]))
+
+        self.assertEqual(errors, [None] * 12)
+        self.assertEqual(len(self.server.received), 12)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertGreater(self.server.max_in_flight, 1)
+        # Keep-alive: at most one connection per concurrent slot.
+        self.assertLessEqual(len(self.server.client_ports), 3)
+
+        path, authorization, form = self.server.received[0]
+        self.assertEqual(path, "/2010-04-01/Accounts/AC123/Messages.json")
+        self.assertTrue(authorization.startswith("Basic "))
+        self.assertEqual(form["From"], ["+34 900000000"])
+        self.assertEqual(form["To"], ["+34 600333444"])
+
+    def test_http_errors_are_reported_per_message(self):
+        with Dispatcher(concurrency=2) as dispatcher:
+            errors = dispatcher.send(self._messages(["ok", "fallo", "ok"]))
+
+        self.assertIsNone(errors[0])
+        self.assertIn("500", errors[1])
+        self.assertIsNone(errors[2])
+
+    def test_worker_uses_the_stub(self):
+        NotificationOutbox.objects.create(
+            channel=NotificationOutbox.Channel.SMS, recipient="+34 600333444", body="Hola"
+        )
+
+        call_command("run_notifications", "--once", stdout=StringIO())
+
+        self.assertEqual(len(self.server.received), 1)
+        self.assertEqual(NotificationOutbox.objects.get().status, NotificationOutbox.Status.SENT)
+
+
+class ReminderTest(TestCase):
+
+    def setUp(self):
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.user = User.objects.create_user(
+            username="recordado", password="pass", email="recordado@example.com", first_name="Ana"
+        )
+
+    def _appointment(self, hours_ahead, **fields):
+        fields.setdefault("user", self.user)
+        return Appointment.objects.create(
+            service=self.service,
+            worker=self.worker,
+            datetime=timezone.now() + timedelta(hours=hours_ahead),
+            **fields,
+        )
+
+    def test_only_due_appointments_are_reminded(self):
+        due = self._appointment(20)
+        self._appointment(30)
+        self._appointment(-2)
+        self._appointment(5, status=StatusChoices.CANCELLED)
+
+        self.assertEqual(send_reminders(24), 1)
+
+        reminders = NotificationOutbox.objects.all()
+        self.assertEqual(len(reminders), 1)
+        self.assertEqual(reminders[0].appointment, due)
+        self.assertEqual(reminders[0].recipient, "recordado@example.com")
+        self.assertIn("Recordatorio", reminders[0].subject)
+        self.assertIn("puedes cancelarla hasta", reminders[0].body)
+
+    def test_runs_are_idempotent(self):
+        self._appointment(20)
+
+        send_reminders(24)
+        self.assertEqual(send_reminders(24), 0)
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        self.assertIsNotNone(Appointment.objects.get().reminder_sent_at)
+
+    def test_late_reminder_states_cancellation_is_closed(self):
+        self._appointment(
+            6, user=None, guest_first_name="Luis", guest_email="luis@example.com", guest_phone="+34 600333444"
+        )
+
+        send_reminders(24)
+
+        sms_reminder = NotificationOutbox.objects.get(channel=NotificationOutbox.Channel.SMS)
+        self.assertIn("Ya no es posible cancelarla", sms_reminder.body)
+
+    def test_streams_in_chunks(self):
+        for hour in range(7):
+            self._appointment(2 + hour)
+
+        # 1 read of the ids + 4 chunks of (UPDATE, read, insert) + savepoint handling.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(send_reminders(24, chunk_size=2), 7)
+
+        self.assertEqual(NotificationOutbox.objects.count(), 7)
+        self.assertLess(len(queries), 16)
+        # Stamped rows are read back by primary key, never by reminder_sent_at alone.
+        read_backs = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT") and '"reminder_sent_at" = ' in query["sql"]
+        ]
+        self.assertEqual(len(read_backs), 4)
+        self.assertTrue(all('"appointments_appointment"."id" IN (' in sql for sql in read_backs))
+
+    def test_rescheduling_clears_the_reminder(self):
+        appointment = self._appointment(20)
+        send_reminders(24)
+
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.datetime += timedelta(days=7)
+        appointment.save()
+
+        appointment.refresh_from_db()
+        self.assertIsNone(appointment.reminder_sent_at)
+
+    def test_command(self):
+        self._appointment(20)
+        out = StringIO()
+
+        call_command("send_reminders", "--hours", "24", stdout=out)
+
+        self.assertIn("1 citas", out.getvalue())
+
+
+class CompletePastAppointmentsTest(TestCase):
+
+    def setUp(self):
+        self.service = Service.objects.create(
+            name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60
+        )
+        self.worker = Worker.objects.create(name="Worker Test")
+
+    def _appointment(self, hours_ago, status=StatusChoices.CONFIRMED):
+        return Appointment.objects.create(
+            service=self.service,
+            worker=self.worker,
+            datetime=timezone.now().replace(second=0, microsecond=0) - timedelta(hours=hours_ago),
+            status=status,
+        )
+
+    def test_only_ended_active_appointments_are_completed(self):
+        ended = self._appointment(3)
+        pending = self._appointment(5, status=StatusChoices.PENDING)
+        ongoing = self._appointment(0.5)
+        upcoming = self._appointment(-5)
+        cancelled = self._appointment(8, status=StatusChoices.CANCELLED)
+
+        self.assertEqual(complete_past_appointments(), 2)
+
+        statuses = dict(Appointment.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[ended.pk], StatusChoices.COMPLETED)
+        self.assertEqual(statuses[pending.pk], StatusChoices.COMPLETED)
+        self.assertEqual(statuses[ongoing.pk], StatusChoices.CONFIRMED)
+        self.assertEqual(statuses[upcoming.pk], StatusChoices.CONFIRMED)
+        self.assertEqual(statuses[cancelled.pk], StatusChoices.CANCELLED)
+
+    def test_runs_in_batches(self):
+        for hours_ago in range(3, 8):
+            self._appointment(hours_ago * 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(complete_past_appointments(batch_size=2), 5)
+
+        updates = [q for q in queries if q["sql"].startswith("UPDATE") and "appointments_appointment" in q["sql"]]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(complete_past_appointments(batch_size=2), 0)
+
+    def test_invalidates_slot_cache_and_keeps_occupancy(self):
+        appointment = self._appointment(3)
+        day = timezone.localtime(appointment.datetime).date()
+        key = slot_cache._worker_day_key(self.worker.id, day)
+        before = cache.get(key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            complete_past_appointments()
+
+        self.assertNotEqual(cache.get(key), before)
+        # Completed time still counts as used time.
+        booked = WorkerDayOccupancy.objects.filter(worker=self.worker).values_list("booked_minutes", flat=True)
+        self.assertEqual(sum(booked), 60)
+
+    def test_command(self):
+        self._appointment(3)
+        out = StringIO()
+
+        call_command("complete_past_appointments", stdout=out)
+
+        self.assertIn("Citas completadas: 1", out.getvalue())
+
+
+class AdminLookupTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="admin", password="pass", email="admin@example.com",
+            phone_number="+34 600000000", role=User.Role.ADMIN,
+        )
+        self.client.force_login(self.admin)
+        self.clients = User.objects.bulk_create(
+            User(
+                username=f"cliente{i:02d}", email=f"cliente{i:02d}@example.com",
+                phone_number=f"+34 6110000{i:02d}", first_name="María" if i % 2 else "Pedro", last_name="Ruiz",
+            )
+            for i in range(25)
+        )
+
+    def _lookup(self, kind, **params):
+        return self.client.get(reverse("admin_lookup", args=[kind]), params)
+
+    def test_requires_admin(self):
+        self.client.logout()
+        self.assertEqual(self._lookup("clients").status_code, 302)
+
+    def test_clients_prefix_search(self):
+        data = self._lookup("clients", q="mar").json()
+        self.assertEqual(len(data["results"]), 12)
+        self.assertTrue(all(item["label"] == "María Ruiz" for item in data["results"]))
+
+        self.assertEqual(self._lookup("clients", q="CLIENTE07@").json()["results"][0]["id"], self.clients[7].id)
+        self.assertEqual(self._lookup("clients", q="+34 611000024").json()["results"][0]["id"], self.clients[24].id)
+        # Prefix, not substring; admins are not clients.
+        self.assertEqual(self._lookup("clients", q="uiz").json()["results"], [])
+        self.assertEqual(self._lookup("clients", q="admin").json()["results"], [])
+
+    def test_keyset_pagination(self):
+        first = self._lookup("clients").json()
+        self.assertEqual(len(first["results"]), 20)
+        self.assertEqual(first["next"], first["results"][-1]["id"])
+
+        second = self._lookup("clients", after=first["next"]).json()
+        self.assertEqual(len(second["results"]), 5)
+        self.assertIsNone(second["next"])
+        ids = [item["id"] for item in first["results"] + second["results"]]
+        self.assertEqual(ids, [client.id for client in self.clients])
+
+    def test_page_costs_the_same_queries(self):
+        # Session, admin user, one page.
+        with self.assertNumQueries(3):
+            self._lookup("clients", q="c")
+        with self.assertNumQueries(3):
+            self._lookup("clients", after=self.clients[10].id)
+
+    def test_services_and_workers(self):
+        massage = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        Service.objects.create(name=TypeChoices.NUTRITIONAL_ADVICE, duration=30)
+        worker = Worker.objects.create(name="Lucía Gómez")
+        Worker.objects.create(name="Ana Pérez")
+
+        services = self._lookup("services", q="mas").json()["results"]
+        self.assertEqual([item["id"] for item in services], [massage.id])
+        workers = self._lookup("workers", q="LUC").json()["results"]
+        self.assertEqual(workers, [{"id": worker.id, "label": "Lucía Gómez"}])
+
+    def test_prefix_ending_in_the_last_code_point(self):
+        self.assertEqual(prefix_range("ab\U0010ffff"), ("ab\U0010ffff", "ac"))
+        self.assertEqual(prefix_range("\U0010ffff"), ("\U0010ffff", None))
+
+        Worker.objects.create(name="Ana\U0010ffffz")
+        for q in ("ana\U0010ffff", "\U0010ffff"):
+            response = self._lookup("workers", q=q)
+            self.assertEqual(response.status_code, 200)
+        results = self._lookup("workers", q="ana\U0010ffff").json()["results"]
+        self.assertEqual([row["label"] for row in results], ["Ana\U0010ffffz"])
+
+    def test_unknown_kind_and_bad_cursor(self):
+        self.assertEqual(self._lookup("appointments").status_code, 404)
+        self.assertEqual(self._lookup("clients", after="x").status_code, 400)
+
+    def test_admin_form_renders_only_selected_choices(self):
+        service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        worker = Worker.objects.create(name="Worker Test")
+        appointment = Appointment.objects.create(
+            user=self.clients[3], service=service, worker=worker, datetime=timezone.now() + timedelta(days=1)
+        )
+
+        html = AdminAppointmentForm(instance=appointment).as_p()
+
+        self.assertIn(f'value="{self.clients[3].id}" selected', html)
+        self.assertNotIn(f'value="{self.clients[4].id}"', html)
+        self.assertIn(reverse("admin_lookup", args=["clients"]), html)
+
+
+class EventHubTest(TestCase):
+
+    def _run(self, coroutine):
+        return async_to_sync(coroutine)()
+
+    def test_events_reach_every_subscriber(self):
+        async def scenario():
+            hub = events.Hub()
+            first, second = hub.subscribe(), hub.subscribe()
+            hub.publish({"type": "created", "id": 1})
+            received = [await asyncio.wait_for(s.get(), 1) for s in (first, second)]
+            hub.unsubscribe(first)
+            return received, len(hub)
+
+        received, remaining = self._run(scenario)
+        self.assertEqual(received, [{"type": "created", "id": 1}] * 2)
+        self.assertEqual(remaining, 1)
+
+    def test_slow_subscriber_is_bounded(self):
+        async def scenario():
+            hub = events.Hub()
+            subscription = hub.subscribe(maxsize=3)
+            for i in range(10):
+                hub.publish({"type": "updated", "id": i})
+            await asyncio.sleep(0)
+            return subscription.queue.qsize(), [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+
+        size, queued = self._run(scenario)
+        self.assertLessEqual(size, 3)
+        self.assertIn(events.RESYNC, queued)
+
+    def test_publish_from_another_thread(self):
+        async def scenario():
+            hub = events.Hub()
+            subscription = hub.subscribe()
+            thread = threading.Thread(target=hub.publish, args=({"type": "deleted", "id": 7},))
+            thread.start()
+            thread.join()
+            return await asyncio.wait_for(subscription.get(), 1)
+
+        self.assertEqual(self._run(scenario), {"type": "deleted", "id": 7})
+
+    def test_signals_publish_after_commit(self):
+        service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        worker = Worker.objects.create(name="Worker Test")
+        published = []
+
+        with mock.patch.object(events.LocalBackend, "publish", lambda self, event: published.append(event)):
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment = Appointment.objects.create(
+                    service=service, worker=worker, datetime=timezone.now() + timedelta(days=1)
+                )
+                self.assertEqual(published, [])
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.status = StatusChoices.CANCELLED
+                appointment.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.delete()
+
+        self.assertEqual([event["type"] for event in published], ["created", "cancelled", "deleted"])
+        self.assertEqual(published[0]["dates"], [timezone.localtime(appointment.datetime).date().isoformat()])
+
+
+class ClientListsPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="habitual", password="password123")
+        self.worker = Worker.objects.create(name="Ana")
+        self.service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        self.client.force_login(self.user)
+
+    def create(self, count, status, days):
+        base = (timezone.now() + timedelta(days=days)).replace(second=0, microsecond=0)
+        return Appointment.objects.bulk_create(
+            Appointment(
+                user=self.user,
+                worker=self.worker,
+                service=self.service,
+                datetime=base + timedelta(hours=2 * index),
+                end_datetime=base + timedelta(hours=2 * index, minutes=60),
+                status=status,
+            )
+            for index in range(count)
+        )
+
+    def walk(self, url_name):
+        """
+        Follows the pages of a list; every page must cost the same 3 queries
+        (session, user and the page itself).
+        """
+        seen = []
+        params = {}
+        while True:
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse(url_name), params)
+            seen += [app.id for app in response.context["appointments"]]
+            if not response.context["next_cursor"]:
+                return seen
+            params = {"cursor": response.context["next_cursor"]}
+
+    def test_history_pages(self):
+        completed = self.create(25, StatusChoices.COMPLETED, days=-30)
+        Review.objects.bulk_create(Review(appointment=app, rating=4, comment="Genial") for app in completed[::2])
+        self.create(3, StatusChoices.PENDING, days=5)
+
+        seen = self.walk("appointment_history")
+        self.assertEqual(seen, [app.id for app in reversed(completed)])
+
+        response = self.client.get(reverse("appointment_history"))
+        self.assertContains(response, "Genial", count=5)
+        self.assertContains(response, "Aún no has valorado esta cita", count=5)
+        self.assertContains(response, "Citas anteriores")
+
+    def test_upcoming_pages(self):
+        upcoming = self.create(23, StatusChoices.CONFIRMED, days=3)
+        self.create(4, StatusChoices.COMPLETED, days=-3)
+
+        seen = self.walk("upcoming_appointments")
+        self.assertEqual(seen, [app.id for app in upcoming])
+
+    def test_invalid_cursor_shows_first_page(self):
+        upcoming = self.create(12, StatusChoices.PENDING, days=3)
+        response = self.client.get(reverse("upcoming_appointments"), {"cursor": "roto"})
+        self.assertEqual([app.id for app in response.context["appointments"]], [app.id for app in upcoming[:10]])
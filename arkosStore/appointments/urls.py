@@ -7,11 +7,16 @@ urlpatterns = [
     path('history/', views.appointment_history_view, name='appointment_history'),
     path('upcoming/', views.upcoming_appointments_view, name='upcoming_appointments'),
     path('create/', views.create_appointment_view, name='create_appointment'),
+    path('create/series/', views.create_series_view, name='create_series'),
     path('api/get-available-slots/', views.get_available_slots, name='get_available_slots'),
+    path('api/async/get-available-slots/', views.aget_available_slots, name='aget_available_slots'),
+    path('api/get-available-days/', views.get_available_days, name='get_available_days'),
+    path('api/hold-slot/', views.hold_slot_view, name='hold_slot'),
     path('success/<int:pk>/', views.appointment_success_view, name='appointment_success'),
     path('cancel/<int:pk>/', views.cancel_appointment_view, name='cancel_appointment'),
     path("services/", views.services_list_view, name="services_list"),
     path('modify/<int:pk>/', views.modify_appointment_view, name='modify_appointment'),
     path('admin/cancel/<int:pk>/', views.admin_cancel_appointment, name='admin_cancel_appointment'),
     path('admin/availability/', admin_views.admin_manage_availability, name='admin_manage_availability'),
+    path('admin/lookup/<str:kind>/', admin_views.admin_lookup, name='admin_lookup'),
 ]
@@ -2,34 +2,52 @@ from datetime import datetime, timedelta
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import transaction
 from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils import timezone
-from .forms import AppointmentForm, AdminAppointmentForm, ServiceForm
+from .forms import AppointmentForm, AdminAppointmentForm, AppointmentSeriesForm, ServiceForm
 from accounts.models import User
-from .models import Service, Worker, Availability, Appointment, StatusChoices, TypeChoices
-from datetime import datetime, timedelta
-from django.http import JsonResponse
-from .services import send_appointment_notifications
+from .models import BOOKING_WINDOW_DAYS, CANCELLATION_NOTICE_HOURS, Service, SlotHold, Worker, Appointment, StatusChoices, TypeChoices
+from .pagination import page_or_first
+from .scheduling import SLOT_TAKEN_MESSAGE, SlotTakenError, book_appointment, book_series, hold_slot
+from .services import queue_appointment_notifications, queue_series_notifications
+from .slot_cache import acached_available_slots, cached_available_slots
+from .slots import available_days, awithout_held_slots, without_held_slots
 
 
 
 @login_required
 def appointment_history_view(request):
-    appointments = Appointment.objects.filter(
-        user=request.user, status=StatusChoices.COMPLETED, datetime__lt=timezone.now()
-    ).order_by("-datetime")
-    return render(request, "appointments/history.html", {"appointments": appointments})
+    appointments = (
+        Appointment.objects.filter(user=request.user, status=StatusChoices.COMPLETED, datetime__lt=timezone.now())
+        .select_related("service", "worker", "review")
+        .only("datetime", "service__name", "worker__name", "review__rating", "review__comment", "review__date")
+    )
+    appointments, next_cursor = page_or_first(appointments, ("-datetime", "-id"), request.GET.get("cursor"))
+    return render(request, "appointments/history.html", {
+        "appointments": appointments,
+        "next_cursor": next_cursor,
+    })
 
 
 @login_required
 def upcoming_appointments_view(request):
-    appointments = Appointment.objects.filter(
-        user=request.user,
-        status__in=[StatusChoices.PENDING, StatusChoices.CONFIRMED],
-        datetime__gte=timezone.now(),
-    ).order_by("datetime")
-    return render(request, "appointments/upcoming.html", {"appointments": appointments})
+    appointments = (
+        Appointment.objects.filter(
+            user=request.user,
+            status__in=[StatusChoices.PENDING, StatusChoices.CONFIRMED],
+            datetime__gte=timezone.now(),
+        )
+        .select_related("service", "worker")
+        .only("datetime", "service__name", "worker__name")
+    )
+    appointments, next_cursor = page_or_first(appointments, ("datetime", "id"), request.GET.get("cursor"))
+    return render(request, "appointments/upcoming.html", {
+        "appointments": appointments,
+        "next_cursor": next_cursor,
+    })
 
 
 def create_appointment_view(request):
@@ -37,7 +55,12 @@ def create_appointment_view(request):
     form_user = None if is_guest_mode else request.user
 
     if request.method == "POST":
-        form = AppointmentForm(request.POST, user=form_user)
+        session_key = request.session.session_key
+        hold = None
+        if session_key:
+            hold = SlotHold.objects.filter(session_key=session_key, expires_at__gt=timezone.now()).first()
+
+        form = AppointmentForm(request.POST, user=form_user, hold=hold)
 
         if form.is_valid():
             appointment = form.save(commit=False)
@@ -59,11 +82,14 @@ def create_appointment_view(request):
             worker_id = form.cleaned_data["worker_id"]
             appointment.worker = get_object_or_404(Worker, id=worker_id)
 
-            appointment.save()
-
-            send_appointment_notifications(appointment)
-
-            return redirect("appointment_success", pk=appointment.id)
+            try:
+                with transaction.atomic():
+                    book_appointment(appointment, hold=hold, session_key=session_key or "")
+                    queue_appointment_notifications(appointment)
+            except SlotTakenError as error:
+                form.add_error(None, error.message)
+            else:
+                return redirect("appointment_success", pk=appointment.id)
     else:
         form = AppointmentForm(user=request.user)
 
@@ -71,6 +97,34 @@ def create_appointment_view(request):
     return render(request, "appointments/create.html", context)
 
 
+@login_required
+def create_series_view(request):
+    """
+    Reserva recurrente: el mismo hueco cada N semanas. Toda la serie se
+    comprueba con una consulta y se crea de una vez (o no se crea ninguna cita).
+    """
+    if request.method == "POST":
+        form = AppointmentSeriesForm(request.POST, user=request.user)
+
+        if form.is_valid():
+            series = form.save(commit=False)
+            series.user = request.user
+
+            try:
+                with transaction.atomic():
+                    appointments = book_series(series)
+                    queue_series_notifications(series, appointments)
+            except SlotTakenError as error:
+                form.add_error(None, error.message)
+            else:
+                messages.success(request, f"Serie reservada: {len(appointments)} citas.")
+                return redirect("upcoming_appointments")
+    else:
+        form = AppointmentSeriesForm(user=request.user)
+
+    return render(request, "appointments/create_series.html", {"form": form})
+
+
 def appointment_success_view(request, pk):
     appointment = get_object_or_404(Appointment, id=pk)
 
@@ -84,14 +138,13 @@ def appointment_success_view(request, pk):
 def cancel_appointment_view(request, pk):
     appointment = get_object_or_404(Appointment, id=pk, user=request.user)
 
-    limit_time = timezone.now() + timedelta(hours=12)
-
-    if appointment.datetime > limit_time:
+    if appointment.can_be_cancelled:
         appointment.delete()
         messages.success(request, "Cita cancelada correctamente.")
     else:
         messages.error(
-            request, "No es posible cancelar con menos de 12 horas de antelación."
+            request,
+            f"No es posible cancelar con menos de {CANCELLATION_NOTICE_HOURS} horas de antelación.",
         )
 
     return redirect("upcoming_appointments")
@@ -111,11 +164,8 @@ def get_available_slots(request):
     try:
         target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
         service = Service.objects.get(id=service_id)
-        day_of_week = target_date.weekday()
-        service_duration = service.duration
-        service_duration_delta = timedelta(minutes=service_duration)
 
-        max_date = timezone.now().date() + timedelta(days=30)
+        max_date = timezone.now().date() + timedelta(days=BOOKING_WINDOW_DAYS)
 
         if target_date < timezone.now().date():
             return JsonResponse({"slots": []})
@@ -126,70 +176,112 @@ def get_available_slots(request):
     except (ValueError, Service.DoesNotExist):
         return JsonResponse({"slots": []})
 
-    workers = Worker.objects.filter(specialties__name=service.name)
+    slots = cached_available_slots(service, target_date)
+    slots = without_held_slots(slots, target_date, service.duration, request.session.session_key)
+    return JsonResponse({"slots": slots})
 
-    available_slots = []
 
-    existing_appointments_qs = Appointment.objects.filter(
-        datetime__date=target_date,
-        status__in=[StatusChoices.PENDING, StatusChoices.CONFIRMED],
-    ).select_related("service")
+async def aget_available_slots(request):
+    """
+    Versión asíncrona de get_available_slots (mismos parámetros y respuesta)
+    para servir el calendario desde un servidor ASGI.
+    """
+    service_id = request.GET.get("service_id")
+    date_str = request.GET.get("date")
 
-    for worker in workers:
-        availabilities = Availability.objects.filter(
-            worker=worker, day_of_week=day_of_week
+    if not service_id or not date_str:
+        return JsonResponse({"error": "Faltan datos"}, status=400)
+
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        service = await Service.objects.aget(id=service_id)
+
+        max_date = timezone.now().date() + timedelta(days=BOOKING_WINDOW_DAYS)
+
+        if target_date < timezone.now().date():
+            return JsonResponse({"slots": []})
+
+        if target_date > max_date:
+            return JsonResponse({"slots": []})
+
+    except (ValueError, Service.DoesNotExist):
+        return JsonResponse({"slots": []})
+
+    slots = await acached_available_slots(service, target_date)
+    slots = await awithout_held_slots(slots, target_date, service.duration, request.session.session_key)
+    return JsonResponse({"slots": slots})
+
+
+def hold_slot_view(request):
+    """
+    Esta función recibe por POST: service_id, date=YYYY-MM-DD, time=HH:MM, worker_id
+    Reserva temporalmente el hueco para la sesión mientras se rellena el formulario.
+    Devuelve JSON: { 'hold_id': 1, 'expires_at': '...' } o 409 si el hueco ya no está libre.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+
+    try:
+        service = Service.objects.get(id=request.POST.get("service_id"))
+        worker_id = int(request.POST.get("worker_id"))
+        start = timezone.make_aware(
+            datetime.strptime(f"{request.POST.get('date')} {request.POST.get('time')}", "%Y-%m-%d %H:%M")
         )
+    except (TypeError, ValueError, Service.DoesNotExist):
+        return JsonResponse({"error": "Faltan datos"}, status=400)
 
-        for rule in availabilities:
-            naive_start = datetime.combine(target_date, rule.start_time)
-            current_time = timezone.make_aware(naive_start)
+    target_date = timezone.localtime(start).date()
+    if start < timezone.now() or target_date > timezone.now().date() + timedelta(days=BOOKING_WINDOW_DAYS):
+        return JsonResponse({"error": "Faltan datos"}, status=400)
 
-            naive_end = datetime.combine(target_date, rule.end_time)
-            end_time = timezone.make_aware(naive_end)
+    # Only slots the calendar offers can be held: the worker offers the
+    # service, works at that time and the slot is on the grid and free.
+    time_value = timezone.localtime(start).strftime("%H:%M")
+    offered = any(
+        slot["worker_id"] == worker_id and slot["time_value"] == time_value
+        for slot in cached_available_slots(service, target_date)
+    )
+    if not offered:
+        return JsonResponse({"error": SLOT_TAKEN_MESSAGE}, status=409)
 
-            if target_date == timezone.now().date():
-                if current_time < timezone.now():
-                    minutes_past_hour = timezone.now().minute
-                    minutes_to_add = (
-                        service_duration - (minutes_past_hour % service_duration)
-                    ) % service_duration
-                    current_time = (
-                        timezone.now() + timedelta(minutes=minutes_to_add)
-                    ).replace(second=0, microsecond=0)
+    if not request.session.session_key:
+        request.session.save()
 
-                if current_time >= end_time:
-                    continue
+    try:
+        hold = hold_slot(request.session.session_key, worker_id, service, start)
+    except SlotTakenError as error:
+        return JsonResponse({"error": error.message}, status=409)
 
-            while current_time + service_duration_delta <= end_time:
-                slot_start = current_time.time()
-                slot_end_time = current_time + service_duration_delta
+    return JsonResponse({"hold_id": hold.id, "expires_at": hold.expires_at.isoformat()})
 
-                is_overlapping = False
-                for app in existing_appointments_qs:
-                    if not app.service:
-                        continue
 
-                    app_end_time = app.calculated_end_time
+def get_available_days(request):
+    """
+    Esta función recibe: ?service_id=X&from=YYYY-MM-DD&to=YYYY-MM-DD
+    Devuelve JSON: { 'days': [ {'date': '2025-01-07', 'free_slots': 5, 'first_time': '09:00'}, ... ] }
+    El rango se recorta a la ventana de reserva (hoy + 30 días).
+    """
+    service_id = request.GET.get("service_id")
 
-                    if current_time < app_end_time and app.datetime < slot_end_time:
-                        is_overlapping = True
-                        break
+    if not service_id:
+        return JsonResponse({"error": "Faltan datos"}, status=400)
 
-                if not is_overlapping:
-                    available_slots.append(
-                        {
-                            "time_display": slot_start.strftime("%H:%M"),
-                            "time_value": slot_start.strftime("%H:%M"),
-                            "worker_id": worker.id,
-                            "worker_name": worker.name,
-                        }
-                    )
+    today = timezone.now().date()
+    max_date = today + timedelta(days=BOOKING_WINDOW_DAYS)
 
-                current_time += service_duration_delta
+    try:
+        service = Service.objects.get(id=service_id)
+        from_str = request.GET.get("from")
+        to_str = request.GET.get("to")
+        from_date = datetime.strptime(from_str, "%Y-%m-%d").date() if from_str else today
+        to_date = datetime.strptime(to_str, "%Y-%m-%d").date() if to_str else max_date
+    except (ValueError, Service.DoesNotExist):
+        return JsonResponse({"days": []})
 
-    available_slots.sort(key=lambda x: x["time_value"])
+    from_date = max(from_date, today)
+    to_date = min(to_date, max_date)
 
-    return JsonResponse({"slots": available_slots})
+    return JsonResponse({"days": available_days(service, from_date, to_date)})
 
 
 def services_list_view(request):
@@ -256,8 +348,17 @@ def modify_appointment_view(request, pk):
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.datetime = form.cleaned_data['datetime_actual']
-            appointment.save()
-            return redirect('custom_admin')
+            try:
+                book_appointment(appointment)
+            except SlotTakenError as error:
+                messages.error(request, error.message)
+            return redirect(f"{reverse('custom_admin')}?date={timezone.localtime(appointment.datetime):%Y-%m-%d}")
+
+        # The dashboard modal posts here: report the errors back on the dashboard.
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect(f"{reverse('custom_admin')}?date={timezone.localtime(appointment.datetime):%Y-%m-%d}")
     else:
         initial_data = {
             'date': appointment.datetime.date(),
@@ -3,6 +3,26 @@ ASGI config for arkosStore project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the recommended way to run the project. The booking calendar fires
+many small concurrent requests (slots, days, holds) and under ASGI the async
+endpoints (``api/async/get-available-slots/``, ``api/async/chatbot/``) wait on
+the database and the cache without tying up a worker each::
+
+    gunicorn arkosStore.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+or, without gunicorn, ``uvicorn arkosStore.asgi:application --workers 4``.
+Sync views keep working under ASGI (each one runs in a thread), so the WSGI
+entry point is only needed for servers that do not speak ASGI. Compare both
+setups with ``python manage.py benchmark_endpoints``.
+
+The admin dashboard's live updates (``api/admin/events/``, Server-Sent
+Events) need ASGI: each open dashboard holds a connection all day, which
+under WSGI would tie up a worker for good. They are off unless
+DASHBOARD_EVENTS_STREAM=True, so turn it on only when serving this
+application; the dashboard polls otherwise. With several worker processes set DASHBOARD_EVENTS_BACKEND to
+``appointments.events.DatabasePollingBackend`` so that every process sees
+every change.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
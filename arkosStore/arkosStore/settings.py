@@ -75,6 +75,41 @@ DATABASES = {
 }
 # Ya no necesitamos forzar OPTIONS aquí porque fix_db.py lo hará a nivel de servidor.
 
+# En SQLite las transacciones toman el bloqueo de escritura al empezar, así dos reservas
+# concurrentes se serializan (en PostgreSQL se usa SELECT ... FOR UPDATE sobre el trabajador).
+# Coste: cualquier bloque atomic(), aunque solo lea, espera a las escrituras en curso y las
+# bloquea. Las vistas de solo lectura no abren transacciones (no hay ATOMIC_REQUESTS), así
+# que solo afecta a las escrituras, que en SQLite ya se serializan de todos modos.
+# Los tests usan también un fichero (test_db.sqlite3, ignorado por git y borrado al acabar):
+# la base de datos en memoria compartida no respeta el timeout.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({'transaction_mode': 'IMMEDIATE', 'timeout': 20})
+    DATABASES['default'].setdefault('TEST', {})['NAME'] = str(BASE_DIR / 'test_db.sqlite3')
+
+# --- CACHÉ ---
+# Por defecto en memoria local (un solo proceso). Con varios workers de gunicorn
+# usar la caché de fichero para que la invalidación de huecos se comparta:
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# CACHE_LOCATION=/tmp/arkos-cache
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION') or 'arkos-cache',
+    }
+}
+
+# Segundos que se guardan los huecos calculados (se invalidan antes si cambian citas u horarios)
+SLOT_CACHE_TIMEOUT = int(os.environ.get('SLOT_CACHE_TIMEOUT') or 60 * 60 * 6)
+
+# Segundos que se guardan las tarjetas del directorio de trabajadores (se regeneran antes si cambian)
+WORKER_CARD_CACHE_TIMEOUT = int(os.environ.get('WORKER_CARD_CACHE_TIMEOUT') or 60 * 60 * 24)
+
+# Procesos que generan las miniaturas de las fotos de los trabajadores (0 = en la misma petición)
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS') or 2)
+
+# Segundos que un hueco queda reservado mientras el cliente rellena sus datos
+SLOT_HOLD_SECONDS = int(os.environ.get('SLOT_HOLD_SECONDS') or 300)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -113,7 +148,40 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+# Los emails de la cola se envían en lotes por una sola conexión SMTP: se espera a
+# tener EMAIL_BATCH_SIZE pendientes o a que el más antiguo lleve EMAIL_FLUSH_INTERVAL segundos
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE') or 100)
+EMAIL_FLUSH_INTERVAL = int(os.environ.get('EMAIL_FLUSH_INTERVAL') or 10)
 
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
-TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
\ No newline at end of file
+TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
+TWILIO_API_URL = os.environ.get('TWILIO_API_URL') or 'https://api.twilio.com'
+
+# Envío de SMS (appointments.sms). 'appointments.sms.LocMemBackend' para no enviar nada.
+SMS_BACKEND = os.environ.get('SMS_BACKEND') or 'appointments.sms.TwilioBackend'
+
+# Cola de notificaciones (manage.py run_notifications)
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE') or 50)
+NOTIFICATION_CONCURRENCY = int(os.environ.get('NOTIFICATION_CONCURRENCY') or 4)
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS') or 5)
+# Espera tras el primer fallo; se duplica en cada reintento
+NOTIFICATION_RETRY_BASE_SECONDS = int(os.environ.get('NOTIFICATION_RETRY_BASE_SECONDS') or 60)
+# Recordatorios (manage.py send_reminders): horas de antelación con que se avisa
+REMINDER_HOURS_BEFORE = int(os.environ.get('REMINDER_HOURS_BEFORE') or 24)
+
+# Panel de administración: segundos entre sincronizaciones de la agenda y días
+# que se guardan las citas borradas para poder sincronizar por diferencias
+SCHEDULE_POLL_SECONDS = int(os.environ.get('SCHEDULE_POLL_SECONDS') or 15)
+SCHEDULE_TOMBSTONE_DAYS = int(os.environ.get('SCHEDULE_TOMBSTONE_DAYS') or 7)
+
+# Avisos en directo al panel (SSE). Solo con un servidor ASGI (ver asgi.py): bajo
+# WSGI cada panel abierto ocuparía un worker para siempre, así que está apagado
+# por defecto y el panel se sincroniza por sondeo. Con varios procesos usa
+# 'appointments.events.DatabasePollingBackend'
+DASHBOARD_EVENTS_STREAM = os.environ.get('DASHBOARD_EVENTS_STREAM', 'False') == 'True'
+DASHBOARD_EVENTS_BACKEND = os.environ.get('DASHBOARD_EVENTS_BACKEND') or 'appointments.events.LocalBackend'
+# Eventos en cola por panel conectado; si se llena, el panel se resincroniza
+DASHBOARD_EVENTS_QUEUE_SIZE = int(os.environ.get('DASHBOARD_EVENTS_QUEUE_SIZE') or 100)
+DASHBOARD_EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('DASHBOARD_EVENTS_HEARTBEAT_SECONDS') or 15)
+DASHBOARD_EVENTS_POLL_SECONDS = int(os.environ.get('DASHBOARD_EVENTS_POLL_SECONDS') or 2)
\ No newline at end of file
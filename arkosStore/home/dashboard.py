@@ -0,0 +1,232 @@
+"""
+Data for the custom admin dashboard (home.views.custom_admin).
+
+The day and week views load every appointment of the range with one query
+(select_related + only) and lay the blocks out in a single pass; the month
+view reads only per-day counts, aggregated by the database.
+
+An open day view keeps itself up to date with schedule_payload: given the
+token of its last sync it gets only the appointments of that day changed
+since (Appointment.updated_at) and the ids to drop (cancelled, or deleted or
+moved to another day, see AppointmentTombstone), each block rendered with the
+same template as the page.
+"""
+
+import calendar
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from appointments.models import OCCUPYING_STATUSES, Appointment, AppointmentTombstone, StatusChoices
+from appointments.slots import day_bounds
+
+START_HOUR = 9
+END_HOUR = 22
+TOTAL_MINUTES = (END_HOUR - START_HOUR) * 60
+
+VIEWS = ("day", "week", "month")
+
+# Sync tokens are taken this much before the query time, so a change saved by
+# a transaction that commits during the sync is sent again next time rather
+# than missed. Clients apply the blocks idempotently.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# What a block on the calendar (and its modal) shows.
+BLOCK_FIELDS = [
+    "datetime",
+    "end_datetime",
+    "status",
+    "guest_first_name",
+    "guest_last_name",
+    "guest_email",
+    "guest_phone",
+    "user__id",
+    "user__first_name",
+    "user__last_name",
+    "service__id",
+    "service__name",
+    "service__duration",
+    "worker__id",
+    "worker__name",
+]
+
+
+def date_range(view, current_date):
+    """
+    Returns the days shown by a view: the date itself, its week (Monday to
+    Sunday) or its month.
+    """
+    if view == "week":
+        first = current_date - timedelta(days=current_date.weekday())
+        count = 7
+    elif view == "month":
+        first = current_date.replace(day=1)
+        count = calendar.monthrange(current_date.year, current_date.month)[1]
+    else:
+        first = current_date
+        count = 1
+    return [first + timedelta(days=offset) for offset in range(count)]
+
+
+def shift_date(view, current_date, step):
+    """
+    The date step views before (negative) or after current_date.
+    """
+    if view == "week":
+        return current_date + timedelta(weeks=step)
+    if view == "month":
+        month = current_date.month - 1 + step
+        year = current_date.year + month // 12
+        return current_date.replace(year=year, month=month % 12 + 1, day=1)
+    return current_date + timedelta(days=step)
+
+
+def range_appointments(days):
+    """
+    Appointments shown on the calendar between the first and the last day.
+    """
+    start, _ = day_bounds(days[0])
+    _, end = day_bounds(days[-1])
+    return (
+        Appointment.objects.filter(datetime__gte=start, datetime__lt=end, status__in=OCCUPYING_STATUSES)
+        .select_related("user", "service", "worker")
+        .only(*BLOCK_FIELDS)
+        .order_by("datetime")
+    )
+
+
+def place(app):
+    """
+    Sets css_top and css_height, percentages of the START_HOUR-END_HOUR axis.
+    Returns False for appointments starting before START_HOUR, which cannot
+    be drawn.
+    """
+    local_dt = timezone.localtime(app.datetime)
+    start_minutes = (local_dt.hour * 60 + local_dt.minute) - (START_HOUR * 60)
+    if start_minutes < 0:
+        return False
+    duration = (app.calculated_end_time - app.datetime).total_seconds() / 60
+    app.css_top = f"{start_minutes / TOTAL_MINUTES * 100}%"
+    app.css_height = f"{duration / TOTAL_MINUTES * 100}%"
+    return True
+
+
+def lay_out(appointments, workers, days):
+    """
+    Places each appointment in its worker's lane for its day.
+
+    Returns {worker_id: {day: [appointment, ...]}} with a lane for every
+    worker and day.
+    """
+    lanes = {worker.id: {day: [] for day in days} for worker in workers}
+    for app in appointments:
+        if not place(app):
+            continue
+        worker_lanes = lanes.get(app.worker_id)
+        day = timezone.localtime(app.datetime).date()
+        if worker_lanes is not None and day in worker_lanes:
+            worker_lanes[day].append(app)
+    return lanes
+
+
+def make_token(now):
+    return str(int((now - SYNC_OVERLAP).timestamp() * 1_000_000))
+
+
+def parse_token(token):
+    """
+    Returns the aware datetime of a sync token, or None if it is not valid.
+    """
+    try:
+        return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def _block(app):
+    return {
+        "id": app.id,
+        "worker_id": app.worker_id,
+        "html": render_to_string("home/appointment_card.html", {"app": app}),
+    }
+
+
+def schedule_payload(day, since=None):
+    """
+    The blocks of a day for the dashboard. With since (a datetime), only what
+    changed after it: "appointments" to add or replace and "removed" ids.
+    Without it, or if since is older than the tombstones kept, every block of
+    the day ("full": True).
+    """
+    now = timezone.now()
+    oldest = now - timedelta(days=getattr(settings, "SCHEDULE_TOMBSTONE_DAYS", 7))
+    full = since is None or since < oldest
+
+    blocks = []
+    removed = []
+    if full:
+        blocks = [_block(app) for app in range_appointments([day]) if place(app)]
+    else:
+        # Only the day shown: appointments moved away from it left a tombstone.
+        start, end = day_bounds(day)
+        changed = (
+            Appointment.objects.filter(updated_at__gte=since, datetime__gte=start, datetime__lt=end)
+            .select_related("user", "service", "worker")
+            .only(*BLOCK_FIELDS)
+        )
+        for app in changed:
+            if app.status in OCCUPYING_STATUSES and place(app):
+                blocks.append(_block(app))
+            else:
+                removed.append(app.id)
+        removed += AppointmentTombstone.objects.filter(
+            deleted_at__gte=since, datetime__gte=start, datetime__lt=end
+        ).values_list("appointment_id", flat=True)
+
+    return {
+        "date": day.isoformat(),
+        "token": make_token(now),
+        "full": full,
+        "appointments": blocks,
+        "removed": removed,
+    }
+
+
+def month_weeks(days):
+    """
+    Per-day appointment counts for a month, in calendar rows of seven cells
+    (None for the padding before the 1st and after the last day).
+    """
+    start, _ = day_bounds(days[0])
+    _, end = day_bounds(days[-1])
+    counts = {
+        row["day"]: row
+        for row in Appointment.objects.filter(datetime__gte=start, datetime__lt=end, status__in=OCCUPYING_STATUSES)
+        .annotate(day=TruncDate("datetime"))
+        .values("day")
+        .annotate(
+            total=Count("id"),
+            pending=Count("id", filter=Q(status=StatusChoices.PENDING)),
+            workers=Count("worker", distinct=True),
+        )
+        .order_by()
+    }
+
+    cells = [None] * days[0].weekday()
+    for day in days:
+        row = counts.get(day, {})
+        cells.append(
+            {
+                "date": day,
+                "total": row.get("total", 0),
+                "pending": row.get("pending", 0),
+                "workers": row.get("workers", 0),
+            }
+        )
+    cells += [None] * (-len(cells) % 7)
+    return [cells[i : i + 7] for i in range(0, len(cells), 7)]
@@ -1,3 +1,274 @@
-from django.test import TestCase
+import json
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments import events
+from appointments.models import Appointment, AppointmentTombstone, Service, StatusChoices
+from appointments.scheduling import purge_tombstones
+from workers.models import TypeChoices, Worker
+
+User = get_user_model()
+
+
+class ChatbotApiTest(TestCase):
+
+    def _ask(self, client, url_name, message):
+        post = client.post
+        if client is self.async_client:
+            post = async_to_sync(post)
+        return post(
+            reverse(url_name), json.dumps({"message": message}), content_type="application/json"
+        )
+
+    def test_async_matches_sync(self):
+        for message in ("Quiero reservar", "¿Cuánto cuesta?", "xyz"):
+            sync_response = self._ask(self.client, "chatbot_api", message)
+            async_response = self._ask(self.async_client, "achatbot_api", message)
+
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_async_uses_the_logged_in_user(self):
+        User.objects.create_user(username="cliente", password="pass12345")
+        self.async_client.force_login(User.objects.get(username="cliente"))
+
+        response = self._ask(self.async_client, "achatbot_api", "historial")
+
+        self.assertIn("Hola cliente", response.json()["response"])
+
+    def test_errors_are_logged(self):
+        post = async_to_sync(self.async_client.post)
+        with self.assertLogs("home.views", "ERROR") as logs:
+            response = post(reverse("achatbot_api"), "no es json", content_type="application/json")
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("chatbot error", logs.output[0])
+
+    def test_async_rejects_get(self):
+        response = async_to_sync(self.async_client.get)(reverse("achatbot_api"))
+        self.assertEqual(response.status_code, 405)
+
+
+class CustomAdminViewTest(TestCase):
+
+    def setUp(self):
+        self.service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        self.workers = [Worker.objects.create(name=f"Worker {i}") for i in range(2)]
+        self.monday = date(2030, 3, 4)
+
+    def _book(self, day, hour, worker=None, status=StatusChoices.CONFIRMED):
+        return Appointment.objects.create(
+            service=self.service,
+            worker=worker or self.workers[0],
+            datetime=timezone.make_aware(datetime.combine(day, time(hour, 0))),
+            status=status,
+            guest_first_name="Invitada",
+        )
+
+    def _get(self, view, day):
+        return self.client.get(reverse("custom_admin"), {"view": view, "date": day.isoformat()})
+
+    def test_day_view_lays_out_blocks(self):
+        self._book(self.monday, 10)
+
+        response = self._get("day", self.monday)
+
+        item = response.context["workers_schedule"][0]
+        self.assertEqual(len(item["appointments"]), 1)
+        self.assertEqual(item["appointments"][0].css_top, f"{60 / 780 * 100}%")
+
+    def test_week_view_places_each_day(self):
+        self._book(self.monday, 10)
+        self._book(self.monday + timedelta(days=6), 12, worker=self.workers[1])
+        self._book(self.monday + timedelta(days=7), 12)
+
+        response = self._get("week", self.monday + timedelta(days=2))
+
+        columns = response.context["week_columns"]
+        self.assertEqual([column["date"] for column in columns][0], self.monday)
+        self.assertEqual(len(columns[0]["lanes"][0]["appointments"]), 1)
+        self.assertEqual(len(columns[6]["lanes"][1]["appointments"]), 1)
+        self.assertEqual(sum(len(lane["appointments"]) for c in columns for lane in c["lanes"]), 2)
+
+    def test_week_view_query_count_does_not_grow(self):
+        self._book(self.monday, 10)
+        with CaptureQueriesContext(connection) as few:
+            self._get("week", self.monday)
+
+        for offset in range(7):
+            for worker in self.workers:
+                self._book(self.monday + timedelta(days=offset), 15, worker=worker)
+        with CaptureQueriesContext(connection) as many:
+            self._get("week", self.monday)
+
+        self.assertEqual(len(many), len(few))
+
+    def test_month_view_shows_counts(self):
+        self._book(self.monday, 10)
+        self._book(self.monday, 12, status=StatusChoices.PENDING)
+        self._book(self.monday, 14, status=StatusChoices.CANCELLED)
+
+        response = self._get("month", self.monday)
+
+        self.assertNotIn("week_columns", response.context)
+        cells = [cell for week in response.context["month_weeks"] for cell in week if cell]
+        self.assertEqual(len(cells), 31)
+        self.assertEqual((cells[3]["total"], cells[3]["pending"]), (2, 1))
+        self.assertEqual(cells[4]["total"], 0)
+        self.assertNotContains(response, 'class="appointment-card')
+
+    def test_unknown_view_falls_back_to_day(self):
+        response = self._get("year", self.monday)
+        self.assertEqual(response.context["view"], "day")
+
+
+class ScheduleSyncTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="admin", password="pass", email="admin@example.com",
+            phone_number="+34 600000000", role=User.Role.ADMIN,
+        )
+        self.client.force_login(self.admin)
+        self.service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        self.worker = Worker.objects.create(name="Worker Test")
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.first = self._book(10)
+        self.second = self._book(12)
+        # Old enough to fall outside the overlap of the next token.
+        Appointment.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def _book(self, hour, day=None):
+        return Appointment.objects.create(
+            service=self.service,
+            worker=self.worker,
+            datetime=timezone.make_aware(datetime.combine(day or self.day, time(hour, 0))),
+            guest_first_name="Invitada",
+        )
+
+    def _sync(self, since=None):
+        params = {"date": self.day.isoformat()}
+        if since:
+            params["since"] = since
+        return self.client.get(reverse("admin_schedule_api"), params)
+
+    def test_full_snapshot(self):
+        data = self._sync().json()
+
+        self.assertTrue(data["full"])
+        self.assertEqual([block["id"] for block in data["appointments"]], [self.first.id, self.second.id])
+        self.assertIn(f'data-appointment-id="{self.first.id}"', data["appointments"][0]["html"])
+
+    def test_delta_returns_only_changes(self):
+        token = self._sync().json()["token"]
+        added = self._book(15)
+        self.first.status = StatusChoices.CANCELLED
+        self.first.save()
+        deleted_id = self.second.id
+        self.second.delete()
+
+        data = self._sync(token).json()
+
+        self.assertFalse(data["full"])
+        self.assertEqual([block["id"] for block in data["appointments"]], [added.id])
+        self.assertEqual(sorted(data["removed"]), sorted([self.first.id, deleted_id]))
+
+    def test_moved_away_is_removed(self):
+        token = self._sync().json()["token"]
+        moved = Appointment.objects.get(pk=self.first.pk)
+        moved.datetime += timedelta(days=1)
+        moved.save()
+
+        data = self._sync(token).json()
+        self.assertEqual(data["appointments"], [])
+        self.assertEqual(data["removed"], [self.first.id])
+
+    def test_delta_ignores_other_days(self):
+        token = self._sync().json()["token"]
+        other_day = self.day + timedelta(days=1)
+        self._book(10, day=other_day)
+        elsewhere = self._book(12, day=other_day)
+        elsewhere.delete()
+        self.assertEqual(AppointmentTombstone.objects.count(), 1)
+
+        data = self._sync(token).json()
+        self.assertEqual(data["appointments"], [])
+        self.assertEqual(data["removed"], [])
+
+    def test_bulk_updates_are_seen(self):
+        token = self._sync().json()["token"]
+        self.service.duration = 90
+        self.service.save()
+
+        data = self._sync(token).json()
+        self.assertEqual(len(data["appointments"]), 2)
+
+    def test_old_or_invalid_tokens(self):
+        old = str(int((timezone.now() - timedelta(days=30)).timestamp() * 1_000_000))
+        self.assertTrue(self._sync(old).json()["full"])
+        self.assertEqual(self._sync("abc").status_code, 400)
+
+    def test_requires_admin(self):
+        self.client.logout()
+        self.assertEqual(self._sync().status_code, 302)
+
+    def test_old_tombstones_are_purged(self):
+        self.first.delete()
+        AppointmentTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=8))
+        deleted_id = self.second.id
+        self.second.delete()
+
+        self.assertEqual(purge_tombstones(), 1)
+        self.assertEqual(AppointmentTombstone.objects.get().appointment_id, deleted_id)
+
+
+@override_settings(DASHBOARD_EVENTS_STREAM=True, DASHBOARD_EVENTS_HEARTBEAT_SECONDS=0.05)
+class AdminEventsStreamTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="admin", password="pass", email="admin@example.com",
+            phone_number="+34 600000000", role=User.Role.ADMIN,
+        )
+
+    def test_requires_admin(self):
+        response = async_to_sync(self.async_client.get)(reverse("admin_events_stream"))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(DASHBOARD_EVENTS_STREAM=False)
+    def test_disabled_without_asgi(self):
+        self.async_client.force_login(self.admin)
+        response = async_to_sync(self.async_client.get)(reverse("admin_events_stream"))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(events.hub), 0)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("custom_admin"))
+        self.assertNotContains(response, "data-events-url")
+
+    def test_streams_events_and_heartbeats(self):
+        self.async_client.force_login(self.admin)
+
+        async def scenario():
+            response = await self.async_client.get(reverse("admin_events_stream"))
+            stream = aiter(response.streaming_content)
+            chunks = [await anext(stream)]
+            events.hub.publish({"type": "created", "id": 5, "dates": ["2030-03-04"]})
+            chunks.append(await anext(stream))
+            chunks.append(await anext(stream))
+            await stream.aclose()
+            return response, [chunk.decode() for chunk in chunks]
+
+        response, chunks = async_to_sync(scenario)()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertTrue(chunks[0].startswith("retry:"))
+        self.assertEqual(chunks[1], 'event: created\ndata: {"type": "created", "id": 5, "dates": ["2030-03-04"]}\n\n')
+        self.assertEqual(chunks[2], ": heartbeat\n\n")
+        self.assertEqual(len(events.hub), 0)
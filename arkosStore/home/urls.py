@@ -6,7 +6,10 @@ urlpatterns = [
     path("", views.index, name="home"),
     path("contact/", views.contact, name="contact"),
     path("admin/", views.custom_admin, name='custom_admin'),
+    path("api/admin/schedule/", views.admin_schedule_api, name='admin_schedule_api'),
+    path("api/admin/events/", views.admin_events_stream, name='admin_events_stream'),
     path("resources/", views.resources_view, name="resources"),
     path('terms/', views.terms_conditions_view, name='terms_conditions'),
     path('api/chatbot/', views.chatbot_api, name='chatbot_api'),
+    path('api/async/chatbot/', views.achatbot_api, name='achatbot_api'),
 ]
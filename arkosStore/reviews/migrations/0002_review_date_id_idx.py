@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_appointment_updated_at_tombstone'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-date', '-id'], name='review_date_id_idx'),
+        ),
+    ]
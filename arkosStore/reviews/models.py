@@ -17,6 +17,19 @@ class Review(models.Model):
         Appointment, on_delete=models.CASCADE, related_name="review"
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the reviews page (workers.views.REVIEW_ORDERING).
+            models.Index(fields=["-date", "-id"], name="review_date_id_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so the rating aggregates can apply the difference on edits.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         try:
             return f"Review ({self.rating}/5) de {self.appointment.user.username} para la cita {self.appointment.datetime.strftime('%Y-%m-%d %H:%M')}"
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointments.models import Appointment
+from workers import ratings
+
+from .models import Review
+
+
+def _worker_of(appointment_id):
+    # A subquery, so the UPDATE does not need the appointment loaded.
+    return Appointment.objects.filter(pk=appointment_id).values("worker_id")
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # loaddata: fixtures are followed by manage.py recompute_worker_ratings.
+        return
+    loaded = getattr(instance, "_loaded_values", None)
+    if created or not loaded:
+        ratings.apply_rating(_worker_of(instance.appointment_id), instance.rating)
+        return
+    if loaded["appointment_id"] != instance.appointment_id:
+        ratings.apply_rating(_worker_of(loaded["appointment_id"]), loaded["rating"], sign=-1)
+        ratings.apply_rating(_worker_of(instance.appointment_id), instance.rating)
+    else:
+        ratings.change_rating(_worker_of(instance.appointment_id), loaded["rating"], instance.rating)
+    instance._loaded_values = {**loaded, "rating": instance.rating, "appointment_id": instance.appointment_id}
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    # Also runs when the review goes with its appointment: reviews are deleted
+    # before the appointment they point to, so the subquery still finds it.
+    rating = getattr(instance, "_loaded_values", {}).get("rating", instance.rating)
+    ratings.apply_rating(_worker_of(instance.appointment_id), rating, sign=-1)
+
+
+@receiver(post_save, sender=Appointment)
+def move_review_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # A reviewed appointment reassigned to another worker takes its rating along.
+    loaded = getattr(instance, "_loaded_values", None)
+    if created or not loaded:
+        return
+    previous = getattr(instance, "_rated_worker_id", loaded.get("worker_id"))
+    if previous in (None, instance.worker_id):
+        return
+    rating = Review.objects.filter(appointment_id=instance.pk).values_list("rating", flat=True).first()
+    if rating is not None:
+        ratings.apply_rating([previous], rating, sign=-1)
+        ratings.apply_rating([instance.worker_id], rating)
+    instance._rated_worker_id = instance.worker_id
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.models import Appointment, Service, StatusChoices
+from workers.models import TypeChoices, Worker
+
+from .models import Review
+
+
+class MyReviewsViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="cliente", email="cliente@example.com", phone_number="+34 600000001", password="password123"
+        )
+        other = User.objects.create_user(
+            username="otro", email="otro@example.com", phone_number="+34 600000002", password="password123"
+        )
+        worker = Worker.objects.create(name="Ana")
+        service = Service.objects.create(name=TypeChoices.NUTRITIONAL_ADVICE, duration=30)
+        base = (timezone.now() - timedelta(days=60)).replace(second=0, microsecond=0)
+        appointments = Appointment.objects.bulk_create(
+            Appointment(
+                user=other if index % 5 == 0 else self.user,
+                worker=worker,
+                service=service,
+                datetime=base + timedelta(hours=index),
+                end_datetime=base + timedelta(hours=index, minutes=30),
+                status=StatusChoices.COMPLETED,
+            )
+            for index in range(30)
+        )
+        Review.objects.bulk_create(Review(appointment=app, rating=5) for app in appointments)
+        self.expected = list(
+            Review.objects.filter(appointment__user=self.user).order_by("-date", "-id").values_list("id", flat=True)
+        )
+        self.client.force_login(self.user)
+
+    def test_pages_in_constant_queries(self):
+        seen = []
+        params = {}
+        while True:
+            # Session, user and the page with its services and workers.
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse("my_reviews"), params)
+            seen += [review.id for review in response.context["reviews"]]
+            if not response.context["next_cursor"]:
+                break
+            params = {"cursor": response.context["next_cursor"]}
+
+        self.assertEqual(len(self.expected), 24)
+        self.assertEqual(seen, self.expected)
+        self.assertContains(response, "Asesoramiento Nutricional", count=4)
+        self.assertContains(response, "Volver al principio")
@@ -4,6 +4,7 @@ from django.contrib import messages
 from .forms import ReviewForm
 from .models import Review
 from appointments.models import Appointment, StatusChoices
+from appointments.pagination import page_or_first
 
 @login_required
 def create_review_view(request, appointment_id):
@@ -43,8 +44,14 @@ def create_review_view(request, appointment_id):
 
 @login_required
 def my_reviews_view(request):
-    reviews = Review.objects.filter(
-        appointment__user=request.user
-    ).order_by('-date')
-    
-    return render(request, 'reviews/my_reviews.html', {'reviews': reviews})
\ No newline at end of file
+    reviews = (
+        Review.objects.filter(appointment__user=request.user)
+        .select_related('appointment__service', 'appointment__worker')
+        .only('rating', 'comment', 'date', 'appointment__service__name', 'appointment__worker__name')
+    )
+    reviews, next_cursor = page_or_first(reviews, ('-date', '-id'), request.GET.get('cursor'))
+
+    return render(request, 'reviews/my_reviews.html', {
+        'reviews': reviews,
+        'next_cursor': next_cursor,
+    })
\ No newline at end of file
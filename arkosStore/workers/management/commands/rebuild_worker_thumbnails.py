@@ -0,0 +1,53 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from workers.models import Worker
+from workers.thumbnails import read_image, render_thumbnails, save_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the thumbnails of the workers' photos in parallel, for images "
+        "uploaded before the thumbnails existed or after changing their sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Procesos en paralelo (por defecto, THUMBNAIL_WORKERS o 2)",
+        )
+        parser.add_argument("--force", action="store_true", help="Regenerar también las que ya están al día")
+
+    def handle(self, *args, **options):
+        workers = [
+            worker
+            for worker in Worker.objects.exclude(image="").exclude(image__isnull=True).only("id", "image", "thumbnails")
+            if options["force"] or not worker.has_current_thumbnails()
+        ]
+        processes = options["workers"] or getattr(settings, "THUMBNAIL_WORKERS", 0) or 2
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {}
+            for worker in workers:
+                try:
+                    futures[executor.submit(render_thumbnails, read_image(worker))] = worker
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f"{worker.image.name}: {error}")
+            for future in as_completed(futures):
+                worker = futures.pop(future)
+                try:
+                    save_thumbnails(worker.pk, worker.image.name, future.result())
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f"{worker.image.name}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(f"Miniaturas generadas: {done} trabajadores."))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Fotos con errores: {failed}."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from workers.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the rating aggregates stored on each worker from the reviews, "
+        "e.g. after loaddata or changes made outside the ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("worker_ids", nargs="*", type=int, help="Solo estos trabajadores (por defecto, todos)")
+
+    def handle(self, *args, **options):
+        changed = recompute_ratings(options["worker_ids"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Valoraciones recalculadas: {changed} trabajadores corregidos."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:33
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workers', '0002_worker_bio_worker_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='worker',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='worker_name_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:41
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_ratings(apps, schema_editor):
+    Review = apps.get_model("reviews", "Review")
+    Worker = apps.get_model("workers", "Worker")
+    rows = (
+        Review.objects.values("appointment__worker")
+        .annotate(
+            rating_sum=Sum("rating"),
+            rating_count=Count("id"),
+            **{f"rating_{stars}": Count("id", filter=Q(rating=stars)) for stars in range(1, 6)},
+        )
+        .order_by()
+    )
+    for row in rows:
+        Worker.objects.filter(pk=row.pop("appointment__worker")).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workers', '0003_worker_worker_name_lower_idx'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workers', '0004_worker_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='card_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
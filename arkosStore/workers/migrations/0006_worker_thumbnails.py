@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workers', '0005_worker_card_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
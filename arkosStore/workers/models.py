@@ -1,5 +1,6 @@
+from django.core.files.storage import default_storage
 from django.db import models
-from django.db.models import Avg
+from django.db.models.functions import Lower
 
 # Create your models here.
 
@@ -27,6 +28,46 @@ class Worker(models.Model):
         max_length=300, blank=True, help_text="Breve descripción para la tarjeta"
     )
 
+    # Review aggregates, kept up to date by the Review signals (workers.ratings)
+    # and rebuilt by manage.py recompute_worker_ratings.
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    # Bumped whenever anything shown on the worker's card changes (the worker,
+    # their specialties or their reviews); part of the card's cache key.
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Resized copies of image, see workers.thumbnails.
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Only ever written with update() (workers.ratings, workers.signals,
+    # workers.thumbnails); save() leaves them out, or saving a worker loaded
+    # before a review or a new thumbnail would put back its stale values, and a
+    # card_version already used for an older card.
+    DERIVED_FIELDS = (
+        "rating_sum", "rating_count", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5",
+        "card_version", "thumbnails",
+    )
+
+    class Meta:
+        indexes = [
+            # Prefix search of the admin worker picker (appointments.lookups).
+            models.Index(Lower("name"), name="worker_name_lower_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get("force_insert"):
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs["update_fields"] = [name for name in update_fields if name not in self.DERIVED_FIELDS]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         specialties_list = ", ".join(
             [s.get_name_display() for s in self.specialties.all()]
@@ -37,11 +78,45 @@ class Worker(models.Model):
         return ", ".join([s.get_name_display() for s in self.specialties.all()])
     
     def get_average_rating(self):
-        average = self.worker_appointments.aggregate(Avg('review__rating'))['review__rating__avg']
-        
-        if average:
-            return round(average, 1)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
         return None
 
     def get_review_count(self):
-        return self.worker_appointments.filter(review__isnull=False).count()
+        return self.rating_count
+
+    def get_rating_histogram(self):
+        """
+        Returns [(stars, count, percent), ...] from 5 stars down to 1.
+        """
+        return [
+            (stars, count, round(100 * count / self.rating_count) if self.rating_count else 0)
+            for stars in range(5, 0, -1)
+            for count in [getattr(self, f"rating_{stars}")]
+        ]
+
+    def has_current_thumbnails(self):
+        return bool(self.image) and self.thumbnails.get("source") == self.image.name
+
+    def _srcset(self, key):
+        if not self.has_current_thumbnails():
+            return ""
+        return ", ".join(f"{default_storage.url(name)} {width}w" for width, name in self.thumbnails.get(key, []))
+
+    @property
+    def webp_srcset(self):
+        return self._srcset("webp")
+
+    @property
+    def jpeg_srcset(self):
+        return self._srcset("jpeg")
+
+    @property
+    def card_image_url(self):
+        """
+        The smallest JPEG thumbnail, for browsers without srcset; the original
+        while there are no thumbnails.
+        """
+        if self.has_current_thumbnails() and self.thumbnails.get("jpeg"):
+            return default_storage.url(self.thumbnails["jpeg"][0][1])
+        return self.image.url if self.image else ""
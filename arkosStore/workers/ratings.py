@@ -0,0 +1,81 @@
+"""
+Review aggregates stored on Worker: rating_sum, rating_count and one counter
+per number of stars (rating_1 ... rating_5).
+
+Review writes adjust them in place with F() expressions, so concurrent reviews
+never overwrite each other's counts and no aggregate over the reviews is run
+on reads. recompute_ratings rebuilds them from the reviews. Every change also
+bumps card_version, so the cached directory card of the worker is rebuilt.
+Worker.save() leaves the counters out (Worker.DERIVED_FIELDS), so saving a
+worker loaded before a review does not undo it.
+"""
+
+from django.db.models import Count, F, Q, Sum
+
+from .models import Worker
+
+STARS = range(1, 6)
+
+
+def apply_rating(worker_ids, rating, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) one review of rating stars to the
+    workers matching worker_ids (a list or a subquery).
+    """
+    Worker.objects.filter(pk__in=worker_ids).update(
+        rating_sum=F("rating_sum") + sign * rating,
+        rating_count=F("rating_count") + sign,
+        card_version=F("card_version") + 1,
+        **{f"rating_{rating}": F(f"rating_{rating}") + sign},
+    )
+
+
+def change_rating(worker_ids, old, new):
+    if old == new:
+        return
+    Worker.objects.filter(pk__in=worker_ids).update(
+        rating_sum=F("rating_sum") + new - old,
+        card_version=F("card_version") + 1,
+        **{
+            f"rating_{old}": F(f"rating_{old}") - 1,
+            f"rating_{new}": F(f"rating_{new}") + 1,
+        },
+    )
+
+
+def recompute_ratings(worker_ids=None):
+    """
+    Rebuilds the aggregates of the given workers (all by default) with one
+    grouped query over the reviews. Returns the number of workers updated.
+    """
+    from reviews.models import Review
+
+    reviews = Review.objects.all()
+    workers = Worker.objects.all()
+    if worker_ids is not None:
+        reviews = reviews.filter(appointment__worker__in=worker_ids)
+        workers = workers.filter(pk__in=worker_ids)
+
+    totals = {
+        row["appointment__worker"]: row
+        for row in reviews.values("appointment__worker")
+        .annotate(
+            rating_sum=Sum("rating"),
+            rating_count=Count("id"),
+            **{f"rating_{stars}": Count("id", filter=Q(rating=stars)) for stars in STARS},
+        )
+        .order_by()
+    }
+
+    fields = ["rating_sum", "rating_count", *(f"rating_{stars}" for stars in STARS)]
+    changed = []
+    for worker in workers.only("id", *fields):
+        row = totals.get(worker.id, {})
+        values = {field: row.get(field) or 0 for field in fields}
+        if any(getattr(worker, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(worker, field, value)
+            worker.card_version = F("card_version") + 1
+            changed.append(worker)
+    Worker.objects.bulk_update(changed, [*fields, "card_version"], batch_size=500)
+    return len(changed)
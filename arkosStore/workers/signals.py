@@ -0,0 +1,39 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Specialty, Worker
+
+
+def bump_card_version(workers):
+    """
+    Invalidates the cached directory cards of workers (a queryset). The
+    version only ever moves through this F() update, never through save(), so
+    no number is handed out twice.
+    """
+    workers.update(card_version=F("card_version") + 1)
+
+
+@receiver(post_save, sender=Worker)
+def worker_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_card_version(Worker.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Specialty)
+@receiver(pre_delete, sender=Specialty)
+def specialty_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_card_version(Worker.objects.filter(specialties=instance))
+
+
+@receiver(m2m_changed, sender=Worker.specialties.through)
+def worker_specialties_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        bump_card_version(Worker.objects.filter(pk=instance.pk))
+    elif action == "pre_clear":
+        bump_card_version(Worker.objects.filter(specialties=instance))
+    elif pk_set:
+        bump_card_version(Worker.objects.filter(pk__in=pk_set))
@@ -1,3 +1,367 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.models import Appointment, Service, StatusChoices
+from PIL import Image
+
+from reviews.models import Review
+
+from .models import Specialty, TypeChoices, Worker
+from .thumbnails import render_thumbnails
+
+
+class RatingAggregatesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="cliente", password="password123")
+        self.worker = Worker.objects.create(name="Ana")
+        self.other = Worker.objects.create(name="Luis")
+        self.service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        self.start = (timezone.now() - timedelta(days=10)).replace(second=0, microsecond=0)
+
+    def appointment(self, worker=None, hours=0):
+        return Appointment.objects.create(
+            user=self.user,
+            worker=worker or self.worker,
+            service=self.service,
+            datetime=self.start + timedelta(hours=hours * 2),
+            status=StatusChoices.COMPLETED,
+        )
+
+    def review(self, rating, worker=None, hours=0):
+        return Review.objects.create(appointment=self.appointment(worker, hours), rating=rating)
+
+    def assertCounts(self, worker, rating_sum, rating_count, histogram):
+        worker.refresh_from_db()
+        self.assertEqual(worker.rating_sum, rating_sum)
+        self.assertEqual(worker.rating_count, rating_count)
+        self.assertEqual([worker.rating_1, worker.rating_2, worker.rating_3, worker.rating_4, worker.rating_5], histogram)
+
+    def test_create_edit_and_delete(self):
+        first = self.review(5)
+        self.review(3, hours=1)
+        self.assertCounts(self.worker, 8, 2, [0, 0, 1, 0, 1])
+        self.assertEqual(self.worker.get_average_rating(), 4.0)
+
+        review = Review.objects.get(pk=first.pk)
+        review.rating = 4
+        review.save()
+        review.rating = 2
+        review.save()
+        self.assertCounts(self.worker, 5, 2, [0, 1, 1, 0, 0])
+
+        review.delete()
+        self.assertCounts(self.worker, 3, 1, [0, 0, 1, 0, 0])
+        self.assertCounts(self.other, 0, 0, [0, 0, 0, 0, 0])
+
+    def test_deleting_the_appointment_removes_its_review(self):
+        review = self.review(4)
+        self.review(2, hours=1)
+        review.appointment.delete()
+        self.assertCounts(self.worker, 2, 1, [0, 1, 0, 0, 0])
+
+    def test_reassigned_appointment_moves_the_rating(self):
+        review = self.review(5)
+        appointment = Appointment.objects.get(pk=review.appointment_id)
+        appointment.worker = self.other
+        appointment.save()
+        appointment.save()
+        self.assertCounts(self.worker, 0, 0, [0, 0, 0, 0, 0])
+        self.assertCounts(self.other, 5, 1, [0, 0, 0, 0, 1])
+
+    def test_saving_a_stale_worker_keeps_the_counts(self):
+        stale = Worker.objects.get(pk=self.worker.pk)
+        self.review(4)
+        stale.name = "Ana María"
+        stale.save()
+        self.assertCounts(self.worker, 4, 1, [0, 0, 0, 1, 0])
+        self.assertEqual(self.worker.name, "Ana María")
+
+    def test_histogram_and_empty_worker(self):
+        self.review(5)
+        self.review(5, hours=1)
+        self.review(2, hours=2)
+        self.worker.refresh_from_db()
+        self.assertEqual(
+            self.worker.get_rating_histogram(),
+            [(5, 2, 67), (4, 0, 0), (3, 0, 0), (2, 1, 33), (1, 0, 0)],
+        )
+        self.assertIsNone(self.other.get_average_rating())
+        self.assertEqual(self.other.get_review_count(), 0)
+
+    def test_recompute_command_fixes_drift(self):
+        self.review(4)
+        self.review(1, worker=self.other)
+        Worker.objects.update(rating_sum=0, rating_count=7, rating_4=3)
+
+        out = StringIO()
+        call_command("recompute_worker_ratings", stdout=out)
+        self.assertIn("2 trabajadores", out.getvalue())
+        self.assertCounts(self.worker, 4, 1, [0, 0, 0, 1, 0])
+        self.assertCounts(self.other, 1, 1, [1, 0, 0, 0, 0])
+
+        out = StringIO()
+        call_command("recompute_worker_ratings", str(self.worker.pk), stdout=out)
+        self.assertIn("0 trabajadores", out.getvalue())
+
+    def test_list_reads_ratings_without_aggregates(self):
+        for hours in range(3):
+            self.review(4, hours=hours)
+        for index in range(5):
+            Worker.objects.create(name=f"Trabajador {index}")
+
+        cache.clear()
+        with self.assertNumQueries(2) as queries:
+            response = self.client.get(reverse("worker_list"))
+        self.assertContains(response, "3 reseñas")
+        self.assertFalse(any("reviews_review" in query["sql"] for query in queries.captured_queries))
+
+    def test_reviews_page_shows_histogram(self):
+        self.review(5)
+        response = self.client.get(reverse("worker_reviews", args=[self.worker.pk]))
+        self.assertContains(response, "Basado en 1 experiencia<")
+        self.assertContains(response, "histogram-row", count=5)
+
+
+class WorkerDirectoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.massage = Specialty.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE)
+        self.nutrition = Specialty.objects.create(name=TypeChoices.NUTRITIONAL_ADVICE)
+        self.worker = Worker.objects.create(name="Ana", bio="Masajista")
+        self.worker.specialties.add(self.massage)
+
+    def version(self):
+        return Worker.objects.values_list("card_version", flat=True).get(pk=self.worker.pk)
+
+    def test_constant_number_of_queries(self):
+        for index in range(3):
+            Worker.objects.create(name=f"Trabajador {index}").specialties.add(self.massage, self.nutrition)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("worker_list"))
+
+        for index in range(3, 10):
+            Worker.objects.create(name=f"Trabajador {index}").specialties.add(self.nutrition)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("worker_list"))
+        self.assertContains(response, "Asesoramiento Nutricional", count=10)
+
+    def test_cards_are_cached_until_the_version_changes(self):
+        self.assertContains(self.client.get(reverse("worker_list")), "Masajista")
+
+        # A write that skips the signals leaves the cached card in place...
+        Worker.objects.filter(pk=self.worker.pk).update(bio="Quiromasajista")
+        self.assertNotContains(self.client.get(reverse("worker_list")), "Quiromasajista")
+
+        # ...and a new version replaces it.
+        self.worker.bio = "Osteópata"
+        self.worker.save()
+        response = self.client.get(reverse("worker_list"))
+        self.assertContains(response, "Osteópata")
+        self.assertNotContains(response, "Masajista")
+
+    def test_saving_a_stale_worker_never_reuses_a_version(self):
+        stale = Worker.objects.get(pk=self.worker.pk)
+        self.worker.bio = "Osteópata"
+        self.worker.save()
+        version = self.version()
+        self.assertContains(self.client.get(reverse("worker_list")), "Osteópata")
+
+        stale.bio = "Quiromasajista"
+        stale.save()
+        self.assertEqual(self.version(), version + 1)
+        self.assertContains(self.client.get(reverse("worker_list")), "Quiromasajista")
+
+    def test_specialty_changes_bump_the_version(self):
+        version = self.version()
+        self.worker.specialties.add(self.nutrition)
+        self.assertGreater(self.version(), version)
+
+        version = self.version()
+        self.nutrition.workers.remove(self.worker)
+        self.assertGreater(self.version(), version)
+
+        version = self.version()
+        self.massage.workers.clear()
+        self.assertGreater(self.version(), version)
+        self.assertNotContains(self.client.get(reverse("worker_list")), "Osteopatía")
+
+    def test_reviews_bump_the_version(self):
+        user = User.objects.create_user(username="cliente", password="password123")
+        service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        appointment = Appointment.objects.create(
+            user=user,
+            worker=self.worker,
+            service=service,
+            datetime=timezone.now() - timedelta(days=2),
+            status=StatusChoices.COMPLETED,
+        )
+        self.assertContains(self.client.get(reverse("worker_list")), "No ha recibido ninguna valoración")
+
+        version = self.version()
+        review = Review.objects.create(appointment=appointment, rating=4)
+        self.assertGreater(self.version(), version)
+        self.assertContains(self.client.get(reverse("worker_list")), "1 reseñas")
+
+        version = self.version()
+        review.delete()
+        self.assertGreater(self.version(), version)
+        self.assertContains(self.client.get(reverse("worker_list")), "No ha recibido ninguna valoración")
+
+
+class WorkerReviewsPageTest(TestCase):
+    def setUp(self):
+        self.worker = Worker.objects.create(name="Ana")
+        service = Service.objects.create(name=TypeChoices.OSTEOPATHY_MASSAGE, duration=60)
+        start = (timezone.now() - timedelta(days=60)).replace(second=0, microsecond=0)
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"cliente{index}", email=f"cliente{index}@example.com",
+                    phone_number=f"+34 6220000{index:02d}", first_name=f"Cliente {index}",
+                )
+                for index in range(25)
+            ]
+        )
+        for index, user in enumerate(users):
+            appointment = Appointment.objects.create(
+                user=user,
+                worker=self.worker,
+                service=service,
+                datetime=start + timedelta(hours=index * 2),
+                status=StatusChoices.COMPLETED,
+            )
+            review = Review.objects.create(appointment=appointment, rating=index % 5 + 1)
+            # Several reviews per day, so the id breaks the ties.
+            Review.objects.filter(pk=review.pk).update(date=start.date() + timedelta(days=index // 3))
+
+        self.expected = list(Review.objects.order_by("-date", "-id").values_list("id", flat=True))
+
+    def test_first_page_in_constant_queries(self):
+        # The worker and one page of reviews joined with their users.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("worker_reviews", args=[self.worker.pk]))
+        self.assertEqual([review.id for review in response.context["reviews"]], self.expected[:10])
+        self.assertContains(response, "Basado en 25 experiencias")
+        self.assertContains(response, "Ver más opiniones")
+
+    def test_load_more_pages_through_every_review(self):
+        response = self.client.get(reverse("worker_reviews", args=[self.worker.pk]))
+        cursor = response.context["next_cursor"]
+        seen = [review.id for review in response.context["reviews"]]
+        url = reverse("worker_reviews_more", args=[self.worker.pk])
+        while cursor:
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {"cursor": cursor})
+            page = response.json()
+            seen += [review.id for review in response.context["reviews"]]
+            self.assertEqual(page["html"].count('class="review-card"'), len(response.context["reviews"]))
+            cursor = page["next"]
+        self.assertEqual(seen, self.expected)
+
+    def test_cursor_fallback_without_javascript(self):
+        response = self.client.get(reverse("worker_reviews", args=[self.worker.pk]))
+        response = self.client.get(
+            reverse("worker_reviews", args=[self.worker.pk]), {"cursor": response.context["next_cursor"]}
+        )
+        self.assertEqual([review.id for review in response.context["reviews"]], self.expected[10:20])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("worker_reviews_more", args=[self.worker.pk]), {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("worker_reviews", args=[self.worker.pk]), {"cursor": "nope"})
+        self.assertEqual([review.id for review in response.context["reviews"]], self.expected[:10])
+
+
+def image_bytes(size, mode="RGB", image_format="PNG"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 120, 40, 128) if mode == "RGBA" else (200, 120, 40)).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class WorkerThumbnailsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, THUMBNAIL_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_render_bounds_sizes_without_upscaling(self):
+        rendered = render_thumbnails(image_bytes((1000, 500)))
+        sizes = sorted({(width, height) for key, _, width, height, _ in rendered["files"]})
+        self.assertEqual(sizes, [(160, 80), (320, 160), (640, 320)])
+        self.assertEqual({key for key, *_ in rendered["files"]}, {"webp", "jpeg"})
+
+        rendered = render_thumbnails(image_bytes((200, 300), mode="RGBA"))
+        sizes = sorted({(width, height) for key, _, width, height, _ in rendered["files"]})
+        self.assertEqual(sizes, [(107, 160), (200, 300)])
+        for key, _, width, height, content in rendered["files"]:
+            with Image.open(io.BytesIO(content)) as image:
+                self.assertEqual(image.format, "WEBP" if key == "webp" else "JPEG")
+                self.assertEqual(image.size, (width, height))
+
+    def test_upload_creates_content_hashed_thumbnails(self):
+        admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="password123",
+            phone_number="+34 600000000", role=User.Role.ADMIN,
+        )
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile("foto.jpg", image_bytes((800, 800), image_format="JPEG"), "image/jpeg")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin_create_worker"), {"name": "Ana", "bio": "", "image": upload})
+        self.assertEqual(response.status_code, 302)
+
+        worker = Worker.objects.get(name="Ana")
+        self.assertTrue(worker.has_current_thumbnails())
+        self.assertEqual([width for width, _ in worker.thumbnails["webp"]], [160, 320, 640])
+        for _, name in worker.thumbnails["webp"] + worker.thumbnails["jpeg"]:
+            self.assertTrue(default_storage.exists(name))
+        self.assertEqual(len({name.split("-")[0] for _, name in worker.thumbnails["jpeg"]}), 1)
+
+        response = self.client.get(reverse("worker_list"))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, "640w")
+        self.assertContains(response, f'src="{default_storage.url(worker.thumbnails["jpeg"][0][1])}"')
+
+    def test_stale_thumbnails_fall_back_to_the_original(self):
+        worker = Worker.objects.create(name="Ana")
+        worker.image.save("foto.png", ContentFile(image_bytes((400, 400))))
+        worker.thumbnails = {"source": "workers_images/otra.png", "webp": [[160, "workers_thumbs/x.webp"]]}
+        self.assertEqual(worker.webp_srcset, "")
+        self.assertEqual(worker.card_image_url, worker.image.url)
+
+    def test_rebuild_command(self):
+        first = Worker.objects.create(name="Ana")
+        first.image.save("ana.png", ContentFile(image_bytes((700, 900))))
+        second = Worker.objects.create(name="Luis")
+        second.image.save("luis.png", ContentFile(image_bytes((300, 200))))
+        broken = Worker.objects.create(name="Eva")
+        broken.image.save("eva.png", ContentFile(b"no es una imagen"))
+        Worker.objects.create(name="Sin foto")
+
+        out, err = StringIO(), StringIO()
+        call_command("rebuild_worker_thumbnails", "--workers", "2", stdout=out, stderr=err)
+        self.assertIn("Miniaturas generadas: 2 trabajadores.", out.getvalue())
+        self.assertIn("Fotos con errores: 1.", out.getvalue())
+        self.assertIn("eva", err.getvalue())
+        for worker in (first, second):
+            worker.refresh_from_db()
+            self.assertTrue(worker.has_current_thumbnails())
+
+        out = StringIO()
+        call_command("rebuild_worker_thumbnails", stdout=out, stderr=StringIO())
+        self.assertIn("Miniaturas generadas: 0 trabajadores.", out.getvalue())
@@ -0,0 +1,152 @@
+"""
+Resized copies of Worker.image for the directory cards.
+
+Each upload gets WebP and JPEG versions bounded to THUMBNAIL_SIZES pixels,
+named after a hash of the original's content, so their URLs never change
+meaning and can be cached forever. The list of files is stored on
+Worker.thumbnails together with the image it was made from; a card whose
+thumbnails belong to an older image falls back to the original.
+
+Resizing is CPU bound, so it runs in a process pool (THUMBNAIL_WORKERS
+processes, 0 to do it inline): schedule_thumbnails hands the upload to the
+pool once the request's transaction commits, and the request returns without
+waiting. render_thumbnails is the part run in the pool; it takes and returns
+bytes and does not touch Django, so it works with any start method. Existing
+images are processed with manage.py rebuild_worker_thumbnails.
+"""
+
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (160, 320, 640)
+THUMBNAIL_DIR = "workers_thumbs"
+
+# (key in Worker.thumbnails, file extension, Pillow format, save options)
+FORMATS = (
+    ("webp", "webp", "WEBP", {"quality": 80, "method": 6}),
+    ("jpeg", "jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+
+def render_thumbnails(data, sizes=THUMBNAIL_SIZES):
+    """
+    Resizes the image in data (bytes) to fit in each size x size box, never
+    upscaling. Returns {"hash", "width", "height", "files"} where files is a
+    list of (format key, extension, width, height, bytes).
+    """
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+    if image.mode not in ("RGB", "RGBA"):
+        transparent = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if transparent else "RGB")
+    width, height = image.size
+
+    files = []
+    bounds = sorted({min(size, max(width, height)) for size in sizes})
+    for bound in bounds:
+        resized = image.copy()
+        resized.thumbnail((bound, bound), Image.LANCZOS)
+        for key, extension, pillow_format, options in FORMATS:
+            if pillow_format == "JPEG" and resized.mode == "RGBA":
+                converted = Image.new("RGB", resized.size, "white")
+                converted.paste(resized, mask=resized.getchannel("A"))
+            else:
+                converted = resized
+            buffer = io.BytesIO()
+            converted.save(buffer, pillow_format, **options)
+            files.append((key, extension, resized.width, resized.height, buffer.getvalue()))
+    return {"hash": digest, "width": width, "height": height, "files": files}
+
+
+def store_thumbnails(source, rendered):
+    """
+    Saves rendered files (see render_thumbnails) to the default storage and
+    returns the value for Worker.thumbnails. Files already stored under the
+    same content hash are reused.
+    """
+    thumbnails = {"source": source, "width": rendered["width"], "height": rendered["height"]}
+    for key, extension, width, height, content in rendered["files"]:
+        name = f"{THUMBNAIL_DIR}/{rendered['hash']}-{width}x{height}.{extension}"
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(content))
+        thumbnails.setdefault(key, []).append([width, name])
+    return thumbnails
+
+
+def save_thumbnails(worker_id, source, rendered):
+    """
+    Stores the thumbnails of source on the worker, unless its image changed
+    meanwhile. Returns True if the worker was updated.
+    """
+    from .models import Worker
+
+    thumbnails = store_thumbnails(source, rendered)
+    return bool(
+        Worker.objects.filter(pk=worker_id, image=source).update(
+            thumbnails=thumbnails, card_version=F("card_version") + 1
+        )
+    )
+
+
+def read_image(worker):
+    with worker.image.open("rb") as image:
+        return image.read()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS)
+        return _executor
+
+
+def _finish(worker_id, source, future):
+    # Runs on a thread of the pool's parent process.
+    try:
+        save_thumbnails(worker_id, source, future.result())
+    except Exception:
+        logger.exception("No se pudieron generar las miniaturas de %s", source)
+    finally:
+        connections.close_all()
+
+
+def generate_thumbnails(worker):
+    """
+    Creates the thumbnails of the worker's current image: in the process
+    pool, or inline when THUMBNAIL_WORKERS is 0.
+    """
+    if not worker.image:
+        return
+    source = worker.image.name
+    data = read_image(worker)
+    if not getattr(settings, "THUMBNAIL_WORKERS", 0):
+        save_thumbnails(worker.pk, source, render_thumbnails(data))
+        return
+    future = get_executor().submit(render_thumbnails, data)
+    future.add_done_callback(lambda future: _finish(worker.pk, source, future))
+
+
+def schedule_thumbnails(worker):
+    """
+    Generates the thumbnails after the current transaction commits.
+    """
+    if worker.image and not worker.has_current_thumbnails():
+        transaction.on_commit(lambda: generate_thumbnails(worker))
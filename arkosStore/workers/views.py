@@ -1,25 +1,64 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import user_passes_test
 from accounts.models import User
 from .models import Worker
 from .forms import WorkerForm
+from .thumbnails import schedule_thumbnails
 from django.shortcuts import get_object_or_404
 from reviews.models import Review
+from appointments.pagination import InvalidCursor, keyset_page, page_or_first
+
+REVIEW_ORDERING = ("-date", "-id")
+REVIEWS_PAGE_SIZE = 10
 
 def worker_list_view(request):
-    workers = Worker.objects.all()
-    return render(request, "workers/list.html", {"workers": workers})
+    # Two queries whatever the staff size: the ratings are stored on Worker and
+    # the cards are cached by card_version.
+    workers = Worker.objects.prefetch_related("specialties")
+    return render(request, "workers/list.html", {
+        "workers": workers,
+        "card_cache_timeout": getattr(settings, "WORKER_CARD_CACHE_TIMEOUT", 60 * 60 * 24),
+    })
+
+def worker_reviews(worker):
+    return (
+        Review.objects.filter(appointment__worker=worker)
+        .select_related("appointment__user")
+        .only("rating", "comment", "date", "appointment__user__first_name")
+    )
 
 def worker_reviews_view(request, worker_id):
     worker = get_object_or_404(Worker, id=worker_id)
-    
-    reviews = Review.objects.filter(
-        appointment__worker=worker
-    ).order_by('-date')
+
+    reviews, next_cursor = page_or_first(
+        worker_reviews(worker), REVIEW_ORDERING, request.GET.get('cursor'), REVIEWS_PAGE_SIZE
+    )
 
     return render(request, 'workers/reviews.html', {
         'worker': worker,
-        'reviews': reviews
+        'reviews': reviews,
+        'next_cursor': next_cursor,
+    })
+
+def worker_reviews_more(request, worker_id):
+    """
+    Siguiente página de opiniones en JSON: las tarjetas ya renderizadas y el
+    cursor de la página siguiente (null si no hay más).
+    """
+    worker = get_object_or_404(Worker.objects.only("id"), id=worker_id)
+    try:
+        reviews, next_cursor = keyset_page(
+            worker_reviews(worker), REVIEW_ORDERING, request.GET.get('cursor'), REVIEWS_PAGE_SIZE
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Cursor no válido'}, status=400)
+
+    return JsonResponse({
+        'html': render_to_string('workers/review_cards.html', {'reviews': reviews}),
+        'next': next_cursor,
     })
 
 def is_admin(user):
@@ -30,7 +69,8 @@ def admin_create_worker(request):
     if request.method == "POST":
         form = WorkerForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            worker = form.save()
+            schedule_thumbnails(worker)
             return redirect("custom_admin")
     else:
         form = WorkerForm()